@@ -10,30 +10,165 @@ if __name__ == "__main__" or __name__ == "api_server":
     if "api_server.py" in sys.argv[0] or "./api_server.py" in sys.argv[0]:
         activate_venv(__file__)
 
+import dataclasses
 import threading
 import time
+from collections import namedtuple
 import whisper
 import torch
-from flask import Flask, request, jsonify
+import numpy as np
+from flask import Flask, request, jsonify, g, Response
 import tempfile
 from waitress import serve
 import markdown
+from lib.batch_scheduler import BatchScheduler
+from lib.audio_decode import PCM_FORMATS, UnsupportedAudio, decode_flac, decode_wav, flac_supported, pcm_to_float32, read_body
+from lib.transcription_cache import TranscriptionCache
+from lib.streaming import SessionRegistry, start_stream_server
+from lib.replica_pool import ReplicaPool, memory_usage
+from lib.model_registry import ModelRegistry, model_size_mb
+from lib.model_loader import default_precision, inference_context, load_model as load_whisper_model
+from lib.job_store import JobStore, JobRunner
+from lib.metrics import REGISTRY, Counter, Gauge, Histogram
+from lib.language_cache import SessionLanguageCache
+from lib.mel import HOP_LENGTH, MEL_FORMAT_VERSION, N_FRAMES, decode_mel, model_n_mels, pad_mel
+from lib.vad import compact, speech_regions, speech_seconds
+from lib.admission import LANE_PRIORITY, AdmissionController, AdmissionRejected, RequestTooLarge, audio_windows
 
 app = Flask(__name__)
 
+# Configuració del planificador de micro-lots (variables d'entorn)
+BATCH_MAX_SIZE = int(os.environ.get("ECHOTEXT_BATCH_MAX_SIZE", "8"))
+BATCH_MAX_WAIT_MS = float(os.environ.get("ECHOTEXT_BATCH_MAX_WAIT_MS", "50"))
+
+# Model per defecte, models que es poden demanar per petició i límits d'expulsió (0 = sense límit)
+DEFAULT_MODEL = os.environ.get("ECHOTEXT_MODEL", "turbo")
+ALLOWED_MODELS = [m.strip() for m in os.environ.get("ECHOTEXT_MODELS", "tiny,base,small,turbo").split(",") if m.strip()]
+MODEL_MEMORY_MB = float(os.environ.get("ECHOTEXT_MODEL_MEMORY_MB", "0"))
+MODEL_IDLE_S = float(os.environ.get("ECHOTEXT_MODEL_IDLE_S", "0"))
+
+# Precisió de la inferència: fp32, bf16 (si el maquinari ho permet) o int8 (quantització dinàmica, només CPU)
+PRECISION = default_precision()
+
+# Rèpliques del model en processos fills (0 = inferència dins del mateix procés) i fils de torch per rèplica
+REPLICAS = int(os.environ.get("ECHOTEXT_REPLICAS", "0"))
+REPLICA_THREADS = int(os.environ.get("ECHOTEXT_REPLICA_THREADS", "0")) or None
+
+# Memòria cau de transcripcions: entrades en memòria (0 la desactiva), directori opcional en disc i
+# fitxers màxims al disc (0 = sense límit)
+CACHE_MAX_ENTRIES = int(os.environ.get("ECHOTEXT_CACHE_SIZE", "1024"))
+CACHE_DIR = os.environ.get("ECHOTEXT_CACHE_DIR") or None
+CACHE_DISK_MAX_ENTRIES = int(os.environ.get("ECHOTEXT_CACHE_DISK_SIZE", "10000"))
+
+# Streaming per WebSocket: port (0 el desactiva), interval de parcials, finestra de confirmació i TTL de sessió
+STREAM_PORT = int(os.environ.get("ECHOTEXT_STREAM_PORT", "5001"))
+STREAM_PARTIAL_S = float(os.environ.get("ECHOTEXT_STREAM_PARTIAL_S", "1.0"))
+STREAM_FINAL_S = float(os.environ.get("ECHOTEXT_STREAM_FINAL_S", "10.0"))
+STREAM_TTL_S = float(os.environ.get("ECHOTEXT_STREAM_TTL_S", "60"))
+
+# Directori de la cua persistent de feines (base de dades SQLite i àudio pendent)
+JOBS_DIR = os.environ.get("ECHOTEXT_JOBS_DIR", os.path.expanduser("~/.cache/echotext/jobs"))
+
+# Control d'admissió: durada màxima d'un fragment interactiu i d'un fitxer a /transcribe, pressupost
+# de latència de cada carril, peticions admeses per carril i peticions en curs per client (0 = sense límit)
+INTERACTIVE_MAX_S = float(os.environ.get("ECHOTEXT_INTERACTIVE_MAX_S", "30"))
+BULK_MAX_S = float(os.environ.get("ECHOTEXT_BULK_MAX_S", "3600"))
+INTERACTIVE_BUDGET_S = float(os.environ.get("ECHOTEXT_INTERACTIVE_BUDGET_S", "10"))
+BULK_BUDGET_S = float(os.environ.get("ECHOTEXT_BULK_BUDGET_S", "300"))
+INTERACTIVE_QUEUE = int(os.environ.get("ECHOTEXT_INTERACTIVE_QUEUE", "64"))
+BULK_QUEUE = int(os.environ.get("ECHOTEXT_BULK_QUEUE", "8"))
+MAX_PER_CLIENT = int(os.environ.get("ECHOTEXT_MAX_PER_CLIENT", "4"))
+
+# Proxies de confiança (p. ex. 127.0.0.1 per a cloudflared): de les seves peticions, el client és a X-Forwarded-For
+TRUSTED_PROXIES = {p.strip() for p in os.environ.get("ECHOTEXT_TRUSTED_PROXIES", "").split(",") if p.strip()}
+
+# Detecció d'activitat de veu abans de la inferència (0 la desactiva)
+VAD_ENABLED = os.environ.get("ECHOTEXT_VAD", "1") != "0"
+
+# Idioma detectat per sessió: temps de vida i confiança mínima per reutilitzar-lo
+LANGUAGE_TTL_S = float(os.environ.get("ECHOTEXT_LANGUAGE_TTL_S", "600"))
+LANGUAGE_MIN_PROB = float(os.environ.get("ECHOTEXT_LANGUAGE_MIN_PROB", "0.8"))
+
+# Opcions de descodificació fixes (formen part de la clau de la memòria cau)
+DECODE_OPTIONS = {'fp16': False, 'without_timestamps': True}
+
+# Reintents dels fragments curts amb els mateixos valors per defecte que `whisper.transcribe`:
+# temperatures de reintent i llindars de text repetitiu, poc probable i silenci
+FALLBACK_TEMPERATURES = (0.2, 0.4, 0.6, 0.8, 1.0)
+COMPRESSION_RATIO_THRESHOLD = 2.4
+LOGPROB_THRESHOLD = -1.0
+NO_SPEECH_THRESHOLD = 0.6
+CACHE_OPTIONS = {**DECODE_OPTIONS, 'fallback': FALLBACK_TEMPERATURES}
+
+# Mètriques exportades a /metrics
+TRANSCRIPTION_ENDPOINTS = {'transcribe_audio', 'transcribe_raw', 'transcribe_mel', 'create_job'}
+REQUESTS = Counter('echotext_requests_total', 'Peticions de transcripció', ['endpoint', 'status', 'language'])
+REQUEST_LATENCY = Histogram('echotext_request_duration_seconds', 'Latència de les peticions de transcripció', ['endpoint', 'status', 'language'])
+UPLOAD_BYTES = Histogram('echotext_upload_bytes', "Mida del cos de les peticions de transcripció", ['endpoint'],
+                         buckets=(16e3, 64e3, 256e3, 1e6, 4e6, 16e6, 64e6, 256e6))
+AUDIO_DURATION = Histogram('echotext_audio_duration_seconds', "Durada de l'àudio rebut", ['endpoint'],
+                           buckets=(1, 2, 5, 10, 30, 60, 300, 900, 3600))
+REAL_TIME_FACTOR = Histogram('echotext_real_time_factor', 'Temps de resposta dividit per la durada de l\'àudio', ['model'],
+                             buckets=(0.01, 0.02, 0.05, 0.1, 0.2, 0.5, 1, 2, 5))
+DECODE_SECONDS = Histogram('echotext_decode_seconds', "Temps de descodificació de l'àudio", ['method'])
+QUEUE_WAIT_SECONDS = Histogram('echotext_queue_wait_seconds', "Temps d'espera al planificador abans d'entrar en un lot")
+INFERENCE_SECONDS = Histogram('echotext_inference_seconds', "Temps d'inferència per lot", ['model'])
+BATCH_SIZE = Histogram('echotext_batch_size', 'Peticions per lot d\'inferència', ['model'], buckets=(1, 2, 4, 8, 16, 32))
+IN_FLIGHT = Gauge('echotext_in_flight_requests', 'Peticions de transcripció en curs')
+VAD_SKIPPED_SECONDS = Counter('echotext_vad_skipped_seconds_total', "Segons d'àudio sense veu que no han passat pel model", ['endpoint'])
+VAD_SILENT_REQUESTS = Counter('echotext_vad_silent_requests_total', 'Peticions sense veu respostes sense inferència', ['endpoint'])
+ADMISSION_REJECTED = Counter('echotext_admission_rejected_total', "Peticions rebutjades pel control d'admissió", ['lane'])
+
+@app.before_request
+def before_request():
+    g.start_time = time.perf_counter()
+    if request.endpoint in TRANSCRIPTION_ENDPOINTS:
+        IN_FLIGHT.inc()
+
+@app.teardown_request
+def teardown_request(exc):
+    if request.endpoint in TRANSCRIPTION_ENDPOINTS:
+        IN_FLIGHT.dec()
+
+def language_label():
+    """Etiqueta d'idioma acotada per no crear sèries il·limitades."""
+    language = request.args.get('language')
+    if request.mimetype == 'multipart/form-data':
+        language = request.form.get('language') or language
+    if not language:
+        return 'auto'
+    return language if language in whisper.tokenizer.LANGUAGES else 'other'
+
 @app.after_request
 def after_request(response):
+    if request.endpoint in TRANSCRIPTION_ENDPOINTS:
+        labels = {'endpoint': request.endpoint, 'status': str(response.status_code), 'language': language_label()}
+        REQUESTS.inc(**labels)
+        REQUEST_LATENCY.observe(time.perf_counter() - g.start_time, **labels)
+        UPLOAD_BYTES.observe(request.content_length or 0, endpoint=request.endpoint)
+
     response.headers.add('Access-Control-Allow-Origin', '*')
-    response.headers.add('Access-Control-Allow-Headers', 'Content-Type')
+    response.headers.add('Access-Control-Allow-Headers', 'Content-Type, X-Sample-Rate, X-Sample-Format, X-Channels, X-Client-Id, X-Priority, X-Session-Id, X-Mel-Version')
     response.headers.add('Access-Control-Allow-Methods', 'POST, OPTIONS')
     return response
 
-# Variable global per emmagatzemar el model
+# Variable global per emmagatzemar el model per defecte
 model_container = {}
 
+# Registre de models carregats sota demanda (el per defecte hi queda fixat)
+models = ModelRegistry(
+    lambda name: load_whisper_model(name, precision=PRECISION),
+    device="cuda" if torch.cuda.is_available() and PRECISION != 'int8' else "cpu",
+    memory_budget_mb=MODEL_MEMORY_MB,
+    idle_timeout_s=MODEL_IDLE_S,
+)
+
+# Conjunt de rèpliques (només en mode multiprocés)
+replica_pool = None
+
 def load_model():
-    """Carrega el model Whisper en memòria."""
-    print("Carregant el model Whisper (turbo)...")
+    """Carrega el model Whisper per defecte en memòria."""
+    print(f"Carregant el model Whisper ({DEFAULT_MODEL})...")
     start_load = time.time()
     try:
         if torch.cuda.is_available():
@@ -42,19 +177,25 @@ def load_model():
         else:
             print("Utilitzant CPU.")
             
-        model = whisper.load_model("turbo")
-        model_container['model'] = model
+        model = load_whisper_model(DEFAULT_MODEL, precision=PRECISION)
         end_load = time.time()
-        print(f"Model Whisper (turbo) carregat correctament en {end_load - start_load:.2f}s.")
+        model_container['model'] = model
+        model_container['name'] = DEFAULT_MODEL
+        models.add(DEFAULT_MODEL, model, pinned=True, load_seconds=end_load - start_load)
+        print(f"Model Whisper ({DEFAULT_MODEL}, {model.precision}) carregat correctament en {end_load - start_load:.2f}s "
+              f"({model_size_mb(model):.0f} MB).")
         
     except RuntimeError as e:
         if "out of memory" in str(e):
-            print("ALERTA: Memòria insuficient per al model 'turbo'. Intentant amb 'small'...")
+            print(f"ALERTA: Memòria insuficient per al model '{DEFAULT_MODEL}'. Intentant amb 'small'...")
             try:
                 if torch.cuda.is_available():
                     torch.cuda.empty_cache()
-                model = whisper.load_model("small")
+                start_small = time.time()
+                model = load_whisper_model("small", precision=PRECISION)
                 model_container['model'] = model
+                model_container['name'] = "small"
+                models.add("small", model, pinned=True, load_seconds=time.time() - start_small)
                 print("Model Whisper (small) carregat correctament.")
             except Exception as e2:
                 print(f"Error fatal carregant model alternatiu: {e2}")
@@ -66,6 +207,154 @@ def load_model():
         print(f"Error inesperat carregant el model: {e}")
         model_container['error'] = str(e)
 
+def effective_precision():
+    """
+    Precisió amb què s'executa realment la inferència: pot ser `fp32` encara
+    que s'hagi demanat `bf16` o `int8` si el dispositiu no ho permet.
+    """
+    return getattr(model_container.get('model'), 'precision', PRECISION)
+
+def resolve_model_name(name):
+    """Valida el model demanat per la petició; sense valor retorna el model per defecte."""
+    if not name:
+        return model_container.get('name', DEFAULT_MODEL)
+    if name not in ALLOWED_MODELS and name != model_container.get('name'):
+        raise ValueError(f"Model no disponible: {name}. Models acceptats: {', '.join(ALLOWED_MODELS)}")
+    return name
+
+# Les peticions només s'agrupen si comparteixen model, idioma i context (prompt) del decodificador
+BatchKey = namedtuple('BatchKey', ['model', 'language', 'prompt'])
+
+def is_mel(payload):
+    """Les peticions de `/transcribe/mel` porten el log-mel (bandes, trames) en lloc de l'àudio."""
+    return payload.ndim == 2
+
+def payload_seconds(payload):
+    """Durada de l'àudio d'una petició, sigui àudio o log-mel."""
+    if is_mel(payload):
+        return payload.shape[1] * HOP_LENGTH / whisper.audio.SAMPLE_RATE
+    return len(payload) / whisper.audio.SAMPLE_RATE
+
+def transcribe_batch(key, audios):
+    """
+    Transcriu un lot d'àudios (float32, 16 kHz) que comparteixen model, idioma i prompt.
+    Els fragments de fins a 30 s es processen en una sola passada
+    mel -> encoder -> decoder; els més llargs passen per `model.transcribe`.
+    Els log-mel calculats pel client entren directament a l'encoder.
+    """
+    with models.use(key.model) as model, inference_context(model):
+        return _transcribe_with_model(model, key, audios)
+
+def needs_fallback(decoded):
+    """Mateix criteri que `decode_with_fallback` de Whisper: text repetitiu o poc probable que no és silenci."""
+    if decoded.no_speech_prob > NO_SPEECH_THRESHOLD and decoded.avg_logprob < LOGPROB_THRESHOLD:
+        return False
+    return decoded.compression_ratio > COMPRESSION_RATIO_THRESHOLD or decoded.avg_logprob < LOGPROB_THRESHOLD
+
+def decode_with_fallback(model, mel, options):
+    """
+    `model.decode` d'un lot amb els reintents de `whisper.transcribe`: els
+    elements que no passen els llindars es tornen a descodificar junts a la
+    temperatura següent, fins que els passen o s'acaben les temperatures.
+    """
+    decoded = list(model.decode(mel, options))
+    pending = [i for i, d in enumerate(decoded) if needs_fallback(d)]
+    for temperature in FALLBACK_TEMPERATURES:
+        if not pending:
+            break
+        retried = model.decode(mel[pending], dataclasses.replace(options, temperature=temperature))
+        for i, d in zip(pending, retried):
+            decoded[i] = d
+        pending = [i for i, d in zip(pending, retried) if needs_fallback(d)]
+    return decoded
+
+def _transcribe_with_model(model, key, audios):
+    results = [None] * len(audios)
+
+    short = [i for i, audio in enumerate(audios) if is_mel(audio) or len(audio) <= whisper.audio.N_SAMPLES]
+    if short:
+        mel = torch.stack([
+            torch.from_numpy(pad_mel(audios[i])) if is_mel(audios[i])
+            else whisper.log_mel_spectrogram(whisper.pad_or_trim(audios[i]), model.dims.n_mels)
+            for i in short
+        ]).to(model.device)
+        probs = None
+        if key.language is None:
+            # `decode` no retorna la confiança de l'idioma: es detecta a part sobre les
+            # característiques de l'encoder, que `decode` reaprofita sense tornar-les a calcular
+            with torch.no_grad():
+                mel = model.embed_audio(mel)
+            _, probs = model.detect_language(mel)
+        options = whisper.DecodingOptions(language=key.language, prompt=key.prompt, **DECODE_OPTIONS)
+        decoded = decode_with_fallback(model, mel, options)
+        for j, (i, d) in enumerate(zip(short, decoded)):
+            # Mateix criteri de silenci que `transcribe` per evitar al·lucinacions
+            text = d.text
+            if d.no_speech_prob > NO_SPEECH_THRESHOLD and d.avg_logprob < LOGPROB_THRESHOLD:
+                text = ""
+            results[i] = {'text': text.strip(), 'language': d.language}
+            if probs is not None:
+                results[i]['language_probability'] = probs[j].get(d.language)
+
+    for i, audio in enumerate(audios):
+        if results[i] is None:
+            language, probability = key.language, None
+            if language is None:
+                # Mateixa detecció que faria `transcribe` (primers 30 s), però guardant-ne la confiança
+                mel = whisper.log_mel_spectrogram(whisper.pad_or_trim(audio), model.dims.n_mels).to(model.device)
+                _, probs = model.detect_language(mel)
+                language = max(probs, key=probs.get)
+                probability = probs[language]
+            result = model.transcribe(audio, fp16=False, language=language, initial_prompt=key.prompt)
+            results[i] = {
+                'text': result["text"].strip(),
+                'language': result["language"],
+                'segments': [{'start': s['start'], 'end': s['end'], 'text': s['text'].strip()} for s in result["segments"]],
+            }
+            if probability is not None:
+                results[i]['language_probability'] = probability
+
+    return results
+
+def run_batch(key, audios):
+    """Executa el lot al procés actual o a una rèplica lliure si n'hi ha."""
+    start = time.perf_counter()
+    try:
+        if replica_pool is not None:
+            results = replica_pool.dispatch(key, audios)
+        else:
+            results = transcribe_batch(key, audios)
+        # El cost observat per finestra alimenta l'estimació d'espera del control d'admissió
+        admission.observe(sum(audio_windows(payload_seconds(a)) for a in audios),
+                          time.perf_counter() - start)
+        return results
+    finally:
+        INFERENCE_SECONDS.observe(time.perf_counter() - start, model=key.model)
+        BATCH_SIZE.observe(len(audios), model=key.model)
+
+scheduler = BatchScheduler(run_batch, max_batch_size=BATCH_MAX_SIZE, max_wait_ms=BATCH_MAX_WAIT_MS,
+                           wait_observer=QUEUE_WAIT_SECONDS.observe)
+admission = AdmissionController(
+    budgets={'interactive': INTERACTIVE_BUDGET_S, 'bulk': BULK_BUDGET_S},
+    max_queued={'interactive': INTERACTIVE_QUEUE, 'bulk': BULK_QUEUE},
+    max_per_client=MAX_PER_CLIENT,
+    workers=REPLICAS or 1,
+    max_windows={'interactive': audio_windows(INTERACTIVE_MAX_S), 'bulk': audio_windows(BULK_MAX_S)},
+)
+session_languages = SessionLanguageCache(ttl_seconds=LANGUAGE_TTL_S, min_probability=LANGUAGE_MIN_PROB)
+cache = TranscriptionCache(max_entries=CACHE_MAX_ENTRIES, disk_dir=CACHE_DIR, max_disk_entries=CACHE_DISK_MAX_ENTRIES)
+stream_sessions = SessionRegistry(ttl_seconds=STREAM_TTL_S, partial_interval=STREAM_PARTIAL_S, final_window=STREAM_FINAL_S)
+
+def has_speech(audio):
+    """Cert si el VAD hi troba veu (o si està desactivat)."""
+    return not VAD_ENABLED or len(speech_regions(audio)) > 0
+
+def stream_transcribe(audio, language, prompt):
+    """Transcripció per a les sessions de streaming (sense memòria cau, model per defecte)."""
+    if not has_speech(audio):
+        return {'text': '', 'language': language}
+    return scheduler.submit(BatchKey(resolve_model_name(None), language, prompt), audio).result()
+
 @app.route('/', methods=['GET'])
 def index():
     try:
@@ -143,13 +432,260 @@ def index():
     except Exception as e:
         return f"<h1>Error loading README</h1><p>{{str(e)}}</p>", 500
 
-@app.route('/transcribe', methods=['POST'])
-def transcribe_audio():
-    # Comprovar estat del model
+def model_state_error():
+    """Retorna una resposta d'error si el model no està disponible, o None."""
     if 'error' in model_container:
         return jsonify({'error': f"Model failed to load: {model_container['error']}"}), 500
-    if 'model' not in model_container:
+    if not model_container.get('ready'):
         return jsonify({'error': 'Model is still loading, please try again later'}), 503
+    return None
+
+def decode_upload(file):
+    """
+    Descodifica un fitxer pujat a float32 mono de 16 kHz.
+    Els WAV (i els FLAC, si hi ha soundfile) es llegeixen directament en
+    memòria; la resta de formats passen per ffmpeg a través d'un fitxer temporal.
+    """
+    data = bytearray(file.read())
+    for method, decode in (('wav', decode_wav), ('flac', decode_flac)):
+        start = time.perf_counter()
+        try:
+            audio = decode(data)
+            DECODE_SECONDS.observe(time.perf_counter() - start, method=method)
+            return audio
+        except UnsupportedAudio:
+            pass
+
+    # Determinar extensió del fitxer original
+    ext = os.path.splitext(file.filename)[1] if file.filename else '.wav'
+    if not ext:
+        ext = '.wav'
+
+    # Guardar fitxer temporalment perquè ffmpeg el pugui llegir
+    with tempfile.NamedTemporaryFile(delete=False, suffix=ext) as temp:
+        temp.write(data)
+        temp_path = temp.name
+    try:
+        start = time.perf_counter()
+        audio = whisper.load_audio(temp_path)
+        DECODE_SECONDS.observe(time.perf_counter() - start, method='ffmpeg')
+        return audio
+    finally:
+        # Eliminar fitxer temporal
+        if os.path.exists(temp_path):
+            os.remove(temp_path)
+
+jobs = JobStore(JOBS_DIR)
+
+def job_transcribe(audio, model_name, language, prompt):
+    """
+    Transcripció d'una finestra d'una feina llarga. La finestra compta al
+    carril `bulk` del control d'admissió mentre s'espera i es transcriu.
+    """
+    if not has_speech(audio):
+        return {'text': '', 'language': language}
+    ticket = admission.reserve('jobs', 'bulk', audio_windows(payload_seconds(audio)))
+    try:
+        return scheduler.submit(BatchKey(model_name, language, prompt), audio, priority=LANE_PRIORITY['bulk']).result()
+    finally:
+        admission.release(ticket)
+
+job_runner = JobRunner(jobs, job_transcribe)
+
+# Mètriques calculades en el moment de l'exportació
+Gauge('echotext_queue_depth', "Peticions esperant al planificador d'inferència", function=scheduler.queue_depth)
+Gauge('echotext_model_load_seconds', 'Temps de la darrera càrrega de cada model', ['model'],
+      function=lambda: {(m['name'],): m['last_load_seconds'] for m in models.stats() if m['loads']})
+Gauge('echotext_model_resident', 'Model carregat a memòria (1) o expulsat (0)', ['model'],
+      function=lambda: {(m['name'],): int(m['resident']) for m in models.stats()})
+Gauge('echotext_resident_memory_bytes', 'Memòria resident (RSS) del procés del servidor',
+      function=lambda: (memory_usage() or {}).get('rss', 0) * 1024 * 1024 or None)
+Gauge('echotext_replica_memory_bytes', 'Memòria de cada rèplica', ['replica', 'kind'],
+      function=lambda: {
+          (str(r['index']), kind): value * 1024 * 1024
+          for r in (replica_pool.stats()['replicas'] if replica_pool else [])
+          for kind, value in (r['memory_mb'] or {}).items()
+      })
+Gauge('echotext_estimated_wait_seconds', "Espera estimada per a una petició nova de cada carril", ['lane'],
+      function=lambda: {(lane,): s['estimated_wait_seconds'] for lane, s in admission.stats()['lanes'].items()})
+Counter('echotext_session_language_events_total', "Idiomes reutilitzats (hits) o detectats per sessió", ['result'],
+        function=lambda: {(name,): value for name, value in session_languages.stats.items()})
+Counter('echotext_cache_events_total', 'Consultes a la memòria cau de transcripcions', ['result'],
+        function=lambda: {(name,): value for name, value in cache.stats.items()})
+
+def request_lane(duration):
+    """
+    Carril de la petició: els fragments curts van a `interactive` i els
+    fitxers llargs a `bulk`. El client pot demanar `bulk` amb X-Priority.
+    """
+    if request.headers.get('X-Priority', '').lower() == 'bulk' or duration > INTERACTIVE_MAX_S:
+        return 'bulk'
+    return 'interactive'
+
+def remote_address():
+    """
+    Adreça del client. Si la petició arriba d'un proxy de confiança, és la
+    primera adreça de X-Forwarded-For (començant per la dreta) que no és un
+    proxy de confiança: les de més a l'esquerra les pot falsejar el client.
+    """
+    address = request.remote_addr
+    if address in TRUSTED_PROXIES:
+        for hop in reversed(request.headers.get('X-Forwarded-For', '').split(',')):
+            hop = hop.strip()
+            if hop and hop not in TRUSTED_PROXIES:
+                return hop
+    return address
+
+def client_id():
+    """Identificador del client per repartir la capacitat (X-Client-Id o adreça IP)."""
+    return request.headers.get('X-Client-Id') or remote_address() or 'unknown'
+
+def transcribe_admitted(audio, batch_key, client, lane, duration):
+    """Passa pel control d'admissió i transcriu; allibera la plaça en acabar."""
+    ticket = admission.admit(client, lane, audio_windows(duration))
+    try:
+        return scheduler.submit(batch_key, audio, priority=LANE_PRIORITY[lane]).result()
+    finally:
+        admission.release(ticket)
+
+def session_id():
+    """Identificador de sessió del client (capçalera X-Session-Id, camp `session_id` o `?session_id=`)."""
+    session = request.headers.get('X-Session-Id') or request.args.get('session_id')
+    if request.mimetype == 'multipart/form-data':
+        session = request.form.get('session_id') or session
+    return session or None
+
+def transcription_response(audio, language, model_name):
+    """
+    Transcriu l'àudio a través de la memòria cau i del planificador i
+    construeix la resposta JSON. La capçalera X-Cache indica si s'ha reutilitzat.
+    Si la cua no pot complir el pressupost de latència es respon 429 amb Retry-After;
+    si l'àudio supera la durada màxima del carril, 413 i es remet a `/jobs`.
+
+    Abans del model passa el VAD: els fragments sense veu es responen de
+    seguida amb text buit i, en els àudios de més de 30 s, només es
+    transcriuen les zones amb veu (els temps dels segments es tornen a
+    referir a l'àudio original).
+
+    Sense idioma però amb identificador de sessió, es reutilitza l'idioma
+    detectat en un fragment anterior de la mateixa sessió.
+
+    `audio` també pot ser un log-mel ja calculat pel client; en aquest cas
+    no passa pel VAD.
+    """
+    session = session_id()
+    language_source = 'request' if language else 'detected'
+    if not language and session:
+        language = session_languages.get(session)
+        if language:
+            language_source = 'session'
+
+    duration = payload_seconds(audio)
+    AUDIO_DURATION.observe(duration, endpoint=request.endpoint)
+
+    time_map = None
+    skipped = 0.0
+    if VAD_ENABLED and not is_mel(audio):
+        regions = speech_regions(audio)
+        skipped = duration - speech_seconds(regions)
+        if not len(regions):
+            VAD_SILENT_REQUESTS.inc(endpoint=request.endpoint)
+            VAD_SKIPPED_SECONDS.inc(duration, endpoint=request.endpoint)
+            return jsonify({'text': '', 'language': language, 'model': model_name, 'skipped_seconds': round(duration, 2)})
+        if len(audio) > whisper.audio.N_SAMPLES:
+            audio, time_map = compact(audio, regions)
+            VAD_SKIPPED_SECONDS.inc(skipped, endpoint=request.endpoint)
+        else:
+            # Els fragments curts s'omplen igualment fins a 30 s: no es retalla res
+            skipped = 0.0
+
+    speech_duration = payload_seconds(audio)
+    lane = request_lane(speech_duration)
+    client = client_id()
+    try:
+        key = cache.make_key(audio, language=language, model=model_name, options=CACHE_OPTIONS,
+                             precision=effective_precision(), input='mel' if is_mel(audio) else 'audio')
+        # Transcriure (agrupat amb altres peticions concurrents del mateix model i idioma);
+        # els encerts de la memòria cau no passen pel control d'admissió
+        batch_key = BatchKey(model_name, language, None)
+        result, hit = cache.get_or_compute(key, lambda: transcribe_admitted(audio, batch_key, client, lane, speech_duration))
+        if language_source == 'detected' and session:
+            session_languages.put(session, result['language'], result.get('language_probability'))
+        body = {'text': result['text'], 'language': language or result['language'], 'model': model_name,
+                'language_source': language_source, 'skipped_seconds': round(skipped, 2)}
+        if 'segments' in result:
+            body['segments'] = [
+                {**s, 'start': round(time_map.to_original(s['start']), 2), 'end': round(time_map.to_original(s['end'], end=True), 2)}
+                if time_map else s
+                for s in result['segments']
+            ]
+        response = jsonify(body)
+        response.headers['X-Cache'] = 'HIT' if hit else 'MISS'
+        if duration:
+            REAL_TIME_FACTOR.observe((time.perf_counter() - g.start_time) / duration, model=model_name)
+        return response
+
+    except AdmissionRejected as e:
+        ADMISSION_REJECTED.inc(lane=lane)
+        response = jsonify({'error': str(e), 'lane': lane, 'retry_after': e.retry_after})
+        response.headers['Retry-After'] = str(e.retry_after)
+        return response, 429
+    except RequestTooLarge as e:
+        ADMISSION_REJECTED.inc(lane=lane)
+        return jsonify({'error': f"{e}. Per a enregistraments llargs, feu servir /jobs.", 'lane': lane, 'jobs': '/jobs'}), 413
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+@app.route('/health/live', methods=['GET'])
+def health_live():
+    """El procés respon (encara que el model no estigui carregat)."""
+    return jsonify({'status': 'alive'})
+
+@app.route('/health/ready', methods=['GET'])
+def health_ready():
+    """El model està carregat i escalfat: es pot enviar trànsit a aquesta rèplica."""
+    if 'error' in model_container:
+        return jsonify({'status': 'error', 'error': model_container['error']}), 503
+    if not model_container.get('ready'):
+        return jsonify({'status': 'loading'}), 503
+    return jsonify({'status': 'ready', 'model': model_container['name']})
+
+@app.route('/metrics', methods=['GET'])
+def metrics():
+    """Mètriques en format de text de Prometheus."""
+    return Response(REGISTRY.render(), mimetype='text/plain; version=0.0.4')
+
+@app.route('/models', methods=['GET'])
+def models_status():
+    """
+    Models acceptats i estat dels que s'han carregat. Amb rèpliques, `loaded`
+    és el registre del procés principal i `replicas` el de cada rèplica, on es
+    carreguen i s'expulsen els models que no són el per defecte.
+    """
+    body = {'default': model_container.get('name', DEFAULT_MODEL), 'allowed': ALLOWED_MODELS,
+            'precision': getattr(model_container.get('model'), 'precision', PRECISION), 'loaded': models.stats()}
+    if replica_pool is not None:
+        body['replicas'] = [{'index': i, 'loaded': loaded} for i, loaded in enumerate(replica_pool.statuses())]
+    return jsonify(body)
+
+@app.route('/admission', methods=['GET'])
+def admission_status():
+    """Ocupació de cada carril, espera estimada i peticions rebutjades."""
+    return jsonify(admission.stats())
+
+@app.route('/replicas', methods=['GET'])
+def replicas_status():
+    """Memòria i rendiment de cada rèplica per poder dimensionar-les."""
+    if replica_pool is None:
+        return jsonify({'replicas': [], 'mode': 'single-process'})
+    return jsonify(replica_pool.stats())
+
+@app.route('/transcribe', methods=['POST'])
+def transcribe_audio():
+    # Comprovar estat del model
+    state_error = model_state_error()
+    if state_error:
+        return state_error
 
     if 'file' not in request.files:
         return jsonify({'error': 'No file part'}), 400
@@ -158,39 +694,231 @@ def transcribe_audio():
     if file.filename == '':
         return jsonify({'error': 'No selected file'}), 400
 
-    if file:
-        language = request.form.get('language') # None triggers auto-detection
-        
-        # Determinar extensió del fitxer original
-        import os.path
-        ext = os.path.splitext(file.filename)[1] if file.filename else '.wav'
-        if not ext:
-            ext = '.wav'
-        
-        # Guardar fitxer temporalment
-        with tempfile.NamedTemporaryFile(delete=False, suffix=ext) as temp:
-            file.save(temp.name)
-            temp_path = temp.name
+    language = request.form.get('language') # None triggers auto-detection
 
-        try:
-            model = model_container['model']
-            # Transcriure
-            result = model.transcribe(temp_path, fp16=False, language=language)
-            text = result["text"].strip()
-            
-            return jsonify({'text': text, 'language': language})
-            
-        except Exception as e:
-            return jsonify({'error': str(e)}), 500
-        finally:
-            # Eliminar fitxer temporal
-            if os.path.exists(temp_path):
-                os.remove(temp_path)
+    try:
+        model_name = resolve_model_name(request.form.get('model'))
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
 
-if __name__ == '__main__':
-    # Carregar model en un fil o abans d'iniciar el servidor
-    # Ho fem abans d'iniciar el servidor per simplificar, tot i que bloquejarà l'inici fins que carregui
+    try:
+        audio = decode_upload(file)
+    except Exception as e:
+        return jsonify({'error': f"No s'ha pogut descodificar l'àudio: {e}"}), 400
+
+    return transcription_response(audio, language, model_name)
+
+@app.route('/transcribe/raw', methods=['POST'])
+def transcribe_raw():
+    """
+    Transcriu un cos binari amb PCM cru little-endian.
+    Capçaleres: X-Sample-Rate (obligatòria), X-Sample-Format (s16le o f32le,
+    defecte s16le) i X-Channels (defecte 1). Idioma i model opcionals a
+    `?language=` i `?model=`.
+    """
+    state_error = model_state_error()
+    if state_error:
+        return state_error
+
+    try:
+        sample_rate = int(request.headers['X-Sample-Rate'])
+        channels = int(request.headers.get('X-Channels', '1'))
+    except KeyError:
+        return jsonify({'error': 'Missing X-Sample-Rate header'}), 400
+    except ValueError:
+        return jsonify({'error': 'Invalid X-Sample-Rate or X-Channels header'}), 400
+
+    sample_format = request.headers.get('X-Sample-Format', 's16le').lower()
+    language = request.args.get('language') # None triggers auto-detection
+
+    try:
+        model_name = resolve_model_name(request.args.get('model'))
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+
+    length = request.content_length
+    if not length:
+        return jsonify({'error': 'Empty body'}), 400
+
+    try:
+        body = read_body(request.stream, length)
+        start = time.perf_counter()
+        audio = pcm_to_float32(body, sample_format, sample_rate, channels)
+        DECODE_SECONDS.observe(time.perf_counter() - start, method='pcm')
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+
+    return transcription_response(audio, language, model_name)
+
+@app.route('/transcribe/mel', methods=['POST'])
+def transcribe_mel():
+    """
+    Transcriu un log-mel calculat pel client (`.npy` float16 o float32 de
+    forma (bandes, trames), fins a 3000 trames = 30 s), amb la capçalera
+    X-Mel-Version. Idioma, model i sessió opcionals a la query, com a
+    `/transcribe/raw`. Els paràmetres del càlcul es publiquen a `/capabilities`.
+    """
+    state_error = model_state_error()
+    if state_error:
+        return state_error
+
+    version = request.headers.get('X-Mel-Version')
+    if version != str(MEL_FORMAT_VERSION):
+        return jsonify({'error': f"Unsupported X-Mel-Version: {version} (expected {MEL_FORMAT_VERSION})"}), 400
+
+    language = request.args.get('language') # None triggers auto-detection
+    try:
+        model_name = resolve_model_name(request.args.get('model'))
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+
+    length = request.content_length
+    if not length:
+        return jsonify({'error': 'Empty body'}), 400
+
+    try:
+        start = time.perf_counter()
+        mel = decode_mel(read_body(request.stream, length), model_n_mels(model_name))
+        DECODE_SECONDS.observe(time.perf_counter() - start, method='mel')
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+
+    return transcription_response(mel, language, model_name)
+
+@app.route('/capabilities', methods=['GET'])
+def capabilities():
+    """Formats d'entrada que accepta el servidor i paràmetres per calcular el log-mel al client."""
+    default = model_container.get('name', DEFAULT_MODEL)
+    return jsonify({
+        'inputs': ['multipart', 'pcm', 'mel'],
+        # Formats d'enviament dels fragments (vegeu lib/audio_encoding.py)
+        'encodings': ['flac', 'wav', 'pcm'] if flac_supported() else ['wav', 'pcm'],
+        'default_model': default,
+        'models': ALLOWED_MODELS,
+        'pcm': {'formats': sorted(PCM_FORMATS)},
+        'mel': {
+            'version': MEL_FORMAT_VERSION,
+            'sample_rate': whisper.audio.SAMPLE_RATE,
+            'n_fft': whisper.audio.N_FFT,
+            'hop_length': HOP_LENGTH,
+            'max_frames': N_FRAMES,
+            'dtypes': ['float16', 'float32'],
+            'n_mels': {name: model_n_mels(name) for name in dict.fromkeys(ALLOWED_MODELS + [default])},
+        },
+    })
+
+@app.route('/jobs', methods=['POST'])
+def create_job():
+    """
+    Crea una feina asíncrona per a enregistraments llargs i retorna el seu
+    identificador de seguida. Mateixos camps que `/transcribe`.
+    """
+    state_error = model_state_error()
+    if state_error:
+        return state_error
+
+    if 'file' not in request.files or request.files['file'].filename == '':
+        return jsonify({'error': 'No file part'}), 400
+
+    language = request.form.get('language') or None
+    try:
+        model_name = resolve_model_name(request.form.get('model'))
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+
+    try:
+        audio = decode_upload(request.files['file'])
+    except Exception as e:
+        return jsonify({'error': f"No s'ha pogut descodificar l'àudio: {e}"}), 400
+
+    AUDIO_DURATION.observe(len(audio) / whisper.audio.SAMPLE_RATE, endpoint=request.endpoint)
+    job_id = jobs.create(audio, model=model_name, language=language)
+    response = jsonify({'id': job_id, 'status': 'queued'})
+    response.headers['Location'] = f"/jobs/{job_id}"
+    return response, 202
+
+@app.route('/jobs/<job_id>', methods=['GET'])
+def job_status(job_id):
+    """Estat, progrés i segments parcials d'una feina."""
+    job = jobs.get(job_id)
+    if job is None:
+        return jsonify({'error': 'Job not found'}), 404
+    return jsonify(job)
+
+def warm_up():
+    """
+    Inferència sintètica perquè la primera petició real no pagui la
+    inicialització mandrosa de torch (en cada rèplica, si n'hi ha).
+    """
+    t = np.arange(whisper.audio.SAMPLE_RATE, dtype=np.float32) / whisper.audio.SAMPLE_RATE
+    audio = (0.1 * np.sin(2 * np.pi * 220 * t) + 0.01 * np.random.randn(len(t))).astype(np.float32)
+    key = BatchKey(model_container['name'], None, None)
+
+    start = time.time()
+    if replica_pool is not None:
+        replica_pool.broadcast(key, [audio])
+    else:
+        transcribe_batch(key, [audio])
+    print(f"Inferència d'escalfament completada en {time.time() - start:.2f}s.")
+
+def start_replicas():
+    """
+    Amb rèpliques, carrega el model i crea els processos rèplica al fil
+    principal, abans d'obrir el port: el fork() s'ha de fer quan encara no
+    hi ha cap altre fil (Waitress, planificador, janitors) que pugui tenir
+    un lock agafat. Sense rèpliques no fa res i el model es carrega en segon pla.
+    """
+    global replica_pool
+
+    if not REPLICAS:
+        return
+    # El pare no ha d'haver arrencat el pool d'OpenMP abans del fork()
+    torch.set_num_threads(1)
     load_model()
+    if 'model' in model_container:
+        # Cada rèplica té el seu registre: els models no per defecte s'hi carreguen i s'hi expulsen per separat
+        replica_pool = ReplicaPool(transcribe_batch, REPLICAS, threads_per_replica=REPLICA_THREADS, duration=payload_seconds,
+                                   init=models.start, status=models.stats)
+        print(f"Iniciades {REPLICAS} rèpliques del model ({replica_pool.threads} fils de torch cadascuna).")
+
+def startup():
+    """Carrega el model (si `start_replicas` no ho ha fet) i l'escalfa mentre el servidor ja escolta."""
+    if 'model' not in model_container and 'error' not in model_container:
+        load_model()
+    if 'model' not in model_container:
+        return
+
+    try:
+        warm_up()
+    except Exception as e:
+        print(f"Error durant l'escalfament del model: {e}")
+        model_container['error'] = f"Warm-up failed: {e}"
+        return
+
+    if replica_pool is not None:
+        for replica in replica_pool.stats()['replicas']:
+            memory = replica['memory_mb']
+            if memory:
+                print(f"  Rèplica {replica['index']} (pid {replica['pid']}): RSS {memory['rss']} MB, "
+                      f"PSS {memory['pss']} MB, privada {memory['private']} MB")
+
+    scheduler.start(workers=REPLICAS or 1)
+    models.start()
+    job_runner.start()
+
+    if STREAM_PORT:
+        print(f"Iniciant servidor de streaming (WebSocket) a 0.0.0.0:{STREAM_PORT}/stream...")
+        start_stream_server('0.0.0.0', STREAM_PORT, stream_sessions, stream_transcribe)
+
+    model_container['ready'] = True
+    print("Servidor preparat: /health/ready ja respon 200.")
+
+if __name__ == '__main__':
+    start_replicas()
+
+    # Carregar (sense rèpliques) i escalfar el model en segon pla: el port s'obre
+    # de seguida i /health/ready indica quan el model està carregat i escalfat
+    threading.Thread(target=startup, name="model-loader", daemon=True).start()
     
     # Iniciar servidor Waitress accessible des de la xarxa local
     print("Iniciant servidor API amb Waitress a 0.0.0.0:5000...")
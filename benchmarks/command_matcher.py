@@ -0,0 +1,114 @@
+#!/usr/bin/env python3
+"""
+Micro-benchmark del reconeixement d'ordres de veu (`lib/voice_commands.py`).
+
+Comprova primer que cada transcripció del corpus (`command_corpus.jsonl`,
+una línia JSON amb `text` i `expected`) activa l'ordre esperada, i després
+mesura el temps per transcripció a mesura que creix el nombre d'ordres,
+afegint-ne de sintètiques a les del fitxer de configuració. Com a
+referència, es mesura també la cerca lineal de subcadenes que es feia
+abans (una comprovació `in` per frase).
+
+Ús:
+    python3 benchmarks/command_matcher.py [--commands 8,100,1000]
+        [--corpus benchmarks/command_corpus.jsonl] [--config ordres.json]
+"""
+import os
+import sys
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+import argparse
+import json
+import random
+import time
+
+from lib.voice_commands import DEFAULT_PATH, CommandRegistry
+
+DEFAULT_CORPUS = os.path.join(ROOT, "benchmarks", "command_corpus.jsonl")
+SYLLABLES = ["ba", "ca", "de", "fo", "gu", "la", "mi", "no", "pe", "ri", "sa", "to", "vu", "xi"]
+
+
+def load_corpus(path):
+    with open(path, 'r', encoding='utf-8') as f:
+        return [json.loads(line) for line in f if line.strip()]
+
+
+def synthetic_commands(n, rng):
+    """Ordres inventades de dues o tres paraules que no coincideixen amb el corpus."""
+    commands, seen = [], set()
+    while len(commands) < n:
+        words = ["".join(rng.choice(SYLLABLES) for _ in range(3)) for _ in range(rng.randint(2, 3))]
+        phrase = " ".join(words)
+        if phrase in seen:
+            continue
+        seen.add(phrase)
+        commands.append({"name": f"sintetica_{len(commands)}", "phrases": [phrase],
+                         "steps": [{"say": phrase}]})
+    return commands
+
+
+def linear_match(config, text):
+    """Cerca lineal de subcadenes, com l'antiga cadena de `if ... in text_lower`."""
+    text = text.lower()
+    for command in config["commands"]:
+        for phrase in command["phrases"]:
+            if phrase in text:
+                return command["name"]
+    return None
+
+
+def time_per_text(fn, texts, min_seconds=0.2):
+    """Temps mitjà per text en microsegons."""
+    runs = 0
+    start = time.perf_counter()
+    while True:
+        for text in texts:
+            fn(text)
+        runs += 1
+        elapsed = time.perf_counter() - start
+        if elapsed >= min_seconds:
+            return elapsed / (runs * len(texts)) * 1e6
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Micro-benchmark del reconeixement d'ordres de veu")
+    parser.add_argument("--commands", default="8,100,1000",
+                        help="Nombres d'ordres a provar, separats per comes (per defecte 8,100,1000)")
+    parser.add_argument("--corpus", default=DEFAULT_CORPUS, help="Transcripcions amb l'ordre esperada (JSONL)")
+    parser.add_argument("--config", default=DEFAULT_PATH, help="Fitxer d'ordres (per defecte el del paquet)")
+    args = parser.parse_args()
+
+    with open(args.config, 'r', encoding='utf-8') as f:
+        config = json.load(f)
+    corpus = load_corpus(args.corpus)
+
+    registry = CommandRegistry.from_config(config)
+    failures = 0
+    for item in corpus:
+        match = registry.match(item["text"])
+        got = match.command.name if match else None
+        if got != item["expected"]:
+            failures += 1
+            print(f"ERROR: '{item['text']}' -> {got} (esperat {item['expected']})")
+    print(f"Corpus: {len(corpus) - failures}/{len(corpus)} transcripcions correctes")
+
+    texts = [item["text"] for item in corpus]
+    rng = random.Random(0)
+    base = len(config["commands"])
+    print(f"\n{'Ordres':>7} {'Compilació':>11} {'Autòmat µs':>11} {'Lineal µs':>10}")
+    for n in (int(x) for x in args.commands.split(",")):
+        scaled = {"commands": config["commands"] + synthetic_commands(max(0, n - base), rng)}
+        start = time.perf_counter()
+        scaled_registry = CommandRegistry.from_config(scaled)
+        compile_ms = (time.perf_counter() - start) * 1000
+        automaton = time_per_text(scaled_registry.match, texts)
+        linear = time_per_text(lambda text: linear_match(scaled, text), texts)
+        print(f"{len(scaled['commands']):>7} {compile_ms:>9.1f}ms {automaton:>11.1f} {linear:>10.1f}")
+
+    sys.exit(1 if failures else 0)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,172 @@
+#!/usr/bin/env python3
+"""
+Model fals amb temps deterministes per mesurar el servidor sense Whisper.
+
+`FakeModel` té la mateixa interfície que fa servir `api_server.py`
+(`dims`, `device`, `embed_audio`, `detect_language`, `decode` i
+`transcribe`) però no calcula res: cada crida espera un temps fix per lot
+més un temps fix per finestra de 30 s i retorna un text derivat del
+contingut. Així es poden mesurar la capa HTTP, la descodificació de
+l'àudio, el VAD, el control d'admissió i el planificador de micro-lots
+amb resultats reproduïbles i sense descarregar cap model. L'espera és un
+`sleep`: no ocupa la CPU, com una inferència a la GPU.
+
+`install(api_server, loader)` substitueix el carregador del servidor, de
+manera que `start_replicas()` i `startup()` (càrrega, rèpliques,
+escalfament i planificador) s'executen igual que amb el model real.
+
+Ús:
+    python3 benchmarks/fake_model.py [--port 5000] [--batch-ms 20] [--window-ms 100]
+"""
+import os
+import sys
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from lib.venv_activator import activate_venv
+
+if __name__ == "__main__":
+    activate_venv(os.path.join(ROOT, os.path.basename(__file__)))
+
+import argparse
+import math
+import threading
+import time
+import zlib
+from types import SimpleNamespace
+
+import torch
+from whisper.audio import N_SAMPLES, SAMPLE_RATE
+from whisper.decoding import DecodingResult
+
+from lib.mel import model_n_mels
+
+# Paraules dels textos falsos; el text depèn només del contingut de l'àudio
+WORDS = ("bon", "dia", "avui", "farem", "una", "prova", "de", "càrrega", "amb", "àudio",
+         "sintètic", "i", "el", "servidor", "respon", "sense", "model", "real")
+LANGUAGE_PROBS = {'ca': 0.94, 'es': 0.04, 'en': 0.02}
+
+
+def fake_text(data):
+    """Quatre paraules triades pel CRC dels bytes: el mateix àudio dona sempre el mateix text."""
+    crc = zlib.crc32(data)
+    return " ".join(WORDS[(crc >> (8 * i)) % len(WORDS)] for i in range(4))
+
+
+class FakeModel:
+    """
+    Substitut de `model_container['model']`. Cada `decode` d'un lot de N
+    finestres tarda `batch_ms + N * window_ms`; cada `transcribe` d'un àudio
+    de W finestres de 30 s, `batch_ms + W * window_ms`.
+    """
+
+    precision = 'fp32'
+
+    def __init__(self, name='turbo', batch_ms=20.0, window_ms=100.0, language='ca'):
+        self.name = name
+        self.batch_ms = batch_ms
+        self.window_ms = window_ms
+        self.language = language
+        self.dims = SimpleNamespace(n_mels=model_n_mels(name))
+        self.device = torch.device('cpu')
+        self.stats = {'batches': 0, 'windows': 0, 'busy_seconds': 0.0}
+        self._lock = threading.Lock()
+
+    def _work(self, windows):
+        seconds = (self.batch_ms + windows * self.window_ms) / 1000
+        time.sleep(seconds)
+        with self._lock:
+            self.stats['batches'] += 1
+            self.stats['windows'] += windows
+            self.stats['busy_seconds'] += seconds
+
+    def to(self, device):
+        return self
+
+    def state_dict(self, keep_vars=False):
+        return {}
+
+    def embed_audio(self, mel):
+        # `decode` rep les característiques de l'encoder: aquí són el mateix log-mel
+        return mel
+
+    def detect_language(self, mel):
+        probs = dict(LANGUAGE_PROBS)
+        if mel.ndim == 2:
+            return torch.tensor(0), probs
+        return torch.zeros(mel.shape[0], dtype=torch.long), [dict(probs) for _ in range(mel.shape[0])]
+
+    def decode(self, mel, options):
+        single = mel.ndim == 2
+        batch = mel[None] if single else mel
+        self._work(len(batch))
+        results = [
+            DecodingResult(audio_features=item, language=options.language or self.language,
+                           text=fake_text(item.numpy().tobytes()), avg_logprob=-0.2, no_speech_prob=0.01)
+            for item in batch
+        ]
+        return results[0] if single else results
+
+    def transcribe(self, audio, language=None, **options):
+        windows = max(1, math.ceil(len(audio) / N_SAMPLES))
+        self._work(windows)
+        segments = []
+        for i in range(windows):
+            window = audio[i * N_SAMPLES:(i + 1) * N_SAMPLES]
+            segments.append({'start': i * N_SAMPLES / SAMPLE_RATE, 'end': (i * N_SAMPLES + len(window)) / SAMPLE_RATE,
+                             'text': " " + fake_text(window.tobytes())})
+        return {'text': "".join(s['text'] for s in segments), 'language': language or self.language, 'segments': segments}
+
+
+class FakeLoader:
+    """Carregador de models falsos amb els mateixos temps; en guarda els creats per consultar-ne les estadístiques."""
+
+    def __init__(self, batch_ms=20.0, window_ms=100.0):
+        self.batch_ms = batch_ms
+        self.window_ms = window_ms
+        self.models = []
+
+    def __call__(self, name, precision=None, device=None):
+        model = FakeModel(name, batch_ms=self.batch_ms, window_ms=self.window_ms)
+        self.models.append(model)
+        return model
+
+    def config(self):
+        return {'batch_ms': self.batch_ms, 'window_ms': self.window_ms}
+
+    def stats(self):
+        """Estadístiques agregades dels models d'aquest procés (no inclou les rèpliques)."""
+        total = {'batches': 0, 'windows': 0, 'busy_seconds': 0.0}
+        for model in self.models:
+            with model._lock:
+                for k in total:
+                    total[k] += model.stats[k]
+        return total
+
+
+def install(server, loader):
+    """Fa que `server` (el mòdul api_server) carregui models falsos en lloc de Whisper."""
+    # Tant `load_model()` com el registre de models criden `load_whisper_model` del mòdul
+    server.load_whisper_model = loader
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Servidor de l'API amb un model fals de temps deterministes")
+    parser.add_argument("--port", type=int, default=5000, help="Port HTTP (per defecte 5000)")
+    parser.add_argument("--batch-ms", type=float, default=20.0, help="Temps fix per lot en ms (per defecte 20)")
+    parser.add_argument("--window-ms", type=float, default=100.0, help="Temps per finestra de 30 s en ms (per defecte 100)")
+    args = parser.parse_args()
+
+    import api_server
+    from waitress import serve
+
+    install(api_server, FakeLoader(args.batch_ms, args.window_ms))
+    api_server.start_replicas()
+    threading.Thread(target=api_server.startup, name="model-loader", daemon=True).start()
+    print(f"Iniciant servidor API amb el model fals a 0.0.0.0:{args.port}...")
+    serve(api_server.app, host='0.0.0.0', port=args.port)
+
+
+if __name__ == "__main__":
+    main()
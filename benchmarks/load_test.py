@@ -0,0 +1,286 @@
+#!/usr/bin/env python3
+"""
+Prova de càrrega de `/transcribe` amb àudio sintètic.
+
+Per a cada combinació de senyal, durada i format (`synthetic_audio.py`)
+envia `--requests` peticions amb el patró d'arribada triat i mesura la
+latència (p50, p95, p99), el throughput (peticions i segons d'àudio per
+segon) i el factor sobre temps real (latència / durada de l'àudio).
+
+Sense `--url` arrenca el servidor dins del mateix procés amb el model fals
+de `fake_model.py`: es mesuren la capa HTTP, la descodificació, el VAD i el
+planificador sense Whisper i amb temps reproduïbles. Amb `--url` es prova
+un servidor qualsevol (real o `fake_model.py`).
+
+Patrons d'arribada:
+- `closed`: `--concurrency` clients que envien la petició següent en rebre la resposta.
+- `poisson`: arribades aleatòries a `--rate` peticions per segon.
+- `uniform`: una petició cada 1 / `--rate` segons.
+- `burst`: ràfegues de `--concurrency` peticions alhora, a `--rate` peticions per segon de mitjana.
+
+En els patrons oberts es tenen com a màxim `--concurrency` peticions en
+curs i la latència es compta des del moment previst d'arribada, de manera
+que inclou l'espera si el client no dona l'abast.
+
+Ús:
+    python3 benchmarks/load_test.py [--url http://localhost:5000] [--signals speech]
+        [--durations 5,60] [--formats wav,pcm] [--arrival closed] [--concurrency 8]
+        [--rate 10] [--requests 100] [--json resultats.json]
+"""
+import os
+import sys
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from lib.venv_activator import activate_venv
+
+if __name__ == "__main__":
+    activate_venv(os.path.join(ROOT, os.path.basename(__file__)))
+
+import argparse
+import itertools
+import json
+import platform
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+import requests
+
+import synthetic_audio
+from lib.audio_decode import SAMPLE_RATE
+
+ARRIVALS = ('closed', 'poisson', 'uniform', 'burst')
+PERCENTILES = (50, 95, 99)
+
+
+def arrival_times(arrival, requests_count, rate, burst, seed=0):
+    """Instants d'arribada (segons des de l'inici) dels patrons oberts, sempre els mateixos per a la mateixa llavor."""
+    if arrival == 'uniform':
+        return [i / rate for i in range(requests_count)]
+    if arrival == 'poisson':
+        rng = np.random.default_rng(seed)
+        return list(np.cumsum(rng.exponential(1 / rate, requests_count)) - 1 / rate)
+    if arrival == 'burst':
+        return [(i // burst) * burst / rate for i in range(requests_count)]
+    raise ValueError(f"Patró d'arribada desconegut: {arrival}. Opcions: {', '.join(ARRIVALS)}")
+
+
+def summarize(values):
+    if not values:
+        return None
+    values = np.asarray(values)
+    summary = {f'p{p}': round(float(np.percentile(values, p)), 4) for p in PERCENTILES}
+    summary.update(mean=round(float(values.mean()), 4), max=round(float(values.max()), 4))
+    return summary
+
+
+class LoadTest:
+    """Envia les peticions d'un escenari i en recull els temps."""
+
+    def __init__(self, url, language=None, timeout=300.0):
+        self.url = url.rstrip('/')
+        self.language = language
+        self.timeout = timeout
+        self._local = threading.local()
+
+    def _session(self):
+        # Una sessió per fil: les connexions es reutilitzen com en un client real
+        if not hasattr(self._local, 'session'):
+            self._local.session = requests.Session()
+        return self._local.session
+
+    def send(self, payload, fmt, client):
+        """Una petició; retorna (codi d'estat o None si falla, encert de la memòria cau)."""
+        headers = {'X-Client-Id': client}
+        try:
+            if fmt == 'pcm':
+                headers.update({'X-Sample-Rate': str(SAMPLE_RATE), 'X-Sample-Format': 's16le',
+                                'Content-Type': 'application/octet-stream'})
+                params = {'language': self.language} if self.language else None
+                response = self._session().post(f"{self.url}/transcribe/raw", data=payload, params=params,
+                                                headers=headers, timeout=self.timeout)
+            else:
+                files = {'file': (f"audio.{fmt}", payload, synthetic_audio.mimetype(fmt))}
+                data = {'language': self.language} if self.language else None
+                response = self._session().post(f"{self.url}/transcribe", files=files, data=data,
+                                                headers=headers, timeout=self.timeout)
+            response.content
+        except requests.RequestException:
+            return None, False
+        return response.status_code, response.headers.get('X-Cache') == 'HIT'
+
+    def run(self, payloads, fmt, arrival, requests_count, concurrency, rate, seed=0):
+        """Executa l'escenari. Retorna (registres, segons totals); cada registre és (codi, latència, encert)."""
+        records = [None] * requests_count
+        start = time.perf_counter()
+
+        def request(i, scheduled):
+            status, hit = self.send(payloads[i % len(payloads)], fmt, f"loadtest-{i % concurrency}")
+            records[i] = (status, time.perf_counter() - scheduled, hit)
+
+        if arrival == 'closed':
+            counter = itertools.count()
+
+            def client():
+                while True:
+                    i = next(counter)
+                    if i >= requests_count:
+                        return
+                    request(i, time.perf_counter())
+
+            threads = [threading.Thread(target=client) for _ in range(concurrency)]
+            for t in threads:
+                t.start()
+            for t in threads:
+                t.join()
+        else:
+            offsets = arrival_times(arrival, requests_count, rate, concurrency, seed)
+            with ThreadPoolExecutor(max_workers=concurrency) as pool:
+                for i, offset in enumerate(offsets):
+                    scheduled = start + offset
+                    delay = scheduled - time.perf_counter()
+                    if delay > 0:
+                        time.sleep(delay)
+                    pool.submit(request, i, scheduled)
+
+        return records, time.perf_counter() - start
+
+
+def scenario_result(records, wall, seconds):
+    ok = [r for r in records if r[0] == 200]
+    status = {}
+    for code, _, _ in records:
+        key = str(code) if code is not None else 'error'
+        status[key] = status.get(key, 0) + 1
+    latencies = [r[1] for r in ok]
+    return {
+        'ok': len(ok),
+        'rejected': status.get('429', 0),
+        'errors': len(records) - len(ok) - status.get('429', 0),
+        'status': status,
+        'cache_hits': sum(1 for r in ok if r[2]),
+        'wall_seconds': round(wall, 3),
+        'throughput_rps': round(len(ok) / wall, 3) if wall else 0.0,
+        'audio_seconds_per_second': round(len(ok) * seconds / wall, 3) if wall else 0.0,
+        'latency_seconds': summarize(latencies),
+        'real_time_factor': summarize([l / seconds for l in latencies]) if seconds else None,
+    }
+
+
+def start_fake_server(batch_ms, window_ms, threads, cache):
+    """
+    Arrenca api_server dins d'aquest procés amb el model fals, en un port
+    lliure. Retorna (url, carregador). Sense `cache`, la memòria cau de
+    transcripcions es desactiva perquè els àudios repetits no l'encertin.
+    """
+    os.environ.setdefault("ECHOTEXT_STREAM_PORT", "0")
+    os.environ.setdefault("ECHOTEXT_JOBS_DIR", tempfile.mkdtemp(prefix="echotext-loadtest-"))
+    if not cache:
+        os.environ.setdefault("ECHOTEXT_CACHE_SIZE", "0")
+
+    import api_server
+    from waitress import create_server
+    from fake_model import FakeLoader, install
+
+    loader = FakeLoader(batch_ms, window_ms)
+    install(api_server, loader)
+    api_server.startup()
+    if not api_server.model_container.get('ready'):
+        raise RuntimeError(f"El servidor no s'ha pogut iniciar: {api_server.model_container.get('error')}")
+
+    server = create_server(api_server.app, host='127.0.0.1', port=0, threads=threads)
+    threading.Thread(target=server.run, name="waitress", daemon=True).start()
+    return f"http://127.0.0.1:{server.effective_port}", loader
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Prova de càrrega de /transcribe amb àudio sintètic")
+    parser.add_argument("--url", help="Servidor a provar (per defecte, un servidor intern amb el model fals)")
+    parser.add_argument("--signals", default="speech",
+                        help=f"Senyals separats per comes ({', '.join(synthetic_audio.SIGNALS)}; per defecte speech)")
+    parser.add_argument("--durations", default="5,60", help="Durades en segons separades per comes (per defecte 5,60)")
+    parser.add_argument("--formats", default="wav",
+                        help=f"Formats separats per comes ({', '.join(synthetic_audio.FORMATS)}; per defecte wav)")
+    parser.add_argument("--arrival", choices=ARRIVALS, default="closed", help="Patró d'arribada (per defecte closed)")
+    parser.add_argument("--concurrency", type=int, default=8, help="Clients simultanis o peticions en curs (per defecte 8)")
+    parser.add_argument("--rate", type=float, default=10.0, help="Peticions per segon dels patrons oberts (per defecte 10)")
+    parser.add_argument("--requests", type=int, default=100, help="Peticions per escenari (per defecte 100)")
+    parser.add_argument("--warmup", type=int, default=2, help="Peticions prèvies no comptades per escenari (per defecte 2)")
+    parser.add_argument("--variants", type=int, default=16, help="Àudios diferents per escenari (per defecte 16)")
+    parser.add_argument("--language", help="Idioma enviat (per defecte, detecció automàtica)")
+    parser.add_argument("--seed", type=int, default=0, help="Llavor de l'àudio i de les arribades (per defecte 0)")
+    parser.add_argument("--timeout", type=float, default=300.0, help="Temps màxim per petició en segons (per defecte 300)")
+    parser.add_argument("--batch-ms", type=float, default=20.0, help="Model fals: temps fix per lot en ms (per defecte 20)")
+    parser.add_argument("--window-ms", type=float, default=100.0, help="Model fals: temps per finestra de 30 s en ms (per defecte 100)")
+    parser.add_argument("--threads", type=int, default=4, help="Servidor intern: fils de Waitress (per defecte 4, com el servidor)")
+    parser.add_argument("--cache", action="store_true", help="Servidor intern: manté activa la memòria cau de transcripcions")
+    parser.add_argument("--json", help="Desa els resultats en aquest fitxer JSON")
+    args = parser.parse_args()
+
+    loader = None
+    if args.url:
+        url = args.url
+    else:
+        print(f"Iniciant el servidor intern amb el model fals ({args.batch_ms:g} ms per lot, "
+              f"{args.window_ms:g} ms per finestra)...")
+        url, loader = start_fake_server(args.batch_ms, args.window_ms, args.threads, args.cache)
+
+    tester = LoadTest(url, language=args.language, timeout=args.timeout)
+    signals = [s for s in args.signals.split(",") if s]
+    durations = [float(d) for d in args.durations.split(",") if d]
+    formats = [f for f in args.formats.split(",") if f]
+
+    results = []
+    for signal, seconds in itertools.product(signals, durations):
+        audios = [synthetic_audio.generate(signal, seconds, seed=args.seed + i) for i in range(args.variants)]
+        for fmt in formats:
+            payloads = [synthetic_audio.encode(audio, fmt) for audio in audios]
+            print(f"{signal} {seconds:g}s {fmt}: {args.requests} peticions ({args.arrival}, "
+                  f"concurrència {args.concurrency})...")
+            for payload in payloads[:args.warmup]:
+                tester.send(payload, fmt, "loadtest-warmup")
+
+            before = loader.stats() if loader else None
+            records, wall = tester.run(payloads, fmt, args.arrival, args.requests, args.concurrency, args.rate, args.seed)
+            result = {'signal': signal, 'seconds': seconds, 'format': fmt,
+                      'payload_bytes': int(np.mean([len(p) for p in payloads])),
+                      **scenario_result(records, wall, seconds)}
+            if loader:
+                after = loader.stats()
+                batches = after['batches'] - before['batches']
+                windows = after['windows'] - before['windows']
+                result['model'] = {'batches': batches, 'windows': windows,
+                                   'windows_per_batch': round(windows / batches, 2) if batches else 0.0,
+                                   'busy_seconds': round(after['busy_seconds'] - before['busy_seconds'], 3)}
+            results.append(result)
+
+    print(f"\n{'Senyal':<8} {'Durada':>7} {'Format':<6} {'OK':>5} {'429':>4} {'Err':>4} "
+          f"{'p50':>8} {'p95':>8} {'p99':>8} {'Pet/s':>7} {'RTF p50':>8}")
+    for r in results:
+        latency = r['latency_seconds'] or dict.fromkeys(('p50', 'p95', 'p99'), float('nan'))
+        rtf = (r['real_time_factor'] or {}).get('p50', float('nan'))
+        print(f"{r['signal']:<8} {r['seconds']:>6g}s {r['format']:<6} {r['ok']:>5} {r['rejected']:>4} {r['errors']:>4} "
+              f"{latency['p50']:>7.3f}s {latency['p95']:>7.3f}s {latency['p99']:>7.3f}s "
+              f"{r['throughput_rps']:>7.2f} {rtf:>8.3f}")
+
+    if args.json:
+        config = {k: v for k, v in vars(args).items() if k != 'json'}
+        with open(args.json, 'w', encoding='utf-8') as f:
+            json.dump({
+                'date': time.strftime('%Y-%m-%dT%H:%M:%S'),
+                'host': platform.node(),
+                'target': args.url or 'fake',
+                'fake_model': loader.config() if loader else None,
+                'config': config,
+                'results': results,
+            }, f, indent=2)
+        print(f"\nResultats desats a {args.json}")
+
+
+if __name__ == "__main__":
+    main()
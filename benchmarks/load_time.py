@@ -0,0 +1,122 @@
+#!/usr/bin/env python3
+"""
+Temps d'arrencada i memòria amb i sense la memòria cau de pesos mapats.
+
+Per a cada mode (`whisper`: `whisper.load_model`, que deserialitza el
+checkpoint a memòria nova; `mmap`: `lib/weight_cache.py`) llança N
+processos alhora que carreguen el model i fan una transcripció curta per
+tocar tots els pesos. Amb tots en marxa, es mesura la memòria de cadascun:
+el RSS, el PSS (les pàgines compartides repartides entre processos) i la
+part privada, que és el que realment costa cada rèplica més.
+
+Ús:
+    python3 benchmarks/load_time.py [--model turbo] [--processes 2]
+        [--modes whisper,mmap] [--json resultats.json]
+"""
+import os
+import sys
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from lib.venv_activator import activate_venv
+
+if __name__ == "__main__":
+    activate_venv(os.path.join(ROOT, os.path.basename(__file__)))
+
+import argparse
+import json
+import subprocess
+import time
+
+from lib.replica_pool import memory_usage
+
+MODES = ('whisper', 'mmap')
+
+
+def child(model_name, mode):
+    """Procés de mesura: carrega el model, l'escalfa i espera que el pare el tanqui."""
+    import numpy as np
+    import torch
+    import whisper
+    from lib import weight_cache
+
+    start = time.time()
+    if mode == 'whisper':
+        model = whisper.load_model(model_name, device='cpu')
+    else:
+        model = weight_cache.load_model(model_name, device='cpu')
+    load_seconds = time.time() - start
+
+    start = time.time()
+    with torch.inference_mode():
+        model.transcribe(np.zeros(16000, dtype=np.float32), fp16=False, language='ca')
+    warmup_seconds = time.time() - start
+
+    print(json.dumps({'load_seconds': round(load_seconds, 3), 'warmup_seconds': round(warmup_seconds, 3)}), flush=True)
+    sys.stdin.read()
+
+
+def run_mode(model_name, mode, processes):
+    procs = [subprocess.Popen([sys.executable, os.path.abspath(__file__), "--child", mode, "--model", model_name],
+                              stdin=subprocess.PIPE, stdout=subprocess.PIPE, text=True)
+             for _ in range(processes)]
+    try:
+        timings = [json.loads(p.stdout.readline()) for p in procs]
+        memory = [memory_usage(p.pid) or {} for p in procs]
+    finally:
+        for p in procs:
+            p.stdin.close()
+            p.wait()
+
+    def mean(values):
+        return round(sum(values) / len(values), 3) if values else 0.0
+
+    return {
+        'mode': mode,
+        'processes': processes,
+        'load_seconds': mean([t['load_seconds'] for t in timings]),
+        'warmup_seconds': mean([t['warmup_seconds'] for t in timings]),
+        'rss_mb': mean([m.get('rss', 0.0) for m in memory]),
+        'pss_mb': mean([m.get('pss', 0.0) for m in memory]),
+        'private_mb': mean([m.get('private', 0.0) for m in memory]),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Temps d'arrencada i memòria amb i sense pesos mapats")
+    parser.add_argument("--model", default="turbo", help="Model Whisper (per defecte turbo)")
+    parser.add_argument("--processes", type=int, default=2, help="Processos simultanis per mode (per defecte 2)")
+    parser.add_argument("--modes", default=",".join(MODES), help=f"Modes separats per comes ({', '.join(MODES)})")
+    parser.add_argument("--json", help="Desa els resultats en aquest fitxer JSON")
+    parser.add_argument("--child", choices=MODES, help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.child:
+        child(args.model, args.child)
+        return
+
+    modes = [m for m in args.modes.split(",") if m]
+    if 'mmap' in modes:
+        # La primera conversió no compta com a arrencada
+        from lib import weight_cache
+        weight_cache.load_model(args.model, device='cpu')
+
+    results = []
+    for mode in modes:
+        print(f"Mode {mode} ({args.processes} processos)...")
+        results.append(run_mode(args.model, mode, args.processes))
+
+    print(f"\n{'Mode':<8} {'Càrrega':>8} {'Escalfament':>12} {'RSS MB':>8} {'PSS MB':>8} {'Privat MB':>10}")
+    for r in results:
+        print(f"{r['mode']:<8} {r['load_seconds']:>7.2f}s {r['warmup_seconds']:>11.2f}s "
+              f"{r['rss_mb']:>8.1f} {r['pss_mb']:>8.1f} {r['private_mb']:>10.1f}")
+
+    if args.json:
+        with open(args.json, 'w', encoding='utf-8') as f:
+            json.dump({'model': args.model, 'results': results}, f, indent=2)
+        print(f"\nResultats desats a {args.json}")
+
+
+if __name__ == "__main__":
+    main()
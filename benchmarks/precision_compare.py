@@ -0,0 +1,161 @@
+#!/usr/bin/env python3
+"""
+Comparativa de precisió contra velocitat dels modes d'inferència (fp32, bf16, int8).
+
+Transcriu un conjunt d'àudios de referència amb cada mode i en mesura el
+temps de càrrega, la mida del model, la memòria resident, el factor sobre
+temps real i la taxa d'error de paraules (WER). Si al costat de cada àudio
+hi ha un `.txt` amb la transcripció correcta, el WER es calcula contra
+aquest text; si no, contra la sortida del primer mode (normalment fp32).
+
+Ús:
+    python3 benchmarks/precision_compare.py DIRECTORI [--model turbo]
+        [--precisions fp32,bf16,int8] [--language ca] [--json resultats.json]
+"""
+import os
+import sys
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from lib.venv_activator import activate_venv
+
+if __name__ == "__main__":
+    activate_venv(os.path.join(ROOT, os.path.basename(__file__)))
+
+import argparse
+import gc
+import json
+import re
+import time
+
+import whisper
+
+from lib.model_loader import PRECISIONS, inference_context, load_model
+from lib.model_registry import model_size_mb
+from lib.replica_pool import memory_usage
+
+AUDIO_EXTENSIONS = ('.wav', '.mp3', '.flac', '.ogg', '.m4a', '.webm')
+
+
+def normalize(text):
+    """Minúscules i sense puntuació (es conserven apòstrofs i punts volats)."""
+    return re.sub(r"[^\w'·]+", " ", text.lower()).split()
+
+
+def word_errors(reference, hypothesis):
+    """Distància d'edició en paraules entre dues llistes de paraules."""
+    previous = list(range(len(hypothesis) + 1))
+    for i, ref_word in enumerate(reference, 1):
+        current = [i] + [0] * len(hypothesis)
+        for j, hyp_word in enumerate(hypothesis, 1):
+            current[j] = min(previous[j] + 1, current[j - 1] + 1, previous[j - 1] + (ref_word != hyp_word))
+        previous = current
+    return previous[-1]
+
+
+def word_error_rate(references, hypotheses):
+    """WER agregat sobre tot el conjunt (errors totals / paraules de referència)."""
+    errors = words = 0
+    for reference, hypothesis in zip(references, hypotheses):
+        ref, hyp = normalize(reference), normalize(hypothesis)
+        errors += word_errors(ref, hyp)
+        words += len(ref)
+    return errors / words if words else 0.0
+
+
+def reference_set(directory):
+    """Llista de (àudio, text de referència o None)."""
+    items = []
+    for name in sorted(os.listdir(directory)):
+        path = os.path.join(directory, name)
+        if os.path.splitext(name)[1].lower() not in AUDIO_EXTENSIONS:
+            continue
+        txt = os.path.splitext(path)[0] + ".txt"
+        reference = None
+        if os.path.exists(txt):
+            with open(txt, 'r', encoding='utf-8') as f:
+                reference = f.read().strip()
+        items.append((path, reference))
+    return items
+
+
+def run_precision(model_name, precision, audios, language):
+    gc.collect()
+    rss_before = (memory_usage() or {}).get('rss', 0.0)
+    start = time.time()
+    model = load_model(model_name, precision=precision)
+    load_seconds = time.time() - start
+    rss_after = (memory_usage() or {}).get('rss', 0.0)
+
+    texts = []
+    compute = 0.0
+    for audio in audios:
+        start = time.perf_counter()
+        with inference_context(model):
+            result = model.transcribe(audio, fp16=False, language=language)
+        compute += time.perf_counter() - start
+        texts.append(result["text"].strip())
+
+    stats = {
+        'precision': precision,
+        'effective_precision': model.precision,
+        'load_seconds': round(load_seconds, 2),
+        'model_mb': round(model_size_mb(model), 1),
+        'rss_delta_mb': round(rss_after - rss_before, 1),
+        'compute_seconds': round(compute, 2),
+    }
+    del model
+    gc.collect()
+    return stats, texts
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Comparativa de precisió contra velocitat dels modes d'inferència")
+    parser.add_argument("directory", help="Directori amb els àudios de referència (i, opcionalment, un .txt per àudio)")
+    parser.add_argument("--model", default="turbo", help="Model Whisper (per defecte turbo)")
+    parser.add_argument("--precisions", default=",".join(PRECISIONS),
+                        help=f"Modes a comparar, separats per comes (per defecte {','.join(PRECISIONS)})")
+    parser.add_argument("--language", default="ca", help="Idioma de l'àudio (per defecte ca)")
+    parser.add_argument("--json", help="Desa els resultats en aquest fitxer JSON")
+    args = parser.parse_args()
+
+    items = reference_set(args.directory)
+    if not items:
+        print(f"No s'han trobat àudios a {args.directory}")
+        sys.exit(1)
+
+    audios = [whisper.load_audio(path) for path, _ in items]
+    audio_seconds = sum(len(a) for a in audios) / whisper.audio.SAMPLE_RATE
+    has_references = all(reference is not None for _, reference in items)
+    print(f"{len(items)} àudios, {audio_seconds:.1f}s en total. "
+          f"WER contra {'les transcripcions de referència' if has_references else 'el primer mode'}.")
+
+    results = []
+    baseline = None
+    for precision in [p.strip() for p in args.precisions.split(",") if p.strip()]:
+        print(f"\nMode {precision}...")
+        stats, texts = run_precision(args.model, precision, audios, args.language)
+        if baseline is None:
+            baseline = {'texts': texts, 'compute': stats['compute_seconds']}
+        references = [r for _, r in items] if has_references else baseline['texts']
+        stats['rtf'] = round(stats['compute_seconds'] / audio_seconds, 3) if audio_seconds else None
+        stats['speedup'] = round(baseline['compute'] / stats['compute_seconds'], 2) if stats['compute_seconds'] else None
+        stats['wer'] = round(word_error_rate(references, texts), 4)
+        stats['texts'] = texts
+        results.append(stats)
+
+    print(f"\n{'Mode':<6} {'Efectiu':<8} {'Càrrega':>8} {'Model MB':>9} {'ΔRSS MB':>8} {'RTF':>7} {'Acceler.':>9} {'WER':>7}")
+    for r in results:
+        print(f"{r['precision']:<6} {r['effective_precision']:<8} {r['load_seconds']:>7.2f}s {r['model_mb']:>9.1f} "
+              f"{r['rss_delta_mb']:>8.1f} {r['rtf']:>7.3f} {r['speedup']:>8.2f}x {r['wer'] * 100:>6.2f}%")
+
+    if args.json:
+        with open(args.json, 'w', encoding='utf-8') as f:
+            json.dump({'model': args.model, 'audio_seconds': round(audio_seconds, 2),
+                       'files': [path for path, _ in items], 'results': results}, f, ensure_ascii=False, indent=2)
+        print(f"\nResultats desats a {args.json}")
+
+
+if __name__ == "__main__":
+    main()
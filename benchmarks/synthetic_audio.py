@@ -0,0 +1,172 @@
+#!/usr/bin/env python3
+"""
+Àudio sintètic reproduïble per a les proves de càrrega.
+
+Genera senyals de qualsevol durada a 16 kHz sense cap fitxer de referència
+ni síntesi de veu: `speech` (síl·labes sonores amb to i formants de vocal,
+fricatives i pauses entre paraules, que el VAD tracta com a veu), `tone`
+(tons purs), `noise` (soroll blanc feble) i `silence`. La mateixa llavor
+dona sempre el mateix àudio. Els formats són els d'enviament dels clients
+(`lib/audio_encoding.py`: wav, flac i pcm) i, si hi ha ffmpeg, mp3 i ogg,
+que el servidor descodifica amb ffmpeg.
+
+Ús:
+    python3 benchmarks/synthetic_audio.py DIRECTORI [--signals speech,tone,noise,silence]
+        [--durations 5,30,120] [--formats wav,flac] [--seed 0]
+"""
+import os
+import sys
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from lib.venv_activator import activate_venv
+
+if __name__ == "__main__":
+    activate_venv(os.path.join(ROOT, os.path.basename(__file__)))
+
+import argparse
+import shutil
+import subprocess
+
+import numpy as np
+
+from lib.audio_decode import SAMPLE_RATE
+from lib.audio_encoding import MIMETYPES, WIRE_FORMATS, encode_chunk, to_int16
+
+SIGNALS = ('speech', 'tone', 'noise', 'silence')
+FFMPEG_FORMATS = {'mp3': 'audio/mpeg', 'ogg': 'audio/ogg'}
+FORMATS = WIRE_FORMATS + tuple(FFMPEG_FORMATS)
+
+# Formants (F1, F2, F3 en Hz) de les vocals del català
+_VOWELS = np.array([
+    (750, 1350, 2500),   # a
+    (450, 1900, 2600),   # e
+    (300, 2200, 2900),   # i
+    (480, 900, 2450),    # o
+    (320, 800, 2350),    # u
+    (500, 1500, 2500),   # ə
+])
+_FORMANT_BANDWIDTH = 90.0
+
+
+def _syllable(rng, seconds, sample_rate):
+    """Una síl·laba sonora: to amb entonació, harmònics ponderats pels formants d'una vocal i envolupant."""
+    n = int(seconds * sample_rate)
+    t = np.arange(n) / sample_rate
+    f0 = rng.uniform(100, 220) * (1 + 0.08 * np.sin(2 * np.pi * rng.uniform(2, 5) * t))
+    phase = 2 * np.pi * np.cumsum(f0) / sample_rate
+
+    formants = _VOWELS[rng.integers(len(_VOWELS))]
+    harmonics = np.arange(1, int(4000 // f0.mean()) + 1)
+    freqs = harmonics * f0.mean()
+    weights = (1.0 / (1.0 + ((freqs[:, None] - formants[None, :]) / _FORMANT_BANDWIDTH) ** 2)).sum(axis=1)
+    weights /= harmonics  # Caiguda espectral de la font glotal
+
+    voiced = (weights[:, None] * np.sin(harmonics[:, None] * phase[None, :])).sum(axis=0)
+    envelope = np.sin(np.pi * np.arange(n) / n) ** 0.5
+    return (voiced / np.abs(voiced).max() * envelope).astype(np.float32)
+
+
+def _fricative(rng, seconds, sample_rate):
+    """Consonant fricativa: soroll amb l'energia a les freqüències altes."""
+    noise = rng.standard_normal(int(seconds * sample_rate))
+    noise = np.diff(noise, prepend=0.0)
+    return (0.3 * noise / np.abs(noise).max() * np.hanning(len(noise))).astype(np.float32)
+
+
+def speech(seconds, seed=0, sample_rate=SAMPLE_RATE):
+    """
+    Senyal amb l'estructura temporal i espectral de la parla: paraules d'1
+    a 4 síl·labes (unes 4 per segon) separades per pauses curtes, i de tant
+    en tant un silenci llarg com els que el VAD retalla.
+    """
+    rng = np.random.default_rng(seed)
+    total = int(seconds * sample_rate)
+    out = np.zeros(total, dtype=np.float32)
+    pos = int(rng.uniform(0.1, 0.4) * sample_rate)
+    while pos < total:
+        for _ in range(rng.integers(1, 5)):
+            if rng.random() < 0.3:
+                piece = _fricative(rng, rng.uniform(0.05, 0.12), sample_rate)
+            else:
+                piece = _syllable(rng, rng.uniform(0.12, 0.28), sample_rate)
+            end = min(pos + len(piece), total)
+            out[pos:end] = piece[:end - pos] * rng.uniform(0.2, 0.5)
+            pos = end
+        pause = rng.uniform(1.0, 2.5) if rng.random() < 0.1 else rng.uniform(0.08, 0.3)
+        pos += int(pause * sample_rate)
+    return out
+
+
+def tone(seconds, seed=0, sample_rate=SAMPLE_RATE):
+    """Dos tons purs (un de fonamental i la seva octava) amb una modulació d'amplitud lenta."""
+    rng = np.random.default_rng(seed)
+    t = np.arange(int(seconds * sample_rate)) / sample_rate
+    f = rng.uniform(200, 600)
+    audio = np.sin(2 * np.pi * f * t) + 0.5 * np.sin(2 * np.pi * 2 * f * t)
+    audio *= 0.2 * (1 + 0.5 * np.sin(2 * np.pi * 0.5 * t))
+    return audio.astype(np.float32)
+
+
+def noise(seconds, seed=0, sample_rate=SAMPLE_RATE):
+    """Soroll blanc gaussià feble, com el de fons d'un micròfon."""
+    rng = np.random.default_rng(seed)
+    return (0.02 * rng.standard_normal(int(seconds * sample_rate))).astype(np.float32)
+
+
+def silence(seconds, seed=0, sample_rate=SAMPLE_RATE):
+    return np.zeros(int(seconds * sample_rate), dtype=np.float32)
+
+
+_GENERATORS = {'speech': speech, 'tone': tone, 'noise': noise, 'silence': silence}
+
+
+def generate(signal, seconds, seed=0, sample_rate=SAMPLE_RATE):
+    """Àudio float32 mono del tipus `signal`, sempre igual per a la mateixa llavor."""
+    if signal not in _GENERATORS:
+        raise ValueError(f"Senyal desconegut: {signal}. Opcions: {', '.join(SIGNALS)}")
+    return _GENERATORS[signal](seconds, seed, sample_rate)
+
+
+def mimetype(fmt):
+    return MIMETYPES.get(fmt) or FFMPEG_FORMATS[fmt]
+
+
+def encode(audio, fmt, sample_rate=SAMPLE_RATE):
+    """Codifica l'àudio en memòria. mp3 i ogg necessiten ffmpeg."""
+    if fmt not in FFMPEG_FORMATS:
+        return encode_chunk(audio, sample_rate, fmt)
+    if shutil.which('ffmpeg') is None:
+        raise RuntimeError(f"Cal ffmpeg per generar àudio en format {fmt}")
+    codec = ['-c:a', 'libmp3lame'] if fmt == 'mp3' else ['-c:a', 'libvorbis']
+    result = subprocess.run(
+        ['ffmpeg', '-nostdin', '-loglevel', 'error', '-f', 's16le', '-ar', str(sample_rate), '-ac', '1',
+         '-i', 'pipe:0', *codec, '-f', fmt, 'pipe:1'],
+        input=to_int16(audio).tobytes(), capture_output=True, check=True)
+    return result.stdout
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Genera àudio sintètic reproduïble")
+    parser.add_argument("directory", help="Directori de sortida")
+    parser.add_argument("--signals", default=",".join(SIGNALS), help=f"Senyals separats per comes ({', '.join(SIGNALS)})")
+    parser.add_argument("--durations", default="5,30,120", help="Durades en segons separades per comes (per defecte 5,30,120)")
+    parser.add_argument("--formats", default="wav", help=f"Formats separats per comes ({', '.join(FORMATS)})")
+    parser.add_argument("--seed", type=int, default=0, help="Llavor del generador (per defecte 0)")
+    args = parser.parse_args()
+
+    os.makedirs(args.directory, exist_ok=True)
+    for signal in args.signals.split(","):
+        for seconds in [float(d) for d in args.durations.split(",")]:
+            audio = generate(signal, seconds, args.seed)
+            for fmt in args.formats.split(","):
+                data = encode(audio, fmt)
+                path = os.path.join(args.directory, f"{signal}_{seconds:g}s.{fmt}")
+                with open(path, 'wb') as f:
+                    f.write(data)
+                print(path)
+
+
+if __name__ == "__main__":
+    main()
@@ -9,15 +9,27 @@ if __name__ == "__main__":
 
 # Importacions que requereixen el venv
 import requests
-import threading
-import queue
-import sounddevice as sd
-import numpy as np
-import scipy.io.wavfile as wav
-import tempfile
+import time
 import pyperclip
 import webbrowser
 from lib import voice_commands
+from lib.action_executor import ActionExecutor
+from lib.client import CLIENT_ID, negotiate_upload, parse_upload_options, record_chunks, request_fields, transcribe_chunk, transcribe_url
+from lib.capture import AudioRing
+from lib.endpointer import Endpointer
+from lib.wake_word import WakeWordDetector
+
+# Les ordres són frases curtes: un model petit és suficient i molt més barat per al servidor
+COMMAND_MODEL = "small"
+
+# Segons que s'escolta l'ordre després de detectar la paraula clau localment
+COMMAND_TIMEOUT = 8
+
+# Veu mínima després de la paraula clau perquè el fragment pugui contenir l'ordre
+MIN_COMMAND_SECONDS = 0.4
+
+# Mostres de la paraula clau que es demanen en enregistrar-la
+ENROLL_SAMPLES = 3
 
 def print_help():
     """Mostra la informació d'ajuda del programa."""
@@ -30,6 +42,13 @@ def print_help():
     print("  ARXIU_AUDIO    (Opcional) Camí a un arxiu .wav per transcriure.")
     print("  IP_SERVIDOR    (Opcional) IP o hostname del servidor (defecte: localhost).")
     print("\nOpcions:")
+    print("  --format FMT   Format d'enviament dels fragments: flac, wav (int16) o pcm (defecte: flac si es pot).")
+    print("  --in-flight N  Fragments que es poden estar enviant alhora (defecte: 2).")
+    print("  --policy POL   Si el servidor no dona l'abast: merge (ajunta fragments) o drop (descarta el més antic).")
+    print("  --fixed        Envia fragments fixos de 5 segons en lloc de tallar a cada pausa.")
+    print("  --mel          Calcula el log-mel localment i l'envia en lloc de l'àudio.")
+    print("  --enroll       Enregistra la paraula clau per detectar-la localment i surt.")
+    print("  --server-wake  Envia tot l'àudio i busca la paraula clau a la transcripció del servidor.")
     print("  -h, --help     Mostra aquesta ajuda.")
     print("\nOrdres de veu (després de dir 'Hola'):")
     print("  'terminal'     Obre una nova finestra de terminal.")
@@ -42,108 +61,136 @@ def print_help():
     print("  'dia'          Diu la data d'avui.")
     print("="*30)
 
-def record_audio(server_url, fs=16000, chunk_duration=5):
-    """Enregistra àudio i envia fragments al servidor cada 5 segons."""
+def enroll_wake_word(fs=16000, samples=ENROLL_SAMPLES):
+    """Enregistra unes quantes mostres de la paraula clau i desa el detector local."""
+    print("\n--- Enregistrament de la paraula clau ---")
+    print(f"Diràs 'Hola' {samples} vegades, amb una pausa després de cada una.")
+    print("Prem 'ENTER' per començar...")
+    input()
+
+    ring = AudioRing(10, fs)
+    endpointer = Endpointer(ring, min_chunk=0.3, max_chunk=3.0)
+    recordings = []
+    with ring.input_stream():
+        while len(recordings) < samples:
+            print(f"Digues 'Hola' ({len(recordings) + 1}/{samples})...")
+            chunks = []
+            while not chunks:
+                chunks = endpointer.next_chunks(timeout=0.1)
+            recordings.append(chunks[0].reshape(-1))
+            print("✓")
+
+    detector = WakeWordDetector.enroll(recordings)
+    detector.save()
+    print(f"Paraula clau desada (llindar {detector.threshold:.2f}).")
+
+
+def record_audio(server_url, fs=16000, chunk_duration=5, n_mels=None, encoding='wav',
+                 max_in_flight=2, policy='merge', endpointing=True, wake_detector=None):
+    """
+    Enregistra àudio i envia al servidor cada frase quan es detecta una
+    pausa (o, sense `endpointing`, fragments fixos de `chunk_duration`
+    segons) en el format `encoding`. Amb `n_mels`, cada fragment s'envia
+    com a log-mel calculat localment. Els fragments s'envien en segon pla
+    (fins a `max_in_flight` alhora) mentre es continua escoltant; si el
+    servidor no dona l'abast, s'ajunten o es descarten segons `policy`.
+    Amb `wake_detector`, la paraula clau es detecta localment i només
+    s'envia l'àudio que la segueix durant `COMMAND_TIMEOUT` segons. Les
+    ordres s'executen en segon pla (`ActionExecutor`), sense aturar la
+    captura.
+    """
     print("\n--- Enregistrament amb ordres de veu ---")
     print("Paraula clau: 'Hola'")
     print("Prem 'ENTER' per començar a escoltar...")
     input()
-    print(f"Escoltant... Transcripció cada {chunk_duration}s. Prem 'ENTER' per aturar.")
+    cadence = "a cada pausa" if endpointing else f"cada {chunk_duration}s"
+    print(f"Escoltant... Transcripció {cadence}. Prem 'ENTER' per aturar.")
 
-    q = queue.Queue()
-    stop_event = threading.Event()
-    
-    def callback(indata, frames, time, status):
-        if status:
-            print(status, file=sys.stderr)
-        q.put(indata.copy())
+    def send(session, np_audio):
+        return transcribe_chunk(np_audio, server_url, fs, n_mels, encoding, session, fields)
+
+    def admit(np_audio):
+        # Amb el detector local, només s'envia l'àudio posterior a la paraula clau
+        nonlocal awake_until
+        if wake_detector is None:
+            return True
+        now = time.monotonic()
+        if now < awake_until:
+            return True
+        detected, _, end = wake_detector.detect(np_audio)
+        if not detected:
+            return False
+        print("\n>>> Paraula clau 'Hola' detectada!")
+        awake_until = now + COMMAND_TIMEOUT
+        if len(np_audio) - end < MIN_COMMAND_SECONDS * fs:
+            # Només hi ha la paraula clau: no cal esperar el servidor per respondre
+            executor.say("Hola, amb què puc ajudar?")
+            return False
+        return True
+
+    def handle(texts, final):
+        # Els textos arriben en ordre de gravació i es processen en aquest fil
+        nonlocal waiting_for_command, awake_until
+        for partial_text in texts:
+            print(f"\n[Escoltat]: {partial_text}")
+            text_lower = partial_text.lower()
+            
+            # Amb la paraula clau detectada localment, tot el que arriba pot ser l'ordre
+            if wake_detector is not None:
+                if voice_commands.process_command(text_lower, executor):
+                    awake_until = 0
+
+            # Detecció de la paraula clau "Hola"
+            elif "hola" in text_lower:
+                print(">>> Paraula clau 'Hola' detectada!")
+                waiting_for_command = True
+                
+                # Comprovar si l'ordre està en el mateix fragment
+                if voice_commands.process_command(text_lower, executor):
+                    waiting_for_command = False
+                else:
+                    executor.say("Hola, amb què puc ajudar?")
+            
+            # Si ja havíem dit Hola, busquem l'ordre
+            elif waiting_for_command:
+                if voice_commands.process_command(text_lower, executor):
+                    waiting_for_command = False
+
+            full_transcription.append(partial_text)
+            
+            # Actualitzar portapapers amb el que portem
+            current_text = " ".join(full_transcription)
+            try:
+                pyperclip.copy(current_text)
+            except:
+                pass
 
-    def input_listener():
-        input()
-        stop_event.set()
+    def report(results):
+        # Resultats de les ordres executades en segon pla
+        for result in results:
+            if not result.ok:
+                print(f"\nError executant l'ordre '{result.command.label}': {result.error}")
+            if result.exit:
+                # L'ordre demana aturar l'script (p. ex. en apagar l'ordinador)
+                sys.exit(0)
 
-    input_thread = threading.Thread(target=input_listener)
-    input_thread.start()
+    def poll():
+        nonlocal awake_until
+        report(executor.events())
+        if awake_until and time.monotonic() >= awake_until:
+            print("\nNo s'ha rebut cap ordre. Torna a dir la paraula clau.")
+            awake_until = 0
 
-    audio_buffer = []
+    fields = request_fields(model=COMMAND_MODEL)
     full_transcription = []
     waiting_for_command = False
-    
-    try:
-        with sd.InputStream(samplerate=fs, channels=1, callback=callback):
-            while not stop_event.is_set():
-                try:
-                    data = q.get(timeout=0.1)
-                    audio_buffer.append(data)
-                except queue.Empty:
-                    continue
-
-                total_samples = sum(len(c) for c in audio_buffer)
-                
-                if total_samples >= fs * chunk_duration:
-                    print(".", end="", flush=True)
-                    
-                    np_audio = np.concatenate(audio_buffer, axis=0)
-                    audio_buffer = []
-                    
-                    # Enviar fragment al servidor
-                    with tempfile.NamedTemporaryFile(delete=True, suffix=".wav") as temp:
-                        wav.write(temp.name, fs, np_audio)
-                        partial_text = transcribe_file(temp.name, server_url, print_header=False)
-                        
-                        if partial_text:
-                            print(f"\n[Escoltat]: {partial_text}")
-                            text_lower = partial_text.lower()
-                            
-                            # Detecció de la paraula clau "Hola"
-                            if "hola" in text_lower:
-                                print(">>> Paraula clau 'Hola' detectada!")
-                                waiting_for_command = True
-                                
-                                # Comprovar si l'ordre està en el mateix fragment
-                                if voice_commands.process_command(text_lower):
-                                    waiting_for_command = False
-                                else:
-                                    os.system('echovoice "Hola, amb què puc ajudar?"')
-                            
-                            # Si ja havíem dit Hola, busquem l'ordre
-                            elif waiting_for_command:
-                                if voice_commands.process_command(text_lower):
-                                    waiting_for_command = False
-
-                            full_transcription.append(partial_text)
-                            
-                            # Actualitzar portapapers amb el que portem
-                            current_text = " ".join(full_transcription)
-                            try:
-                                pyperclip.copy(current_text)
-                            except:
-                                pass
-
-            # Processar l'últim fragment
-            if audio_buffer:
-                print("\nProcessant l'últim fragment...")
-                np_audio = np.concatenate(audio_buffer, axis=0)
-                with tempfile.NamedTemporaryFile(delete=True, suffix=".wav") as temp:
-                    wav.write(temp.name, fs, np_audio)
-                    partial_text = transcribe_file(temp.name, server_url, print_header=False)
-                    if partial_text:
-                        print(f"[Final]: {partial_text}")
-                        text_lower = partial_text.lower()
-                        
-                        if "hola" in text_lower:
-                            if not voice_commands.process_command(text_lower):
-                                os.system('echovoice "Hola, amb què puc ajudar?"')
-                        elif waiting_for_command:
-                             voice_commands.process_command(text_lower)
-                            
-                        full_transcription.append(partial_text)
+    awake_until = 0
+    executor = ActionExecutor()
 
-    except Exception as e:
-        print(f"\nError durant l'enregistrament: {e}")
+    try:
+        record_chunks(send, handle, fs, chunk_duration, max_in_flight, policy, endpointing, admit, poll)
     finally:
-        if input_thread.is_alive():
-            print("Prem ENTER per finalitzar si s'ha quedat esperant.")
+        report(executor.close())
 
     return " ".join(full_transcription)
 
@@ -159,8 +206,8 @@ def transcribe_file(filepath, server_url="http://localhost:5000/transcribe", pri
     try:
         with open(filepath, 'rb') as f:
             files = {'file': f}
-            data = {'language': 'ca'} # Pots canviar l'idioma aquí
-            response = requests.post(server_url, files=files, data=data)
+            data = {'language': 'ca', 'model': COMMAND_MODEL} # Pots canviar l'idioma aquí
+            response = requests.post(server_url, files=files, data=data, headers={'X-Client-Id': CLIENT_ID})
             
         if response.status_code == 200:
             result = response.json()
@@ -217,24 +264,16 @@ if __name__ == "__main__":
         print_help()
         sys.exit(0)
 
-    server = "localhost"
-    if len(sys.argv) > 2:
-        server = sys.argv[2]
-    elif len(sys.argv) == 2 and not os.path.exists(sys.argv[1]):
-        # Si només hi ha un paràmetre i no és un fitxer, assumim que és la IP del servidor
-        server = sys.argv[1]
-        
-    if server.startswith("http://") or server.startswith("https://"):
-         url = server
-         if not url.endswith("/transcribe"):
-             if url.endswith("/"):
-                 url += "transcribe"
-             else:
-                 url += "/transcribe"
-    elif ":" in server:
-         url = f"http://{server}/transcribe"
-    else:
-         url = f"http://{server}:5000/transcribe"
+    if "--enroll" in sys.argv:
+        enroll_wake_word()
+        sys.exit(0)
+
+    server_wake = "--server-wake" in sys.argv
+    if server_wake:
+        sys.argv.remove("--server-wake")
+
+    options = parse_upload_options(sys.argv)
+    url = transcribe_url(sys.argv)
 
     if len(sys.argv) >= 2 and os.path.exists(sys.argv[1]):
         audio_file = sys.argv[1]
@@ -245,7 +284,15 @@ if __name__ == "__main__":
             open_web_speech_api(url)
             sys.exit(1)
             
-        final_text = record_audio(url)
+        n_mels, encoding = negotiate_upload(url, options['wire_format'], options['mel_mode'], COMMAND_MODEL)
+        wake_detector = None
+        if not server_wake:
+            wake_detector = WakeWordDetector.load()
+            if wake_detector is None:
+                print("Avís: no hi ha cap paraula clau enregistrada (--enroll). Es buscarà a la transcripció del servidor.")
+        final_text = record_audio(url, n_mels=n_mels, encoding=encoding,
+                                  max_in_flight=options['max_in_flight'], policy=options['policy'],
+                                  endpointing=options['endpointing'], wake_detector=wake_detector)
         
         if final_text:
             print("\n" + "="*30)
@@ -10,13 +10,15 @@ if __name__ == "__main__":
 # Importacions que requereixen el venv
 import requests
 import threading
-import queue
-import sounddevice as sd
-import numpy as np
-import scipy.io.wavfile as wav
-import tempfile
 import pyperclip
 import webbrowser
+from lib.client import CLIENT_ID, negotiate_upload, parse_upload_options, record_chunks, request_fields, transcribe_chunk, transcribe_url
+from lib.capture import AudioRing
+import json
+from urllib.parse import urlparse
+
+# Àudio que es pot acumular en streaming si la connexió va endarrerida
+STREAM_BUFFER_SECONDS = 10
 
 def print_help():
     """Mostra la informació d'ajuda del programa."""
@@ -29,81 +31,116 @@ def print_help():
     print("  ARXIU_AUDIO    (Opcional) Camí a un arxiu .wav per transcriure.")
     print("  IP_SERVIDOR    (Opcional) IP o hostname del servidor (defecte: localhost).")
     print("\nOpcions:")
+    print("  --stream       Transcripció en streaming pel WebSocket del servidor (port 5001).")
+    print("  --format FMT   Format d'enviament dels fragments: flac, wav (int16) o pcm (defecte: flac si es pot).")
+    print("  --in-flight N  Fragments que es poden estar enviant alhora (defecte: 2).")
+    print("  --policy POL   Si el servidor no dona l'abast: merge (ajunta fragments) o drop (descarta el més antic).")
+    print("  --fixed        Envia fragments fixos de 5 segons en lloc de tallar a cada pausa.")
+    print("  --mel          Calcula el log-mel localment i l'envia en lloc de l'àudio.")
     print("  -h, --help     Mostra aquesta ajuda.")
     print("="*30)
 
 
-def record_audio(server_url, fs=16000, chunk_duration=5):
-    """Enregistra àudio i envia fragments al servidor cada 5 segons."""
+def record_audio(server_url, fs=16000, chunk_duration=5, n_mels=None, encoding='wav',
+                 max_in_flight=2, policy='merge', endpointing=True):
+    """
+    Enregistra àudio i envia al servidor cada frase quan es detecta una
+    pausa (o, sense `endpointing`, fragments fixos de `chunk_duration`
+    segons) en el format `encoding`. Amb `n_mels`, cada fragment s'envia
+    com a log-mel calculat localment. Els fragments s'envien en segon pla
+    (fins a `max_in_flight` alhora) mentre es continua gravant; si el
+    servidor no dona l'abast, s'ajunten o es descarten segons `policy`.
+    """
     print("\n--- Enregistrament de veu (quasi temps-real) ---")
     print("Prem 'ENTER' per començar a enregistrar...")
     input()
-    print(f"Enregistrant... Transcripció cada {chunk_duration}s. Prem 'ENTER' per aturar.")
+    cadence = "a cada pausa" if endpointing else f"cada {chunk_duration}s"
+    print(f"Enregistrant... Transcripció {cadence}. Prem 'ENTER' per aturar.")
+
+    fields = request_fields()
+    full_transcription = []
+
+    def send(session, np_audio):
+        return transcribe_chunk(np_audio, server_url, fs, n_mels, encoding, session, fields)
+
+    def show(texts, final):
+        label = "Final" if final else "Chunk"
+        for partial_text in texts:
+            print(f"\n[{label}]: {partial_text}")
+            full_transcription.append(partial_text)
+
+            # Actualitzar portapapers amb el que portem
+            current_text = " ".join(full_transcription)
+            try:
+                pyperclip.copy(current_text)
+            except:
+                pass
+
+    record_chunks(send, show, fs, chunk_duration, max_in_flight, policy, endpointing)
+
+    return " ".join(full_transcription)
+
+
+def stream_audio(ws_url, fs=16000, frame_duration=0.1, language='ca'):
+    """Envia l'àudio del micròfon en streaming i mostra els parcials i finals que retorna el servidor."""
+    from websockets.sync.client import connect
+
+    print("\n--- Enregistrament de veu (streaming) ---")
+    print("Prem 'ENTER' per començar a enregistrar...")
+    input()
+    print("Enregistrant en streaming... Prem 'ENTER' per aturar.")
 
-    q = queue.Queue()
+    ring = AudioRing(STREAM_BUFFER_SECONDS, fs, dtype='int16')
+    frame_samples = int(fs * frame_duration)
     stop_event = threading.Event()
-    
-    def callback(indata, frames, time, status):
-        if status:
-            print(status, file=sys.stderr)
-        q.put(indata.copy())
+    full_transcription = []
 
     def input_listener():
         input()
         stop_event.set()
 
+    def receiver(ws):
+        for message in ws:
+            event = json.loads(message)
+            if event['type'] == 'partial':
+                print(f"\r[Parcial]: {event['text']}", end="", flush=True)
+            elif event['type'] == 'final' and event['text']:
+                print(f"\n[Final]: {event['text']}")
+                full_transcription.append(event['text'])
+                try:
+                    pyperclip.copy(" ".join(full_transcription))
+                except:
+                    pass
+            elif event['type'] == 'error':
+                print(f"\nError del servidor: {event['error']}")
+            elif event['type'] == 'end':
+                break
+
     input_thread = threading.Thread(target=input_listener)
     input_thread.start()
 
-    audio_buffer = []
-    full_transcription = []
-    
     try:
-        with sd.InputStream(samplerate=fs, channels=1, callback=callback):
-            while not stop_event.is_set():
-                try:
-                    data = q.get(timeout=0.1)
-                    audio_buffer.append(data)
-                except queue.Empty:
-                    continue
+        with connect(f"{ws_url}?language={language}&sample_rate={fs}&format=s16le", compression=None) as ws:
+            json.loads(ws.recv())  # Missatge inicial amb l'identificador de sessió
+            recv_thread = threading.Thread(target=receiver, args=(ws,))
+            recv_thread.start()
 
-                total_samples = sum(len(c) for c in audio_buffer)
-                
-                if total_samples >= fs * chunk_duration:
-                    print(".", end="", flush=True)
-                    
-                    np_audio = np.concatenate(audio_buffer, axis=0)
-                    audio_buffer = []
-                    
-                    # Enviar fragment al servidor
-                    with tempfile.NamedTemporaryFile(delete=True, suffix=".wav") as temp:
-                        wav.write(temp.name, fs, np_audio)
-                        partial_text = transcribe_file(temp.name, server_url, print_header=False)
-                        
-                        if partial_text:
-                            print(f"\n[Chunk]: {partial_text}")
-                            full_transcription.append(partial_text)
-                            
-                            # Actualitzar portapapers amb el que portem
-                            current_text = " ".join(full_transcription)
-                            try:
-                                pyperclip.copy(current_text)
-                            except:
-                                pass
-
-            # Processar l'últim fragment
-            if audio_buffer:
-                print("\nProcessant l'últim fragment...")
-                np_audio = np.concatenate(audio_buffer, axis=0)
-                with tempfile.NamedTemporaryFile(delete=True, suffix=".wav") as temp:
-                    wav.write(temp.name, fs, np_audio)
-                    partial_text = transcribe_file(temp.name, server_url, print_header=False)
-                    if partial_text:
-                        print(f"[Final]: {partial_text}")
-                        full_transcription.append(partial_text)
+            with ring.input_stream(blocksize=frame_samples):
+                while not stop_event.is_set():
+                    if not ring.wait(frame_samples, timeout=0.1):
+                        continue
+                    # `tobytes` ja en fa la còpia: la finestra es pot alliberar de seguida
+                    ws.send(ring.window(frame_samples).tobytes())
+                    ring.consume(frame_samples)
+
+            # Enviar l'àudio que quedi i tancar la sessió
+            if ring.available():
+                ws.send(ring.read().tobytes())
+            ws.send(json.dumps({'type': 'end'}))
+            recv_thread.join()
 
     except Exception as e:
-        print(f"\nError durant l'enregistrament: {e}")
+        print(f"\nError durant el streaming: {e}")
     finally:
         if input_thread.is_alive():
             print("Prem ENTER per finalitzar si s'ha quedat esperant.")
@@ -123,7 +160,7 @@ def transcribe_file(filepath, server_url="http://localhost:5000/transcribe", pri
         with open(filepath, 'rb') as f:
             files = {'file': f}
             data = {'language': 'ca'} # Pots canviar l'idioma aquí
-            response = requests.post(server_url, files=files, data=data)
+            response = requests.post(server_url, files=files, data=data, headers={'X-Client-Id': CLIENT_ID})
             
         if response.status_code == 200:
             result = response.json()
@@ -180,24 +217,12 @@ if __name__ == "__main__":
         print_help()
         sys.exit(0)
 
-    server = "localhost"
-    if len(sys.argv) > 2:
-        server = sys.argv[2]
-    elif len(sys.argv) == 2 and not os.path.exists(sys.argv[1]):
-        # Si només hi ha un paràmetre i no és un fitxer, assumim que és la IP del servidor
-        server = sys.argv[1]
-        
-    if server.startswith("http://") or server.startswith("https://"):
-         url = server
-         if not url.endswith("/transcribe"):
-             if url.endswith("/"):
-                 url += "transcribe"
-             else:
-                 url += "/transcribe"
-    elif ":" in server:
-         url = f"http://{server}/transcribe"
-    else:
-         url = f"http://{server}:5000/transcribe"
+    stream_mode = "--stream" in sys.argv
+    if stream_mode:
+        sys.argv.remove("--stream")
+
+    options = parse_upload_options(sys.argv)
+    url = transcribe_url(sys.argv)
 
     if len(sys.argv) >= 2 and os.path.exists(sys.argv[1]):
         audio_file = sys.argv[1]
@@ -208,7 +233,14 @@ if __name__ == "__main__":
             open_web_speech_api()
             sys.exit(1)
             
-        final_text = record_audio(url)
+        if stream_mode:
+            ws_url = f"ws://{urlparse(url).hostname}:5001/stream"
+            final_text = stream_audio(ws_url)
+        else:
+            n_mels, encoding = negotiate_upload(url, options['wire_format'], options['mel_mode'])
+            final_text = record_audio(url, n_mels=n_mels, encoding=encoding,
+                                      max_in_flight=options['max_in_flight'], policy=options['policy'],
+                                      endpointing=options['endpointing'])
         
         if final_text:
             print("\n" + "="*30)
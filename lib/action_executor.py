@@ -0,0 +1,99 @@
+import queue
+import subprocess
+import threading
+import time
+
+from lib.voice_commands import Command, execute
+
+
+class ActionResult:
+    __slots__ = ("command", "ok", "error", "seconds", "exit")
+
+    def __init__(self, command, ok, error=None, seconds=0.0, exit=False):
+        self.command = command
+        self.ok = ok
+        self.error = error
+        self.seconds = seconds
+        self.exit = exit
+
+    def __repr__(self):
+        return f"ActionResult({self.command.name!r}, ok={self.ok}, error={self.error!r}, seconds={self.seconds:.2f})"
+
+
+class ActionExecutor:
+    """
+    Executa les ordres de veu en un fil a part, perquè la captura i la
+    transcripció no s'aturin mentre es parla una resposta o s'aturen
+    contenidors.
+
+    Les ordres s'executen d'una en una, en l'ordre en què arriben, amb com a
+    màxim `max_pending` esperant (si no, `submit()` les rebutja). Cada ordre
+    té `timeout` segons (o el seu `timeout`) abans que se'n mati el procés.
+    En acabar cadascuna es deixa un `ActionResult` que es recull amb
+    `events()` sense bloquejar; si l'ordre volia aturar l'script
+    (`sys.exit`), el resultat té `exit=True`.
+    """
+
+    def __init__(self, max_pending=4, timeout=30.0):
+        self.timeout = timeout
+        self.stats = {'submitted': 0, 'rejected': 0, 'completed': 0, 'failed': 0, 'timeouts': 0}
+        self._queue = queue.Queue(maxsize=max(1, int(max_pending)))
+        self._events = queue.Queue()
+        self._closed = False
+        self._thread = threading.Thread(target=self._worker_loop, name="action-executor", daemon=True)
+        self._thread.start()
+
+    def submit(self, command):
+        """Encua una ordre (`Command`). Retorna False si n'hi ha massa de pendents."""
+        if self._closed:
+            raise RuntimeError("L'executor d'ordres està tancat")
+        try:
+            self._queue.put_nowait(command)
+        except queue.Full:
+            self.stats['rejected'] += 1
+            return False
+        self.stats['submitted'] += 1
+        return True
+
+    def say(self, text):
+        """Encua una resposta parlada amb echovoice."""
+        return self.submit(Command("echovoice", [], [{'say': text}]))
+
+    def pending(self):
+        return self._queue.qsize()
+
+    def events(self):
+        """Resultats de les ordres acabades des de l'última crida (sense bloquejar)."""
+        results = []
+        while True:
+            try:
+                results.append(self._events.get_nowait())
+            except queue.Empty:
+                return results
+
+    def close(self, timeout=None):
+        """Espera (fins a `timeout` segons) que s'acabin les ordres pendents i en retorna els resultats."""
+        if not self._closed:
+            self._closed = True
+            self._queue.put(None)
+        self._thread.join(timeout)
+        return self.events()
+
+    def _worker_loop(self):
+        while True:
+            command = self._queue.get()
+            if command is None:
+                return
+            start = time.monotonic()
+            ok, error, exit = True, None, False
+            try:
+                execute(command, self.timeout)
+            except SystemExit:
+                exit = True
+            except subprocess.TimeoutExpired as e:
+                ok, error = False, f"temps esgotat a `{' '.join(e.cmd)}`"
+                self.stats['timeouts'] += 1
+            except Exception as e:
+                ok, error = False, str(e)
+            self.stats['completed' if ok else 'failed'] += 1
+            self._events.put(ActionResult(command, ok, error, time.monotonic() - start, exit))
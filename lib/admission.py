@@ -0,0 +1,179 @@
+import math
+import threading
+import time
+
+# Prioritat de cada carril al planificador (com més baix, abans s'atén)
+LANE_PRIORITY = {'interactive': 0, 'bulk': 1}
+
+# Durada de la finestra que processa Whisper: un fragment curt costa com una finestra sencera
+WINDOW_SECONDS = 30
+
+# Cost màxim per finestra que es fa servir per estimar: un lot anòmalament lent no ha de bloquejar el carril
+MAX_WINDOW_COST = 2 * WINDOW_SECONDS
+
+# Segons sense cap lot acabat perquè l'estimació del cost torni a mig camí del valor inicial
+COST_HALF_LIFE = 60
+
+
+def audio_windows(duration):
+    """Cost d'un àudio en finestres de 30 s (mínim una)."""
+    return max(1, math.ceil(duration / WINDOW_SECONDS))
+
+
+class AdmissionRejected(Exception):
+    """La petició no s'admet; `retry_after` és el temps suggerit en segons."""
+
+    def __init__(self, reason, retry_after):
+        super().__init__(reason)
+        self.retry_after = max(1, int(math.ceil(retry_after)))
+
+
+class RequestTooLarge(Exception):
+    """L'àudio supera la durada màxima del carril: no s'admetrà mai, per molt que es reintenti."""
+
+
+class AdmissionController:
+    """
+    Control d'admissió amb dos carrils de prioritat.
+
+    Els fragments curts dels clients en viu van pel carril `interactive` i
+    passen davant dels fitxers llargs del carril `bulk`. Abans d'admetre una
+    petició s'estima l'espera a partir de la feina que té al davant i del
+    cost observat per finestra; si supera el pressupost de latència del
+    carril, o la cua del carril és plena, o el client ja té massa peticions
+    en curs, es rebutja amb un temps de reintent. Només els àudios de més
+    finestres que `max_windows` del carril es rebutgen sense reintent
+    (RequestTooLarge): és una propietat de la petició, no de l'estimació.
+
+    El cost per finestra és una mitjana mòbil dels lots acabats, limitada a
+    `max_window_cost`, que torna cap al valor inicial (amb una semivida de
+    `cost_half_life` segons) quan no acaba cap lot: si una estimació massa
+    alta fa rebutjar tot el trànsit, no queda bloquejada per sempre.
+    """
+
+    def __init__(self, budgets, max_queued, max_per_client=4, workers=1, initial_window_cost=1.0,
+                 max_windows=None, max_window_cost=MAX_WINDOW_COST, cost_half_life=COST_HALF_LIFE):
+        self.budgets = dict(budgets)
+        self.max_queued = dict(max_queued)
+        self.max_windows = dict(max_windows or {})
+        self.max_per_client = max_per_client
+        self.workers = max(1, workers)
+        self.initial_window_cost = initial_window_cost
+        self.max_window_cost = max_window_cost
+        self.cost_half_life = cost_half_life
+        # Segons de càlcul per finestra (mitjana mòbil exponencial) i moment de l'últim lot observat
+        self._window_cost = initial_window_cost
+        self._observed_at = time.monotonic()
+        self._requests = {lane: 0 for lane in LANE_PRIORITY}
+        self._windows = {lane: 0 for lane in LANE_PRIORITY}
+        self._per_client = {}
+        self.rejected = {lane: 0 for lane in LANE_PRIORITY}
+        self._lock = threading.Lock()
+
+    @property
+    def window_cost(self):
+        """Cost estimat per finestra, que decau cap al valor inicial mentre no s'observa cap lot."""
+        idle = time.monotonic() - self._observed_at
+        decay = 0.5 ** (idle / self.cost_half_life) if self.cost_half_life else 1.0
+        return self.initial_window_cost + (self._window_cost - self.initial_window_cost) * decay
+
+    def _windows_ahead(self, lane):
+        """Finestres que s'atendran abans que una nova petició d'aquest carril."""
+        priority = LANE_PRIORITY[lane]
+        return sum(w for other, w in self._windows.items() if LANE_PRIORITY[other] <= priority)
+
+    def estimate_wait(self, lane):
+        """Espera estimada abans que una petició nova d'aquest carril comenci a processar-se."""
+        with self._lock:
+            return self._windows_ahead(lane) * self.window_cost / self.workers
+
+    def admit(self, client, lane, windows):
+        """
+        Admet la petició o llança AdmissionRejected (es pot reintentar més
+        tard) o RequestTooLarge (l'àudio és massa llarg per al carril). Retorna un tiquet per a `release`.
+        """
+        with self._lock:
+            max_windows = self.max_windows.get(lane)
+            if max_windows and windows > max_windows:
+                self.rejected[lane] += 1
+                raise RequestTooLarge(
+                    f"L'àudio ocupa {windows} finestres de {WINDOW_SECONDS}s, més que el màxim "
+                    f"de {max_windows} del carril '{lane}'"
+                )
+
+            in_flight = self._per_client.get(client, 0)
+            if self.max_per_client and in_flight >= self.max_per_client:
+                self.rejected[lane] += 1
+                raise AdmissionRejected(
+                    f"Massa peticions en curs per a aquest client ({in_flight})",
+                    windows * self.window_cost,
+                )
+
+            if self._requests[lane] >= self.max_queued[lane]:
+                self.rejected[lane] += 1
+                raise AdmissionRejected(
+                    f"La cua '{lane}' és plena",
+                    self._windows_ahead(lane) * self.window_cost / self.workers,
+                )
+
+            # Només compta la feina que hi ha al davant: el temps de la petició mateixa no depèn de la cua
+            wait = self._windows_ahead(lane) * self.window_cost / self.workers
+            if wait > self.budgets[lane]:
+                self.rejected[lane] += 1
+                raise AdmissionRejected(
+                    f"Espera estimada de {wait:.1f}s per sobre del pressupost de {self.budgets[lane]:.0f}s",
+                    wait - self.budgets[lane],
+                )
+
+            self._requests[lane] += 1
+            self._windows[lane] += windows
+            self._per_client[client] = in_flight + 1
+        return (client, lane, windows)
+
+    def reserve(self, client, lane, windows):
+        """
+        Compta feina ja acceptada (p. ex. una finestra d'una feina de `/jobs`)
+        sense rebutjar-la, perquè les estimacions d'espera la tinguin en compte.
+        Retorna un tiquet per a `release`.
+        """
+        with self._lock:
+            self._requests[lane] += 1
+            self._windows[lane] += windows
+            self._per_client[client] = self._per_client.get(client, 0) + 1
+        return (client, lane, windows)
+
+    def release(self, ticket):
+        client, lane, windows = ticket
+        with self._lock:
+            self._requests[lane] -= 1
+            self._windows[lane] -= windows
+            remaining = self._per_client.get(client, 1) - 1
+            if remaining:
+                self._per_client[client] = remaining
+            else:
+                self._per_client.pop(client, None)
+
+    def observe(self, windows, seconds, alpha=0.2):
+        """Actualitza el cost per finestra amb un lot acabat."""
+        if windows <= 0:
+            return
+        with self._lock:
+            sample = min(seconds / windows, self.max_window_cost)
+            self._window_cost = (1 - alpha) * self.window_cost + alpha * sample
+            self._observed_at = time.monotonic()
+
+    def stats(self):
+        with self._lock:
+            return {
+                'window_cost_seconds': round(self.window_cost, 3),
+                'lanes': {
+                    lane: {
+                        'requests': self._requests[lane],
+                        'windows': self._windows[lane],
+                        'estimated_wait_seconds': round(self._windows_ahead(lane) * self.window_cost / self.workers, 2),
+                        'budget_seconds': self.budgets[lane],
+                        'rejected': self.rejected[lane],
+                    } for lane in LANE_PRIORITY
+                },
+                'clients': len(self._per_client),
+            }
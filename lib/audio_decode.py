@@ -0,0 +1,247 @@
+import io
+import math
+import shutil
+import struct
+from math import gcd
+
+import numpy as np
+
+# Freqüència de mostreig que espera Whisper
+SAMPLE_RATE = 16000
+
+_WAVE_FORMAT_PCM = 0x0001
+_WAVE_FORMAT_IEEE_FLOAT = 0x0003
+_WAVE_FORMAT_EXTENSIBLE = 0xFFFE
+
+# Formats de PCM cru acceptats per l'endpoint binari
+PCM_FORMATS = {
+    's16le': np.dtype('<i2'),
+    'f32le': np.dtype('<f4'),
+}
+
+
+class UnsupportedAudio(ValueError):
+    """L'àudio no es pot descodificar en memòria (cal recórrer a ffmpeg)."""
+
+
+def read_body(stream, length):
+    """
+    Llegeix exactament `length` bytes d'un stream en un bytearray preassignat.
+    Retorna un buffer escrivible que NumPy pot embolcallar sense còpies.
+    """
+    buf = bytearray(length)
+    view = memoryview(buf)
+    pos = 0
+    while pos < length:
+        if hasattr(stream, 'readinto'):
+            n = stream.readinto(view[pos:])
+        else:
+            chunk = stream.read(length - pos)
+            n = len(chunk)
+            view[pos:pos + n] = chunk
+        if not n:
+            raise ValueError(f"Cos de la petició incomplet: {pos} de {length} bytes")
+        pos += n
+    return buf
+
+
+def resample(audio, sample_rate):
+    """Remostreja a 16 kHz amb un filtre polifàsic."""
+    if sample_rate == SAMPLE_RATE:
+        return audio
+    from scipy.signal import resample_poly
+    g = gcd(int(sample_rate), SAMPLE_RATE)
+    return resample_poly(audio, SAMPLE_RATE // g, int(sample_rate) // g).astype(np.float32)
+
+
+class StreamResampler:
+    """
+    Remostreja a 16 kHz un flux d'àudio que arriba a trossos, amb el mateix
+    filtre polifàsic que `resample`. Remostrejar cada tros per separat
+    afegiria els efectes de vora del filtre a cada frontera; aquí es guarda
+    prou àudio d'entrada per calcular cada mostra de sortida amb tot el seu
+    context, i les últimes mostres esperen el tros següent (o `flush`).
+    """
+
+    def __init__(self, sample_rate):
+        g = gcd(int(sample_rate), SAMPLE_RATE)
+        self.up = SAMPLE_RATE // g
+        self.down = int(sample_rate) // g
+        # Mig filtre de `resample_poly` en mostres d'entrada, arrodonit a un múltiple de `down`
+        half = math.ceil(10 * max(self.up, self.down) / self.up) + 1
+        self.margin = math.ceil(half / self.down) * self.down
+        self._buf = np.zeros(0, dtype=np.float32)
+        self._start = 0      # Posició d'entrada de `_buf[0]` (múltiple de `down`)
+        self._emitted = 0    # Mostres de sortida ja retornades
+
+    def _run(self, audio, final):
+        from scipy.signal import resample_poly
+        buf = np.concatenate([self._buf, audio])
+        end = self._start + len(buf)
+        if final:
+            ready = -(-end * self.up // self.down)
+        else:
+            # Només les mostres amb tot el context de la dreta ja disponible
+            ready = max(0, end - self.margin) * self.up // self.down
+        out = np.zeros(0, dtype=np.float32)
+        if ready > self._emitted:
+            offset = self._start * self.up // self.down
+            out = resample_poly(buf, self.up, self.down)[self._emitted - offset:ready - offset].astype(np.float32)
+            self._emitted = ready
+        # Es conserva el context de l'esquerra de les mostres de sortida pendents
+        keep = max(self._start, (self._emitted * self.down // self.up - self.margin) // self.down * self.down)
+        self._buf = buf[keep - self._start:]
+        self._start = keep
+        return out
+
+    def process(self, audio):
+        """Afegeix un tros d'àudio i retorna les mostres de 16 kHz que ja es poden calcular."""
+        if self.up == self.down:
+            return audio
+        return self._run(audio, final=False)
+
+    def flush(self):
+        """Retorna les mostres pendents (el final del flux s'omple amb silenci)."""
+        if self.up == self.down:
+            return np.zeros(0, dtype=np.float32)
+        return self._run(np.zeros(0, dtype=np.float32), final=True)
+
+
+def quietest_split(audio, search_samples, frame=320):
+    """
+    Retorna la posició de menys energia dins de les últimes `search_samples`
+    mostres, per tallar un fragment llarg sense partir paraules.
+    """
+    start = max(0, len(audio) - int(search_samples))
+    region = audio[start:]
+    n_frames = len(region) // frame
+    if n_frames < 2:
+        return len(audio)
+    energy = np.square(region[:n_frames * frame].reshape(n_frames, frame)).mean(axis=1)
+    return start + int(np.argmin(energy)) * frame + frame // 2
+
+
+def _to_mono(samples, channels):
+    if channels == 1:
+        return samples
+    return samples.reshape(-1, channels).mean(axis=1, dtype=np.float32)
+
+
+def pcm_to_float32(buf, sample_format='s16le', sample_rate=SAMPLE_RATE, channels=1):
+    """
+    Converteix PCM cru little-endian a un array float32 mono de 16 kHz.
+    Amb `f32le`, mono i 16 kHz l'array és una vista directa sobre `buf`.
+    """
+    if sample_format not in PCM_FORMATS:
+        raise ValueError(f"Format de mostra no suportat: {sample_format}")
+    if sample_rate <= 0 or channels <= 0:
+        raise ValueError("La freqüència de mostreig i els canals han de ser positius")
+
+    dtype = PCM_FORMATS[sample_format]
+    frame_size = dtype.itemsize * channels
+    usable = len(buf) - len(buf) % frame_size
+    samples = np.frombuffer(buf, dtype=dtype, count=usable // dtype.itemsize)
+
+    if dtype.kind == 'i':
+        samples = samples.astype(np.float32) / 32768.0
+    elif dtype != np.float32:
+        samples = samples.astype(np.float32)
+
+    return resample(_to_mono(samples, channels), sample_rate)
+
+
+def _decode_wav_samples(data, offset, size, fmt, bits, channels):
+    width = bits // 8
+    count = size // width
+
+    if fmt == _WAVE_FORMAT_IEEE_FLOAT:
+        if bits == 32:
+            samples = np.frombuffer(data, dtype='<f4', count=count, offset=offset)
+            # Sense còpia sempre que el bloc 'data' estigui alineat
+            return samples if samples.flags.aligned else samples.copy()
+        if bits == 64:
+            return np.frombuffer(data, dtype='<f8', count=count, offset=offset).astype(np.float32)
+    elif fmt == _WAVE_FORMAT_PCM:
+        if bits == 8:
+            raw = np.frombuffer(data, dtype=np.uint8, count=count, offset=offset)
+            return (raw.astype(np.float32) - 128.0) / 128.0
+        if bits == 16:
+            raw = np.frombuffer(data, dtype='<i2', count=count, offset=offset)
+            return raw.astype(np.float32) / 32768.0
+        if bits == 24:
+            raw = np.frombuffer(data, dtype=np.uint8, count=count * 3, offset=offset).reshape(-1, 3)
+            # Estendre a 32 bits posant els 3 bytes a la part alta
+            ints = (raw[:, 0].astype(np.int32) << 8) | (raw[:, 1].astype(np.int32) << 16) | (raw[:, 2].astype(np.int32) << 24)
+            return ints.astype(np.float32) / 2147483648.0
+        if bits == 32:
+            raw = np.frombuffer(data, dtype='<i4', count=count, offset=offset)
+            return raw.astype(np.float32) / 2147483648.0
+
+    raise UnsupportedAudio(f"WAV amb format {fmt:#06x} de {bits} bits no suportat")
+
+
+def decode_wav(data):
+    """
+    Descodifica un WAV (RIFF) en memòria a float32 mono de 16 kHz.
+    Llança UnsupportedAudio si no és un WAV que sapiguem llegir.
+    """
+    if len(data) < 12 or data[0:4] != b'RIFF' or data[8:12] != b'WAVE':
+        raise UnsupportedAudio("No és un fitxer WAV")
+
+    fmt = None
+    pos = 12
+    while pos + 8 <= len(data):
+        chunk_id = bytes(data[pos:pos + 4])
+        chunk_size = struct.unpack_from('<I', data, pos + 4)[0]
+        body = pos + 8
+
+        if chunk_id == b'fmt ':
+            if chunk_size < 16:
+                raise UnsupportedAudio("Capçalera 'fmt' massa curta")
+            audio_format, channels, sample_rate, _, _, bits = struct.unpack_from('<HHIIHH', data, body)
+            if audio_format == _WAVE_FORMAT_EXTENSIBLE and chunk_size >= 40:
+                # Els dos primers bytes del GUID del subformat indiquen el format real
+                audio_format = struct.unpack_from('<H', data, body + 24)[0]
+            fmt = (audio_format, channels, sample_rate, bits)
+
+        elif chunk_id == b'data':
+            if fmt is None:
+                raise UnsupportedAudio("Bloc 'data' abans de 'fmt'")
+            audio_format, channels, sample_rate, bits = fmt
+            if channels == 0 or bits == 0 or bits % 8:
+                raise UnsupportedAudio("Capçalera 'fmt' invàlida")
+            # Els WAV escrits en streaming poden portar una mida de bloc incorrecta
+            size = min(chunk_size, len(data) - body)
+            size -= size % ((bits // 8) * channels)
+            samples = _decode_wav_samples(data, body, size, audio_format, bits, channels)
+            return resample(_to_mono(samples, channels), sample_rate)
+
+        pos = body + chunk_size + (chunk_size & 1)
+
+    raise UnsupportedAudio("WAV sense bloc 'data'")
+
+
+def decode_flac(data):
+    """
+    Descodifica un FLAC en memòria a float32 mono de 16 kHz amb el paquet
+    opcional `soundfile`. Llança UnsupportedAudio si no és FLAC o si
+    `soundfile` no està instal·lat (llavors es recorre a ffmpeg).
+    """
+    if bytes(data[:4]) != b'fLaC':
+        raise UnsupportedAudio("No és un fitxer FLAC")
+    try:
+        import soundfile
+    except (ImportError, OSError):
+        raise UnsupportedAudio("Cal el paquet soundfile per llegir FLAC en memòria")
+    samples, sample_rate = soundfile.read(io.BytesIO(data), dtype='float32', always_2d=True)
+    mono = samples[:, 0] if samples.shape[1] == 1 else samples.mean(axis=1, dtype=np.float32)
+    return resample(np.ascontiguousarray(mono), sample_rate)
+
+
+def flac_supported():
+    """Es poden rebre FLAC: en memòria amb soundfile o, si no, amb ffmpeg."""
+    try:
+        import soundfile
+        return True
+    except (ImportError, OSError):
+        return shutil.which('ffmpeg') is not None
@@ -0,0 +1,66 @@
+import io
+
+import numpy as np
+import scipy.io.wavfile as wav
+
+# Formats d'enviament dels fragments, per ordre de preferència:
+# flac (sense pèrdues, comprimit), wav (PCM int16) i pcm (int16 cru a /transcribe/raw)
+WIRE_FORMATS = ('flac', 'wav', 'pcm')
+
+MIMETYPES = {
+    'flac': 'audio/flac',
+    'wav': 'audio/wav',
+    'pcm': 'application/octet-stream',
+}
+
+
+def flac_available():
+    """El FLAC necessita el paquet opcional `soundfile`."""
+    try:
+        import soundfile
+    except (ImportError, OSError):
+        return False
+    return 'FLAC' in soundfile.available_formats()
+
+
+def local_formats():
+    return [f for f in WIRE_FORMATS if f != 'flac' or flac_available()]
+
+
+def negotiate_format(preferred, server_formats):
+    """
+    Tria el format d'enviament: el preferit si el servidor l'accepta i es pot
+    codificar localment; si no, el primer de WIRE_FORMATS que compleixi les dues coses.
+    """
+    candidates = [preferred] if preferred else []
+    candidates += [f for f in WIRE_FORMATS if f != preferred]
+    available = local_formats()
+    for fmt in candidates:
+        if fmt in server_formats and fmt in available:
+            return fmt
+    return 'wav'
+
+
+def to_int16(audio):
+    """float32 entre -1 i 1 (o int16) a int16 mono."""
+    audio = np.asarray(audio).reshape(-1)
+    if audio.dtype == np.int16:
+        return audio
+    return (np.clip(audio, -1.0, 1.0) * 32767.0).astype(np.int16)
+
+
+def encode_chunk(audio, sample_rate, fmt):
+    """Codifica un fragment en memòria, sense fitxers temporals. Retorna els bytes."""
+    samples = to_int16(audio)
+    if fmt == 'pcm':
+        return samples.tobytes()
+
+    buf = io.BytesIO()
+    if fmt == 'wav':
+        wav.write(buf, sample_rate, samples)
+    elif fmt == 'flac':
+        import soundfile
+        soundfile.write(buf, samples, sample_rate, format='FLAC', subtype='PCM_16')
+    else:
+        raise ValueError(f"Format d'enviament desconegut: {fmt}. Opcions: {', '.join(WIRE_FORMATS)}")
+    return buf.getvalue()
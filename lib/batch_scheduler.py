@@ -0,0 +1,130 @@
+import threading
+import time
+from concurrent.futures import Future
+
+
+class _PendingItem:
+    __slots__ = ("key", "payload", "priority", "future", "enqueued")
+
+    def __init__(self, key, payload, priority):
+        self.key = key
+        self.payload = payload
+        self.priority = priority
+        self.future = Future()
+        self.enqueued = time.monotonic()
+
+
+class BatchScheduler:
+    """
+    Planificador d'inferència amb micro-lots.
+
+    Les peticions s'encuen amb una clau (p. ex. l'idioma). Un fil de treball
+    agrupa les peticions amb la mateixa clau que arriben dins de la finestra
+    `max_wait_ms` (fins a `max_batch_size`) i les passa totes juntes a
+    `run_batch(key, payloads)`, que ha de retornar una llista de resultats
+    en el mateix ordre. Cada peticionari rep el seu resultat via un Future.
+    Les peticions amb `priority` més baixa s'atenen abans; dins d'una
+    mateixa prioritat, per ordre d'arribada.
+    Si es passa `wait_observer`, es crida amb els segons que ha esperat a la
+    cua cada petició quan entra en un lot.
+    """
+
+    def __init__(self, run_batch, max_batch_size=8, max_wait_ms=50, workers=1, wait_observer=None):
+        self.run_batch = run_batch
+        self.wait_observer = wait_observer
+        self.max_batch_size = max(1, int(max_batch_size))
+        self.max_wait = max(0.0, float(max_wait_ms)) / 1000.0
+        self.workers = max(1, int(workers))
+        self._pending = []
+        self._cond = threading.Condition()
+        self._running = False
+        self._threads = []
+
+    def start(self, workers=None):
+        with self._cond:
+            if self._running:
+                return
+            self._running = True
+            if workers:
+                self.workers = max(1, int(workers))
+        for i in range(self.workers):
+            t = threading.Thread(target=self._worker_loop, name=f"batch-scheduler-{i}", daemon=True)
+            t.start()
+            self._threads.append(t)
+
+    def stop(self):
+        with self._cond:
+            self._running = False
+            pending, self._pending = self._pending, []
+            self._cond.notify_all()
+        for it in pending:
+            if it.future.set_running_or_notify_cancel():
+                it.future.set_exception(RuntimeError("El planificador d'inferència s'ha aturat"))
+        for t in self._threads:
+            t.join()
+        self._threads = []
+
+    def submit(self, key, payload, priority=0):
+        """Encua una petició i retorna un Future amb el seu resultat."""
+        item = _PendingItem(key, payload, priority)
+        with self._cond:
+            if not self._running:
+                raise RuntimeError("El planificador d'inferència no està en marxa")
+            self._pending.append(item)
+            self._cond.notify_all()
+        return item.future
+
+    def queue_depth(self):
+        with self._cond:
+            return len(self._pending)
+
+    def _next_batch(self):
+        """Espera i extreu el següent lot (o None si s'atura el planificador)."""
+        with self._cond:
+            while True:
+                while self._running and not self._pending:
+                    self._cond.wait()
+                if not self._running:
+                    return None
+
+                # Es recalcula a cada volta: un altre fil pot haver-se endut el lot
+                first = min(self._pending, key=lambda it: (it.priority, it.enqueued))
+                same_key = sorted((it for it in self._pending if it.key == first.key),
+                                  key=lambda it: (it.priority, it.enqueued))
+                remaining = first.enqueued + self.max_wait - time.monotonic()
+                if len(same_key) >= self.max_batch_size or remaining <= 0:
+                    break
+                self._cond.wait(remaining)
+
+            batch = same_key[:self.max_batch_size]
+            taken = set(map(id, batch))
+            self._pending = [it for it in self._pending if id(it) not in taken]
+            return batch
+
+    def _worker_loop(self):
+        while True:
+            batch = self._next_batch()
+            if batch is None:
+                break
+
+            # Els peticionaris que ja han cancel·lat no ocupen lloc al lot
+            batch = [it for it in batch if it.future.set_running_or_notify_cancel()]
+            if not batch:
+                continue
+
+            if self.wait_observer is not None:
+                now = time.monotonic()
+                for it in batch:
+                    self.wait_observer(now - it.enqueued)
+
+            try:
+                results = self.run_batch(batch[0].key, [it.payload for it in batch])
+                if len(results) != len(batch):
+                    raise RuntimeError("run_batch ha retornat un nombre incorrecte de resultats")
+            except Exception as e:
+                for it in batch:
+                    it.future.set_exception(e)
+                continue
+
+            for it, result in zip(batch, results):
+                it.future.set_result(result)
@@ -0,0 +1,129 @@
+import time
+
+import numpy as np
+
+
+class AudioRing:
+    """
+    Buffer circular preassignat per a la captura d'àudio del micròfon.
+
+    Un sol productor (el callback de sounddevice) hi escriu i un sol
+    consumidor en llegeix, sense cap lock: cada banda només modifica el seu
+    comptador de posició (`_write` o `_read`). El productor només escriu a
+    l'espai lliure, de manera que les finestres que retorna `window()` són
+    vistes sense còpia que es mantenen vàlides fins que el consumidor crida
+    `consume()`.
+
+    Les dades es desen dues vegades (a `i` i a `i + capacity`) perquè
+    qualsevol finestra de fins a `capacity` mostres sigui contigua encara
+    que doni la volta. La memòria és fixa: si el consumidor no dona l'abast
+    o la gravació supera `seconds`, les mostres noves es descarten i es
+    compten a `overruns`/`dropped_samples`. Demanar més mostres de les que
+    hi ha compta com a `underruns`.
+    """
+
+    def __init__(self, seconds, sample_rate=16000, channels=1, dtype='float32', poll_interval=0.01):
+        self.sample_rate = sample_rate
+        self.channels = channels
+        self.dtype = np.dtype(dtype)
+        self.capacity = max(1, int(seconds * sample_rate))
+        self.poll_interval = poll_interval
+        self._buffer = np.zeros((2 * self.capacity, channels), dtype=self.dtype)
+        self.reset()
+
+    def reset(self):
+        """Buida el buffer i els comptadors. Només s'ha de cridar sense el stream obert."""
+        self._write = 0
+        self._read = 0
+        self.overruns = 0
+        self.dropped_samples = 0
+        self.underruns = 0
+        self.status_errors = 0
+
+    @property
+    def nbytes(self):
+        return self._buffer.nbytes
+
+    @property
+    def seconds(self):
+        return self.capacity / self.sample_rate
+
+    # --- Productor ---
+
+    def write(self, frames):
+        """Afegeix mostres `(n, canals)`. Retorna quantes se n'han desat."""
+        n = len(frames)
+        free = self.capacity - (self._write - self._read)
+        if n > free:
+            self.overruns += 1
+            self.dropped_samples += n - free
+            n = free
+        if n <= 0:
+            return 0
+
+        start = self._write % self.capacity
+        first = min(n, self.capacity - start)
+        for offset in (0, self.capacity):
+            self._buffer[offset + start:offset + start + first] = frames[:first]
+            self._buffer[offset:offset + n - first] = frames[first:n]
+        # Es publica la nova posició només quan les dades ja són al buffer
+        self._write += n
+        return n
+
+    def callback(self, indata, frames, time_info, status):
+        """Callback per a `sounddevice.InputStream`."""
+        if status:
+            self.status_errors += 1
+        self.write(indata)
+
+    def input_stream(self, **kwargs):
+        """`sounddevice.InputStream` que escriu directament en aquest buffer."""
+        import sounddevice as sd
+        return sd.InputStream(samplerate=self.sample_rate, channels=self.channels,
+                              dtype=self.dtype.name, callback=self.callback, **kwargs)
+
+    # --- Consumidor ---
+
+    def available(self):
+        return self._write - self._read
+
+    def wait(self, n, timeout=None):
+        """Espera fins que hi hagi `n` mostres disponibles. Retorna False si s'esgota el temps."""
+        n = min(n, self.capacity)
+        deadline = None if timeout is None else time.monotonic() + timeout
+        while self.available() < n:
+            if deadline is not None and time.monotonic() >= deadline:
+                return False
+            time.sleep(self.poll_interval)
+        return True
+
+    def window(self, n=None):
+        """Vista sense còpia de les `n` mostres més antigues pendents (per defecte, totes)."""
+        available = self.available()
+        if n is None:
+            n = available
+        elif n > available:
+            self.underruns += 1
+            n = available
+        start = self._read % self.capacity
+        return self._buffer[start:start + n]
+
+    def consume(self, n):
+        """Allibera les `n` mostres més antigues perquè el productor les pugui sobreescriure."""
+        self._read += min(n, self.available())
+
+    def read(self, n=None):
+        """Còpia de les `n` mostres més antigues pendents, que queden alliberades."""
+        audio = self.window(n).copy()
+        self.consume(len(audio))
+        return audio
+
+    def summary(self):
+        """Avís amb els problemes de captura, o None si no n'hi ha hagut."""
+        problems = []
+        if self.dropped_samples:
+            problems.append(f"{self.dropped_samples / self.sample_rate:.1f}s d'àudio descartat "
+                            f"(buffer de {self.seconds:.0f}s ple)")
+        if self.status_errors:
+            problems.append(f"{self.status_errors} avisos del dispositiu d'àudio")
+        return "; ".join(problems) or None
@@ -0,0 +1,288 @@
+import os
+import sys
+import threading
+import uuid
+
+import numpy as np
+import requests
+
+from lib.audio_decode import SAMPLE_RATE, quietest_split
+from lib.audio_encoding import MIMETYPES, WIRE_FORMATS, encode_chunk, negotiate_format
+from lib.capture import AudioRing
+from lib.endpointer import Endpointer
+from lib.mel import CHUNK_SAMPLES, MEL_FORMAT_VERSION, compact_mel, encode_mel, log_mel_spectrogram
+from lib.uploader import POLICIES, ChunkUploader
+
+# Fragments que caben al buffer de captura si l'enviament va endarrerit
+BUFFERED_CHUNKS = 6
+
+# Segons del final de cada finestra de 30 s on es busca el punt de tall del log-mel
+MEL_SPLIT_SEARCH = 2
+
+# Identificador d'aquest client (X-Client-Id): el servidor limita les peticions en curs per client,
+# i sense capçalera tots els que arriben pel mateix proxy o túnel compartirien el límit
+CLIENT_ID = uuid.uuid4().hex
+
+
+def request_fields(language='ca', model=None):
+    """Camps de cada petició: l'idioma i, si se'n demana un, el model."""
+    fields = {'language': language}
+    if model:
+        fields['model'] = model
+    return fields
+
+
+def fetch_capabilities(server_url):
+    """Capacitats del servidor (`/capabilities`), o None si no les publica."""
+    base_url = server_url.rsplit("/transcribe", 1)[0]
+    try:
+        response = requests.get(base_url + "/capabilities", timeout=5)
+        return response.json() if response.status_code == 200 else None
+    except Exception:
+        return None
+
+
+def mel_bands(capabilities, model=None):
+    """Bandes mel que espera el model al servidor, o None si no accepta log-mel."""
+    if not capabilities or "mel" not in capabilities.get("inputs", []):
+        return None
+    return capabilities["mel"]["n_mels"].get(model or capabilities["default_model"])
+
+
+def negotiate_upload(server_url, wire_format=None, mel_mode=False, model=None):
+    """
+    Tria com s'envien els fragments segons `/capabilities`: retorna
+    `(n_mels, encoding)`, amb `n_mels` a None si no s'envia log-mel. Avisa
+    quan no es pot fer servir el que s'ha demanat.
+    """
+    capabilities = fetch_capabilities(server_url)
+    n_mels = None
+    if mel_mode:
+        n_mels = mel_bands(capabilities, model)
+        if n_mels is None:
+            print("Avís: el servidor no accepta log-mel. S'enviarà l'àudio.")
+    # Els servidors sense /capabilities només reben WAV per formulari
+    encoding = negotiate_format(wire_format, capabilities.get("encodings", ["wav"]) if capabilities else ["wav"])
+    if wire_format and encoding != wire_format:
+        print(f"Avís: no es pot enviar en format {wire_format}. S'utilitzarà {encoding}.")
+    return n_mels, encoding
+
+
+def post_chunk(url, session=None, **kwargs):
+    """
+    Envia un fragment i retorna el text transcrit, o None si hi ha hagut un
+    error. Amb `session` es reutilitzen les connexions obertes (keep-alive).
+    """
+    kwargs['headers'] = {'X-Client-Id': CLIENT_ID, **kwargs.get('headers', {})}
+    try:
+        response = (session or requests).post(url, **kwargs)
+        if response.status_code == 200:
+            return response.json().get('text', '').strip()
+        print(f"Error del servidor ({response.status_code}):")
+        print(response.text)
+        return None
+    except requests.exceptions.ConnectionError:
+        print(f"Error: No s'ha pogut connectar amb el servidor a {url}")
+        return None
+    except Exception as e:
+        print(f"Error inesperat: {e}")
+        return None
+
+
+def transcribe_chunk(np_audio, server_url, fs, n_mels=None, encoding='wav', session=None, fields=None):
+    """
+    Envia un fragment enregistrat codificat en memòria (flac, wav int16 o
+    pcm int16 cru), sense fitxers temporals. Amb `n_mels`, l'envia com a
+    log-mel. `fields` són els camps de la petició (`request_fields()`).
+    """
+    fields = fields or request_fields()
+    if n_mels:
+        return transcribe_mel(np_audio, server_url, n_mels, session, fields)
+    body = encode_chunk(np_audio, fs, encoding)
+    if encoding == 'pcm':
+        return post_chunk(server_url + "/raw", session, params=fields, data=body,
+                          headers={'Content-Type': MIMETYPES['pcm'], 'X-Sample-Rate': str(fs),
+                                   'X-Sample-Format': 's16le'})
+    files = {'file': (f"chunk.{encoding}", body, MIMETYPES[encoding])}
+    return post_chunk(server_url, session, files=files, data=fields)
+
+
+def mel_windows(audio):
+    """
+    Parteix l'àudio (16 kHz) en finestres de com a màxim 30 s, l'entrada
+    màxima de /transcribe/mel, tallant pel punt de menys energia dels
+    darrers `MEL_SPLIT_SEARCH` segons de cada finestra per no partir paraules.
+    """
+    windows = []
+    while len(audio) > CHUNK_SAMPLES:
+        cut = quietest_split(audio[:CHUNK_SAMPLES], MEL_SPLIT_SEARCH * SAMPLE_RATE)
+        windows.append(audio[:cut])
+        audio = audio[cut:]
+    windows.append(audio)
+    return windows
+
+
+def transcribe_mel(np_audio, server_url, n_mels, session=None, fields=None):
+    """
+    Calcula el log-mel del fragment (16 kHz) i l'envia a /transcribe/mel.
+    Els fragments de més de 30 s (p. ex. els que ajunta `ChunkUploader`)
+    s'envien per finestres (`mel_windows`) i se n'ajunten els textos; només
+    retorna None si no se n'ha pogut transcriure cap.
+    """
+    fields = fields or request_fields()
+    audio = np.asarray(np_audio, dtype=np.float32).reshape(-1)
+    texts = []
+    for window in mel_windows(audio):
+        mel = compact_mel(log_mel_spectrogram(window, n_mels), len(window))
+        texts.append(post_chunk(server_url + "/mel", session, params=fields, data=encode_mel(mel),
+                                headers={'Content-Type': 'application/octet-stream',
+                                         'X-Mel-Version': str(MEL_FORMAT_VERSION)}))
+    if all(text is None for text in texts):
+        return None
+    return " ".join(text for text in texts if text)
+
+
+def record_chunks(send, handle, fs=16000, chunk_duration=5, max_in_flight=2, policy='merge',
+                  endpointing=True, admit=None, poll=None):
+    """
+    Bucle de captura comú dels clients: grava del micròfon fins que es prem
+    ENTER i envia en segon pla cada frase quan es detecta una pausa (o, sense
+    `endpointing`, fragments fixos de `chunk_duration` segons), fins a
+    `max_in_flight` alhora; si el servidor no dona l'abast, s'ajunten o es
+    descarten segons `policy`.
+
+    `send(session, audio)` envia un fragment i retorna el text, i
+    `handle(texts, final)` rep els textos en l'ordre de gravació (`final`
+    és cert en els de després d'aturar). `admit(audio)`, si n'hi ha, decideix
+    si cal enviar cada fragment, i `poll()` es crida a cada volta del bucle.
+    """
+    ring = AudioRing(chunk_duration * BUFFERED_CHUNKS, fs)
+    chunk_samples = fs * chunk_duration
+    endpointer = Endpointer(ring) if endpointing else None
+    stop_event = threading.Event()
+
+    def next_chunks():
+        if endpointer:
+            return endpointer.next_chunks(timeout=0.1)
+        if not ring.wait(chunk_samples, timeout=0.1):
+            return []
+        # Còpia del fragment: l'enviador el fa servir després d'alliberar el buffer
+        return [ring.read(chunk_samples)]
+
+    def input_listener():
+        input()
+        stop_event.set()
+
+    input_thread = threading.Thread(target=input_listener)
+    input_thread.start()
+
+    uploader = ChunkUploader(send, max_in_flight=max_in_flight, policy=policy)
+
+    try:
+        with ring.input_stream():
+            while not stop_event.is_set():
+                handle(uploader.ready(), False)
+                if poll:
+                    poll()
+                for np_audio in next_chunks():
+                    if admit and not admit(np_audio):
+                        continue
+                    print(".", end="", flush=True)
+
+                    # Enviar fragment al servidor sense aturar la captura
+                    if not uploader.submit(np_audio):
+                        action = "ajuntat" if policy == 'merge' else "descartat"
+                        print(f"\nAvís: el servidor no dona l'abast, s'ha {action} un fragment.")
+
+            # Processar l'últim fragment (la frase en curs, si n'hi ha)
+            last_chunks = endpointer.flush() if endpointer else ([ring.read()] if ring.available() else [])
+            if last_chunks:
+                print("\nProcessant l'últim fragment...")
+            for np_audio in last_chunks:
+                if admit is None or admit(np_audio):
+                    uploader.submit(np_audio)
+
+        warning = ring.summary()
+        if warning:
+            print(f"\nAvís: {warning}")
+
+    except Exception as e:
+        print(f"\nError durant l'enregistrament: {e}")
+    finally:
+        handle(uploader.close(), True)
+        if input_thread.is_alive():
+            print("Prem ENTER per finalitzar si s'ha quedat esperant.")
+
+
+def _pop_option(argv, flag):
+    """Treu `flag` i el seu valor d'`argv` i retorna el valor ("" si falta), o None si no hi és."""
+    if flag not in argv:
+        return None
+    i = argv.index(flag)
+    value = argv[i + 1] if i + 1 < len(argv) else ""
+    del argv[i:i + 2]
+    return value
+
+
+def parse_upload_options(argv):
+    """
+    Treu d'`argv` les opcions d'enviament comunes dels clients (`--mel`,
+    `--format`, `--policy`, `--fixed` i `--in-flight`) i les retorna com a
+    diccionari amb els arguments de `negotiate_upload` i `record_chunks`.
+    Amb un valor incorrecte, mostra l'error i surt.
+    """
+    options = {'mel_mode': False, 'wire_format': None, 'policy': 'merge', 'endpointing': True, 'max_in_flight': 2}
+
+    if "--mel" in argv:
+        argv.remove("--mel")
+        options['mel_mode'] = True
+
+    wire_format = _pop_option(argv, "--format")
+    if wire_format is not None:
+        if wire_format not in WIRE_FORMATS:
+            print(f"Format desconegut: {wire_format}. Opcions: {', '.join(WIRE_FORMATS)}")
+            sys.exit(1)
+        options['wire_format'] = wire_format
+
+    policy = _pop_option(argv, "--policy")
+    if policy is not None:
+        if policy not in POLICIES:
+            print(f"Política desconeguda: {policy}. Opcions: {', '.join(POLICIES)}")
+            sys.exit(1)
+        options['policy'] = policy
+
+    if "--fixed" in argv:
+        argv.remove("--fixed")
+        options['endpointing'] = False
+
+    value = _pop_option(argv, "--in-flight")
+    if value is not None:
+        if not value.isdigit() or int(value) < 1:
+            print(f"Valor incorrecte per a --in-flight: {value}")
+            sys.exit(1)
+        options['max_in_flight'] = int(value)
+
+    return options
+
+
+def transcribe_url(argv):
+    """
+    URL de `/transcribe` a partir dels arguments posicionals
+    `[ARXIU_AUDIO] [IP_SERVIDOR]`: el servidor pot ser una IP o hostname
+    (port 5000), `host:port` o una URL completa. Per defecte, localhost.
+    """
+    server = "localhost"
+    if len(argv) > 2:
+        server = argv[2]
+    elif len(argv) == 2 and not os.path.exists(argv[1]):
+        # Si només hi ha un paràmetre i no és un fitxer, assumim que és la IP del servidor
+        server = argv[1]
+
+    if server.startswith("http://") or server.startswith("https://"):
+        url = server
+        if not url.endswith("/transcribe"):
+            url += "transcribe" if url.endswith("/") else "/transcribe"
+        return url
+    if ":" in server:
+        return f"http://{server}/transcribe"
+    return f"http://{server}:5000/transcribe"
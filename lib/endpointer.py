@@ -0,0 +1,141 @@
+import numpy as np
+
+from lib.audio_decode import quietest_split
+from lib.vad import frame_energy_db
+
+
+def zero_crossing_rate(audio, frame):
+    """Fracció de canvis de signe dins de cada trama."""
+    n = len(audio) // frame
+    frames = np.asarray(audio[:n * frame]).reshape(n, frame)
+    return np.count_nonzero(np.diff(np.signbit(frames), axis=1), axis=1) / (frame - 1)
+
+
+class Endpointer:
+    """
+    Talla la captura d'un `AudioRing` en frases, per energia i passos per zero.
+
+    Cada trama de `frame_ms` és veu si supera el soroll de fons en
+    `margin_db` (i el mínim absolut `min_db`), o si la supera en la meitat
+    però té molts passos per zero, com les fricatives sordes (s, f, x). El
+    soroll de fons s'estima de manera contínua amb les trames sense veu.
+
+    Una frase comença després de `min_speech_ms` de veu seguida, amb
+    `preroll_ms` de marge al davant, i es retorna quan hi ha una pausa de
+    `pause_ms` i fa almenys `min_chunk` segons (comptant la pausa). Si
+    arriba a `max_chunk` segons sense cap pausa, es talla pel punt de menys
+    energia dels darrers `search_s` segons. El silenci no s'envia mai: es
+    descarta del buffer a mesura que arriba.
+    """
+
+    def __init__(self, ring, frame_ms=20, min_db=-50.0, margin_db=10.0, zcr_threshold=0.3,
+                 min_speech_ms=120, pause_ms=600, preroll_ms=200, tail_ms=200,
+                 min_chunk=1.0, max_chunk=15.0, search_s=2.0):
+        if max_chunk * ring.sample_rate > ring.capacity:
+            raise ValueError(f"El buffer de captura ({ring.seconds:.0f}s) no hi cap una frase de {max_chunk}s")
+        self.ring = ring
+        rate = ring.sample_rate
+        self.frame = int(rate * frame_ms / 1000)
+        self.min_db = min_db
+        self.margin_db = margin_db
+        self.zcr_threshold = zcr_threshold
+        self.min_speech = int(rate * min_speech_ms / 1000)
+        self.pause = int(rate * pause_ms / 1000)
+        self.preroll = int(rate * preroll_ms / 1000)
+        self.tail = int(rate * tail_ms / 1000)
+        self.min_chunk = int(rate * min_chunk)
+        self.max_chunk = int(rate * max_chunk)
+        self.search = int(rate * search_s)
+        # Les mostres enteres es passen a l'escala float (-1, 1)
+        self.scale = 1.0 / 32768 if ring.dtype.kind == 'i' else 1.0
+        self.floor_db = None
+        self.stats = {'chunks': 0, 'forced_cuts': 0, 'discarded_seconds': 0.0}
+        self._reset()
+
+    def _reset(self):
+        # Posicions relatives a la primera mostra pendent del buffer
+        self._pos = 0            # mostres ja classificades
+        self._run = 0            # veu seguida (abans de començar la frase)
+        self._in_speech = False
+        self._last_voice = 0     # final de l'última trama amb veu
+
+    def _classify(self, audio):
+        audio = np.asarray(audio, dtype=np.float32).reshape(-1) * self.scale
+        db = frame_energy_db(audio, self.frame)
+        zcr = zero_crossing_rate(audio, self.frame)
+        voiced = np.empty(len(db), dtype=bool)
+        for i, (level, crossings) in enumerate(zip(db, zcr)):
+            if self.floor_db is None:
+                self.floor_db = level
+            above = level - self.floor_db
+            voiced[i] = level > self.min_db and (
+                above > self.margin_db or (above > self.margin_db / 2 and crossings > self.zcr_threshold))
+            if not voiced[i]:
+                # Baixa de seguida i puja a poc a poc, perquè la veu no l'arrossegui
+                rate = 1.0 if level < self.floor_db else 0.05
+                self.floor_db += rate * (level - self.floor_db)
+        return voiced
+
+    def _discard(self, n):
+        if n > 0:
+            self.ring.consume(n)
+            self.stats['discarded_seconds'] += n / self.ring.sample_rate
+            self._pos -= n
+            self._last_voice -= n
+
+    def _emit(self, end, chunks):
+        chunks.append(self.ring.read(end))
+        self._pos -= end
+        self._last_voice = max(0, self._last_voice - end)
+        self.stats['chunks'] += 1
+        return end
+
+    def poll(self):
+        """Classifica l'àudio nou i retorna les frases acabades (còpies), potser cap."""
+        chunks = []
+        available = self.ring.available()
+        frames = (available - self._pos) // self.frame
+        if frames <= 0:
+            return chunks
+        view = self.ring.window(available)
+        voiced = self._classify(view[self._pos:self._pos + frames * self.frame])
+        base = 0  # mostres de `view` que ja s'han tret del buffer
+
+        for is_voice in voiced:
+            self._pos += self.frame
+            if not self._in_speech:
+                self._run = self._run + self.frame if is_voice else 0
+                # Només es conserva el marge previ i la veu que potser comença
+                dropped = max(0, self._pos - self._run - self.preroll)
+                self._discard(dropped)
+                base += dropped
+                if self._run >= self.min_speech:
+                    self._in_speech = True
+                    self._last_voice = self._pos
+                continue
+
+            if is_voice:
+                self._last_voice = self._pos
+            if self._pos - self._last_voice >= self.pause and self._pos >= self.min_chunk:
+                self._in_speech = False
+                self._run = 0
+                base += self._emit(min(self._last_voice + self.tail, self._pos), chunks)
+            elif self._pos >= self.max_chunk:
+                self.stats['forced_cuts'] += 1
+                audio = view[base:base + self._pos, 0].astype(np.float32) * self.scale
+                base += self._emit(quietest_split(audio, self.search), chunks)
+        return chunks
+
+    def next_chunks(self, timeout=None):
+        """Espera àudio nou (fins a `timeout` segons) i retorna les frases acabades."""
+        self.ring.wait(self._pos + self.frame, timeout)
+        return self.poll()
+
+    def flush(self):
+        """En aturar la captura: retorna les frases pendents, inclosa la que estava en curs, i buida el buffer."""
+        chunks = self.poll()
+        if self._in_speech:
+            self._emit(min(self._last_voice + self.tail, self.ring.available()), chunks)
+        self._discard(self.ring.available())
+        self._reset()
+        return chunks
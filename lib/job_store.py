@@ -0,0 +1,166 @@
+import json
+import os
+import sqlite3
+import threading
+import time
+import uuid
+
+import numpy as np
+
+from lib.audio_decode import SAMPLE_RATE, quietest_split
+
+# Mida de cada finestra de treball (la màxima que Whisper processa d'una vegada)
+WINDOW_SECONDS = 30
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS jobs (
+    id TEXT PRIMARY KEY,
+    status TEXT NOT NULL,
+    model TEXT,
+    language TEXT,
+    duration REAL NOT NULL,
+    next_offset REAL NOT NULL DEFAULT 0,
+    segments TEXT NOT NULL DEFAULT '[]',
+    error TEXT,
+    created REAL NOT NULL,
+    updated REAL NOT NULL
+)
+"""
+
+
+class JobStore:
+    """
+    Cua persistent de feines de transcripció sobre SQLite.
+
+    L'àudio descodificat de cada feina es desa com a `.npy` i el progrés es
+    confirma a la base de dades després de cada finestra de 30 s, de manera
+    que després d'una caiguda la feina continua des de l'última finestra
+    acabada.
+    """
+
+    def __init__(self, directory):
+        self.directory = directory
+        self.audio_dir = os.path.join(directory, "audio")
+        os.makedirs(self.audio_dir, exist_ok=True)
+        self._lock = threading.Lock()
+        self._db = sqlite3.connect(os.path.join(directory, "jobs.db"), check_same_thread=False)
+        self._db.row_factory = sqlite3.Row
+        with self._lock, self._db:
+            self._db.execute("PRAGMA journal_mode=WAL")
+            self._db.execute(_SCHEMA)
+        self.wakeup = threading.Event()
+
+    def audio_path(self, job_id):
+        return os.path.join(self.audio_dir, job_id + ".npy")
+
+    def create(self, audio, model=None, language=None):
+        job_id = uuid.uuid4().hex
+        np.save(self.audio_path(job_id), np.asarray(audio, dtype=np.float32))
+        now = time.time()
+        with self._lock, self._db:
+            self._db.execute(
+                "INSERT INTO jobs (id, status, model, language, duration, created, updated) VALUES (?, 'queued', ?, ?, ?, ?, ?)",
+                (job_id, model, language, len(audio) / SAMPLE_RATE, now, now),
+            )
+        self.wakeup.set()
+        return job_id
+
+    def get(self, job_id):
+        with self._lock:
+            row = self._db.execute("SELECT * FROM jobs WHERE id = ?", (job_id,)).fetchone()
+        if row is None:
+            return None
+        job = dict(row)
+        job['segments'] = json.loads(job['segments'])
+        job['progress'] = round(min(1.0, job['next_offset'] / job['duration']), 3) if job['duration'] else 1.0
+        job['text'] = " ".join(s['text'] for s in job['segments'] if s['text'])
+        return job
+
+    def next_pending(self):
+        """Primera feina pendent; les que estaven en marxa abans d'un reinici tenen prioritat."""
+        with self._lock:
+            row = self._db.execute(
+                "SELECT id FROM jobs WHERE status IN ('running', 'queued') "
+                "ORDER BY status = 'running' DESC, created LIMIT 1"
+            ).fetchone()
+        return row['id'] if row else None
+
+    def _update(self, job_id, **fields):
+        fields['updated'] = time.time()
+        columns = ", ".join(f"{name} = ?" for name in fields)
+        with self._lock, self._db:
+            self._db.execute(f"UPDATE jobs SET {columns} WHERE id = ?", (*fields.values(), job_id))
+
+    def save_window(self, job_id, next_offset, segments, language):
+        self._update(job_id, status='running', next_offset=next_offset,
+                     segments=json.dumps(segments, ensure_ascii=False), language=language)
+
+    def finish(self, job_id, status='done', error=None):
+        self._update(job_id, status=status, error=error)
+        try:
+            os.remove(self.audio_path(job_id))
+        except OSError:
+            pass
+
+
+class JobRunner:
+    """
+    Fil que processa les feines pendents finestra a finestra.
+
+    `transcribe(audio, model, language, prompt)` ha de retornar un diccionari
+    amb `text` i `language`.
+    """
+
+    def __init__(self, store, transcribe):
+        self.store = store
+        self.transcribe = transcribe
+        self._thread = None
+
+    def start(self):
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._loop, name="job-runner", daemon=True)
+            self._thread.start()
+            # Reprendre les feines que hagin quedat a mitges
+            self.store.wakeup.set()
+
+    def _loop(self):
+        while True:
+            self.store.wakeup.wait()
+            self.store.wakeup.clear()
+            while True:
+                job_id = self.store.next_pending()
+                if job_id is None:
+                    break
+                try:
+                    self.run_job(job_id)
+                except Exception as e:
+                    print(f"Error processant la feina {job_id}: {e}")
+                    self.store.finish(job_id, status='error', error=str(e))
+
+    def run_job(self, job_id):
+        job = self.store.get(job_id)
+        audio = np.load(self.store.audio_path(job_id), mmap_mode='r')
+        segments = job['segments']
+        language = job['language']
+        window = WINDOW_SECONDS * SAMPLE_RATE
+        offset = int(round(job['next_offset'] * SAMPLE_RATE))
+
+        while offset < len(audio):
+            end = min(len(audio), offset + window)
+            chunk = np.array(audio[offset:end])
+            if end < len(audio):
+                # Tallar pel silenci de l'últim segon per no partir paraules entre finestres
+                chunk = chunk[:quietest_split(chunk, SAMPLE_RATE)]
+
+            prompt = " ".join(s['text'] for s in segments[-3:] if s['text'])[-200:] or None
+            result = self.transcribe(chunk, job['model'], language, prompt)
+            language = language or result.get('language')
+            segments.append({
+                'start': round(offset / SAMPLE_RATE, 2),
+                'end': round((offset + len(chunk)) / SAMPLE_RATE, 2),
+                'text': result['text'],
+            })
+            offset += len(chunk)
+            self.store.save_window(job_id, offset / SAMPLE_RATE, segments, language)
+
+        self.store.finish(job_id)
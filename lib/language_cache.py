@@ -0,0 +1,55 @@
+import threading
+import time
+from collections import OrderedDict
+
+
+class SessionLanguageCache:
+    """
+    Idioma detectat per a cada sessió de client.
+
+    Els fragments d'una mateixa conversa comparteixen idioma: el primer que
+    es detecta amb prou confiança (`min_probability`) es reutilitza per als
+    fragments següents durant `ttl_seconds`, de manera que Whisper no torna
+    a fer la detecció d'idioma a cada fragment. Una detecció poc segura no
+    es desa i el fragment següent torna a detectar.
+    """
+
+    def __init__(self, ttl_seconds=600, min_probability=0.8, max_sessions=10000):
+        self.ttl = ttl_seconds
+        self.min_probability = min_probability
+        self.max_sessions = max(1, int(max_sessions))
+        self._sessions = OrderedDict()
+        self._lock = threading.Lock()
+        self.stats = {'hits': 0, 'detections': 0, 'low_confidence': 0}
+
+    def get(self, session_id):
+        """Idioma desat per a la sessió, o None si no n'hi ha o ha caducat."""
+        now = time.monotonic()
+        with self._lock:
+            entry = self._sessions.get(session_id)
+            if entry is None:
+                return None
+            language, expires = entry
+            if expires < now:
+                del self._sessions[session_id]
+                return None
+            self._sessions.move_to_end(session_id)
+            self.stats['hits'] += 1
+            return language
+
+    def put(self, session_id, language, probability):
+        """Desa l'idioma detectat si la confiança supera el llindar. Retorna si s'ha desat."""
+        with self._lock:
+            self.stats['detections'] += 1
+            if not language or probability is None or probability < self.min_probability:
+                self.stats['low_confidence'] += 1
+                return False
+            self._sessions[session_id] = (language, time.monotonic() + self.ttl)
+            self._sessions.move_to_end(session_id)
+            while len(self._sessions) > self.max_sessions:
+                self._sessions.popitem(last=False)
+            return True
+
+    def __len__(self):
+        with self._lock:
+            return len(self._sessions)
@@ -0,0 +1,119 @@
+import io
+from functools import lru_cache
+
+import numpy as np
+
+from lib.audio_decode import SAMPLE_RATE
+
+# Versió del format de log-mel que accepta el servidor (capçalera X-Mel-Version)
+MEL_FORMAT_VERSION = 1
+
+# Paràmetres de Whisper: finestra de 25 ms, salt de 10 ms, 30 s = 3000 trames
+N_FFT = 400
+HOP_LENGTH = 160
+CHUNK_SAMPLES = 30 * SAMPLE_RATE
+N_FRAMES = CHUNK_SAMPLES // HOP_LENGTH
+
+# Valor mínim possible després de normalitzar: (log10(1e-10) + 4) / 4
+MEL_FLOOR = -1.5
+
+
+def model_n_mels(name):
+    """Bandes mel que espera cada model (els large-v3 i turbo en fan servir 128)."""
+    return 128 if name in ('large', 'large-v3', 'large-v3-turbo', 'turbo') else 80
+
+
+def _hz_to_mel(freqs):
+    """Escala mel de Slaney: lineal fins a 1 kHz i logarítmica a partir d'aquí."""
+    freqs = np.asarray(freqs, dtype=np.float64)
+    f_sp = 200.0 / 3
+    mels = freqs / f_sp
+    min_log_hz, min_log_mel, logstep = 1000.0, 1000.0 / f_sp, np.log(6.4) / 27.0
+    log_region = freqs >= min_log_hz
+    mels[log_region] = min_log_mel + np.log(freqs[log_region] / min_log_hz) / logstep
+    return mels
+
+
+def _mel_to_hz(mels):
+    mels = np.asarray(mels, dtype=np.float64)
+    f_sp = 200.0 / 3
+    freqs = f_sp * mels
+    min_log_hz, min_log_mel, logstep = 1000.0, 1000.0 / f_sp, np.log(6.4) / 27.0
+    log_region = mels >= min_log_mel
+    freqs[log_region] = min_log_hz * np.exp(logstep * (mels[log_region] - min_log_mel))
+    return freqs
+
+
+@lru_cache(maxsize=None)
+def mel_filters(n_mels, sample_rate=SAMPLE_RATE, n_fft=N_FFT):
+    """Banc de filtres mel triangulars normalitzats (Slaney), com els que porta Whisper."""
+    fft_freqs = np.linspace(0, sample_rate / 2, 1 + n_fft // 2)
+    mel_freqs = _mel_to_hz(np.linspace(_hz_to_mel([0.0])[0], _hz_to_mel([sample_rate / 2])[0], n_mels + 2))
+    fdiff = np.diff(mel_freqs)
+    ramps = mel_freqs[:, None] - fft_freqs[None, :]
+    lower = -ramps[:-2] / fdiff[:-1, None]
+    upper = ramps[2:] / fdiff[1:, None]
+    weights = np.maximum(0, np.minimum(lower, upper))
+    weights *= (2.0 / (mel_freqs[2:n_mels + 2] - mel_freqs[:n_mels]))[:, None]
+    return weights.astype(np.float32)
+
+
+def log_mel_spectrogram(audio, n_mels=80):
+    """
+    Log-mel de Whisper calculat amb NumPy, equivalent a
+    `whisper.log_mel_spectrogram(whisper.pad_or_trim(audio), n_mels)`.
+    Retorna un array float32 (n_mels, 3000).
+    """
+    audio = np.asarray(audio, dtype=np.float32)[:CHUNK_SAMPLES]
+    audio = np.pad(audio, (0, CHUNK_SAMPLES - len(audio)))
+    padded = np.pad(audio, N_FFT // 2, mode='reflect')
+
+    frames = np.lib.stride_tricks.sliding_window_view(padded, N_FFT)[::HOP_LENGTH]
+    window = (0.5 - 0.5 * np.cos(2 * np.pi * np.arange(N_FFT) / N_FFT)).astype(np.float32)
+    spectrum = np.fft.rfft(frames * window, axis=-1)
+    power = (spectrum.real ** 2 + spectrum.imag ** 2)[:-1].astype(np.float32)
+
+    mel = mel_filters(n_mels) @ power.T
+    log_spec = np.log10(np.maximum(mel, 1e-10))
+    log_spec = np.maximum(log_spec, log_spec.max() - 8.0)
+    return (log_spec + 4.0) / 4.0
+
+
+def compact_mel(mel, n_samples):
+    """Descarta les trames finals, que només contenen el farciment de silenci fins a 30 s."""
+    frames = min(N_FRAMES, n_samples // HOP_LENGTH + 2)
+    return mel[:, :frames]
+
+
+def pad_mel(mel):
+    """Torna a omplir fins a 3000 trames amb el valor que hi deixaria el farciment de silenci."""
+    mel = np.asarray(mel, dtype=np.float32)
+    missing = N_FRAMES - mel.shape[1]
+    if missing <= 0:
+        return mel
+    floor = max(float(mel.max()) - 2.0, MEL_FLOOR)
+    return np.pad(mel, ((0, 0), (0, missing)), constant_values=floor)
+
+
+def encode_mel(mel):
+    """Serialitza un log-mel com a `.npy` float16."""
+    buf = io.BytesIO()
+    np.save(buf, np.ascontiguousarray(mel, dtype=np.float16), allow_pickle=False)
+    return buf.getvalue()
+
+
+def decode_mel(data, n_mels):
+    """Valida i llegeix un log-mel `.npy` pujat pel client. Llança ValueError si no és vàlid."""
+    try:
+        mel = np.load(io.BytesIO(data), allow_pickle=False)
+    except Exception as e:
+        raise ValueError(f"El cos no és un fitxer .npy vàlid: {e}")
+    if mel.dtype not in (np.float16, np.float32):
+        raise ValueError(f"Tipus de dades no acceptat: {mel.dtype} (float16 o float32)")
+    if mel.ndim != 2 or mel.shape[0] != n_mels:
+        raise ValueError(f"Forma incorrecta {mel.shape}: el model espera ({n_mels}, trames)")
+    if not 0 < mel.shape[1] <= N_FRAMES:
+        raise ValueError(f"Nombre de trames fora de rang: {mel.shape[1]} (màxim {N_FRAMES})")
+    if not np.isfinite(mel).all():
+        raise ValueError("El log-mel conté valors no finits")
+    return mel
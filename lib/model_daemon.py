@@ -0,0 +1,256 @@
+import contextlib
+import json
+import os
+import socket
+import socketserver
+import struct
+import threading
+import time
+from multiprocessing import resource_tracker, shared_memory
+
+import numpy as np
+
+from lib.audio_decode import SAMPLE_RATE
+
+# Socket del dimoni; es pot canviar amb ECHOTEXT_DAEMON_SOCKET
+SOCKET_ENV = "ECHOTEXT_DAEMON_SOCKET"
+# ECHOTEXT_DAEMON=0 fa que els scripts carreguin sempre el model ells mateixos
+DAEMON_ENV = "ECHOTEXT_DAEMON"
+PROTOCOL_VERSION = 1
+
+# Temps màxim per connectar i comprovar que el dimoni respon
+CONNECT_TIMEOUT = 0.5
+
+_HEADER = struct.Struct("!I")
+
+
+def default_socket_path():
+    base = os.environ.get("XDG_RUNTIME_DIR") or os.path.join(os.path.expanduser("~"), ".cache")
+    return os.environ.get(SOCKET_ENV) or os.path.join(base, "echotext", "whisper.sock")
+
+
+def _send(sock, message):
+    data = json.dumps(message, default=float).encode("utf-8")
+    sock.sendall(_HEADER.pack(len(data)) + data)
+
+
+def _recv_exactly(sock, n):
+    chunks = []
+    while n:
+        chunk = sock.recv(min(n, 1 << 20))
+        if not chunk:
+            raise ConnectionError("Connexió tancada")
+        chunks.append(chunk)
+        n -= len(chunk)
+    return b"".join(chunks)
+
+
+def _recv(sock):
+    (size,) = _HEADER.unpack(_recv_exactly(sock, _HEADER.size))
+    return json.loads(_recv_exactly(sock, size))
+
+
+def _attach(name):
+    """Obre un segment de memòria compartida creat per un client, sense fer-se'n propietari."""
+    try:
+        return shared_memory.SharedMemory(name=name, track=False)
+    except TypeError:
+        # Abans de Python 3.13 el segment es registra i s'esborraria en tancar el dimoni
+        shm = shared_memory.SharedMemory(name=name)
+        resource_tracker.unregister(shm._name, "shared_memory")
+        return shm
+
+
+class DaemonModel:
+    """
+    Client del dimoni del model, amb la mateixa crida `transcribe` que un
+    model Whisper.
+
+    L'àudio (float32 a 16 kHz) es copia a un segment de memòria compartida
+    del client, que es reutilitza entre crides i només creix si cal, i pel
+    socket només viatgen el nom del segment i les opcions. Els camins de
+    fitxer s'envien tal qual: el dimoni els llegeix directament.
+    """
+
+    def __init__(self, socket_path=None, timeout=CONNECT_TIMEOUT):
+        self.socket_path = socket_path or default_socket_path()
+        self._sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        self._sock.settimeout(timeout)
+        self._sock.connect(self.socket_path)
+        self._lock = threading.Lock()
+        self._shm = None
+        self.info = self._call({'op': 'ping'}, timeout)
+        self.name = self.info['model']
+        self.device = self.info['device']
+
+    def _call(self, request, timeout=None):
+        with self._lock:
+            self._sock.settimeout(timeout)
+            try:
+                _send(self._sock, request)
+                reply = _recv(self._sock)
+            except (OSError, ValueError) as e:
+                raise RuntimeError(f"El dimoni del model no respon ({self.socket_path}): {e}") from e
+        if not reply.get('ok'):
+            raise RuntimeError(f"Error del dimoni del model: {reply.get('error')}")
+        return reply
+
+    def _buffer(self, nbytes):
+        if self._shm is None or self._shm.size < nbytes:
+            self._release_buffer()
+            self._shm = shared_memory.SharedMemory(create=True, size=max(nbytes, 1))
+        return self._shm
+
+    def _release_buffer(self):
+        if self._shm is not None:
+            self._shm.close()
+            self._shm.unlink()
+            self._shm = None
+
+    def transcribe(self, audio, **options):
+        """Transcriu un fitxer o un array d'àudio (16 kHz) al dimoni i en retorna el resultat."""
+        if isinstance(audio, (str, os.PathLike)):
+            return self._call({'op': 'transcribe', 'path': os.path.abspath(audio), 'options': options})['result']
+        audio = np.asarray(audio, dtype=np.float32).reshape(-1)
+        shm = self._buffer(audio.nbytes)
+        np.ndarray(audio.shape, dtype=np.float32, buffer=shm.buf)[:] = audio
+        request = {'op': 'transcribe', 'shm': shm.name, 'samples': int(audio.size), 'options': options}
+        return self._call(request)['result']
+
+    def close(self):
+        self._release_buffer()
+        self._sock.close()
+
+    def __del__(self):
+        try:
+            self.close()
+        except Exception:
+            pass
+
+
+def connect(name=None, socket_path=None):
+    """
+    Connecta amb el dimoni si està en marxa i serveix el model `name`.
+    Retorna un `DaemonModel`, o None si s'ha de carregar el model al procés.
+    """
+    if os.environ.get(DAEMON_ENV, "1") == "0":
+        return None
+    path = socket_path or default_socket_path()
+    if not os.path.exists(path):
+        return None
+    try:
+        daemon = DaemonModel(path)
+    except (OSError, RuntimeError):
+        return None
+    if name is not None and daemon.name != name:
+        print(f"Avís: el dimoni serveix el model '{daemon.name}', no '{name}'. Es carregarà el model localment.")
+        daemon.close()
+        return None
+    return daemon
+
+
+def load_model(name, precision=None, device=None):
+    """
+    El model `name` del dimoni si està en marxa; si no, el carrega en aquest
+    procés (`lib.model_loader.load_model`). torch i whisper només s'importen
+    en el segon cas.
+    """
+    daemon = connect(name)
+    if daemon is not None:
+        return daemon
+    from lib.model_loader import load_model as load_local_model
+    return load_local_model(name, precision=precision, device=device)
+
+
+def inference_context(model):
+    """`lib.model_loader.inference_context` per als models locals; el dimoni ja aplica la seva precisió."""
+    if isinstance(model, DaemonModel):
+        return contextlib.nullcontext()
+    from lib.model_loader import inference_context as local_context
+    return local_context(model)
+
+
+def describe(model):
+    """Text curt amb on s'executa el model, per als missatges dels scripts."""
+    if isinstance(model, DaemonModel):
+        return f"dimoni {model.socket_path} ({model.device}, {model.info['precision']})"
+    return str(next(model.parameters()).device)
+
+
+class _Handler(socketserver.BaseRequestHandler):
+    def handle(self):
+        while True:
+            try:
+                request = _recv(self.request)
+            except (ConnectionError, OSError, ValueError):
+                return
+            try:
+                reply = self.server.dispatch(request)
+            except Exception as e:
+                reply = {'ok': False, 'error': str(e)}
+            try:
+                _send(self.request, reply)
+            except OSError:
+                return
+
+
+class ModelDaemon(socketserver.ThreadingUnixStreamServer):
+    """
+    Dimoni que manté un model carregat i transcriu per als scripts locals
+    per un socket Unix. Cada client té la seva connexió; les inferències es
+    fan d'una en una amb el mateix model.
+    """
+
+    daemon_threads = True
+
+    def __init__(self, model, name, socket_path=None):
+        from lib.model_loader import inference_context as local_context
+        self.model = model
+        self.name = name
+        self.socket_path = socket_path or default_socket_path()
+        self.stats = {'requests': 0, 'audio_seconds': 0.0, 'busy_seconds': 0.0}
+        self._local_context = local_context
+        self._model_lock = threading.Lock()
+
+        os.makedirs(os.path.dirname(self.socket_path), mode=0o700, exist_ok=True)
+        if os.path.exists(self.socket_path):
+            try:
+                DaemonModel(self.socket_path).close()
+            except (OSError, RuntimeError):
+                # Socket d'un dimoni que no es va tancar bé
+                os.unlink(self.socket_path)
+            else:
+                raise RuntimeError(f"Ja hi ha un dimoni en marxa a {self.socket_path}")
+        super().__init__(self.socket_path, _Handler)
+        os.chmod(self.socket_path, 0o600)
+
+    def dispatch(self, request):
+        op = request.get('op')
+        if op == 'ping':
+            return {'ok': True, 'version': PROTOCOL_VERSION, 'model': self.name,
+                    'device': str(self.model.device), 'precision': getattr(self.model, 'precision', 'fp32')}
+        if op != 'transcribe':
+            return {'ok': False, 'error': f"Operació desconeguda: {op}"}
+
+        if 'shm' in request:
+            shm = _attach(request['shm'])
+            try:
+                audio = np.ndarray((request['samples'],), dtype=np.float32, buffer=shm.buf).copy()
+            finally:
+                shm.close()
+            self.stats['audio_seconds'] += len(audio) / SAMPLE_RATE
+        else:
+            audio = request['path']
+
+        with self._model_lock:
+            start = time.monotonic()
+            with self._local_context(self.model):
+                result = self.model.transcribe(audio, **request.get('options', {}))
+            self.stats['busy_seconds'] += time.monotonic() - start
+            self.stats['requests'] += 1
+        return {'ok': True, 'result': result}
+
+    def server_close(self):
+        super().server_close()
+        if os.path.exists(self.socket_path):
+            os.unlink(self.socket_path)
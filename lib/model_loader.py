@@ -0,0 +1,84 @@
+import contextlib
+
+import torch
+import torch.nn as nn
+
+from lib import weight_cache
+
+# Els modes es defineixen a part perquè es puguin consultar sense importar torch
+from lib.precision import PRECISIONS, default_precision
+
+
+def bf16_supported(device):
+    """Cert si el dispositiu té bfloat16 nadiu (a la CPU: AVX512-BF16 o AMX)."""
+    if str(device).startswith('cuda'):
+        return torch.cuda.is_bf16_supported()
+    try:
+        with open("/proc/cpuinfo", 'r') as f:
+            flags = f.read()
+    except OSError:
+        return False
+    return 'avx512_bf16' in flags or 'amx_bf16' in flags
+
+
+def _quantize_int8(model):
+    """
+    Quantització dinàmica int8 de les capes lineals.
+    Whisper fa servir una subclasse pròpia de `nn.Linear` i `quantize_dynamic`
+    només reconeix el tipus exacte: com que la subclasse només canvia el
+    `forward` per adaptar el dtype dels pesos, se'ls torna a la classe base.
+    """
+    for module in model.modules():
+        if isinstance(module, nn.Linear) and type(module) is not nn.Linear:
+            module.__class__ = nn.Linear
+    return torch.ao.quantization.quantize_dynamic(model, {nn.Linear}, dtype=torch.qint8)
+
+
+def apply_precision(model, precision):
+    """
+    Prepara el model per al mode de precisió demanat. Retorna `(model, mode)`,
+    on el mode pot ser `fp32` si el demanat no és possible en aquest dispositiu.
+    """
+    precision = (precision or 'fp32').lower()
+    if precision not in PRECISIONS:
+        raise ValueError(f"Precisió desconeguda: {precision}. Opcions: {', '.join(PRECISIONS)}")
+
+    device = model.device
+    if precision == 'int8':
+        if device.type != 'cpu':
+            print("ALERTA: la quantització int8 només està disponible a la CPU. Es fa servir fp32.")
+            precision = 'fp32'
+        else:
+            model = _quantize_int8(model)
+    elif precision == 'bf16':
+        if not bf16_supported(device):
+            print("ALERTA: aquest dispositiu no té bfloat16 nadiu. Es fa servir fp32.")
+            precision = 'fp32'
+        else:
+            # Sota autocast l'encoder retorna bf16 i `decode` espera float32
+            model.encoder.register_forward_hook(lambda module, inputs, output: output.float())
+
+    model.precision = precision
+    return model, precision
+
+
+def inference_context(model):
+    """
+    Context per a les crides d'inferència (`decode`, `transcribe`,
+    `detect_language`): activa l'autocast bfloat16 si el model el fa servir.
+    """
+    if getattr(model, 'precision', 'fp32') == 'bf16':
+        return torch.autocast(model.device.type, dtype=torch.bfloat16)
+    return contextlib.nullcontext()
+
+
+def load_model(name, precision=None, device=None):
+    """Carrega un model Whisper en el mode de precisió demanat (per defecte, el de l'entorn)."""
+    precision = precision or default_precision()
+    if precision == 'int8' and device is None:
+        # La quantització dinàmica només funciona a la CPU
+        device = 'cpu'
+    # Pesos mapats a memòria des de la conversió a la memòria cau de whisper
+    model = weight_cache.load_model(name, device=device)
+    model, _ = apply_precision(model, precision)
+    return model
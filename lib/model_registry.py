@@ -0,0 +1,177 @@
+import threading
+import time
+from contextlib import contextmanager
+
+
+def _state_bytes(value):
+    if hasattr(value, 'element_size'):
+        return value.numel() * value.element_size()
+    # Les capes quantitzades desen els pesos empaquetats com a tuples
+    if isinstance(value, (tuple, list)):
+        return sum(_state_bytes(v) for v in value)
+    return 0
+
+
+def model_size_mb(model):
+    """Mida aproximada dels pesos i buffers d'un model torch (també quantitzat), en MB."""
+    return sum(_state_bytes(v) for v in model.state_dict(keep_vars=True).values()) / (1024 * 1024)
+
+
+class _Entry:
+    def __init__(self, name):
+        self.name = name
+        self.model = None       # Model resident al dispositiu
+        self.cold = None        # Còpia a la CPU d'un model expulsat de la GPU
+        self.size_mb = None
+        self.last_used = 0.0
+        self.users = 0
+        self.pinned = False
+        self.loads = 0
+        self.load_seconds = 0.0
+        self.lock = threading.Lock()
+
+
+class ModelRegistry:
+    """
+    Registre de models Whisper carregats sota demanda.
+
+    Cada model es carrega la primera vegada que es demana. Els models que no
+    s'estan fent servir s'expulsen (el menys usat recentment primer) quan se
+    supera el pressupost de memòria o quan porten massa temps inactius. Amb
+    GPU, un model expulsat es queda com a còpia a la CPU perquè tornar-lo a
+    pujar sigui ràpid; a la CPU es torna a carregar des de la memòria cau
+    local de checkpoints, sense cap descàrrega.
+    """
+
+    def __init__(self, loader, device=None, memory_budget_mb=0, idle_timeout_s=0):
+        self.loader = loader
+        self.device = device
+        self.memory_budget_mb = memory_budget_mb
+        self.idle_timeout_s = idle_timeout_s
+        self._entries = {}
+        self._lock = threading.Lock()
+        self._janitor = None
+
+    def start(self):
+        """Arrenca l'expulsió per inactivitat (després de crear les rèpliques, que fan fork())."""
+        if self.idle_timeout_s and self._janitor is None:
+            self._janitor = threading.Thread(target=self._idle_loop, name="model-janitor", daemon=True)
+            self._janitor.start()
+
+    def _entry(self, name):
+        with self._lock:
+            if name not in self._entries:
+                self._entries[name] = _Entry(name)
+            return self._entries[name]
+
+    def add(self, name, model, pinned=False, load_seconds=0.0):
+        """Registra un model ja carregat (p. ex. el model per defecte)."""
+        entry = self._entry(name)
+        with entry.lock:
+            entry.model = model
+            entry.load_seconds = load_seconds
+            entry.loads += 1
+            entry.size_mb = model_size_mb(model)
+            entry.pinned = pinned
+            entry.last_used = time.monotonic()
+
+    def _ensure_loaded(self, entry):
+        """Carrega el model si cal (cal tenir `entry.lock`)."""
+        if entry.model is not None:
+            return
+        # Fer lloc abans de carregar si ja en coneixem la mida
+        if entry.size_mb:
+            self._enforce_budget(incoming_mb=entry.size_mb, exclude=entry)
+
+        start = time.time()
+        if entry.cold is not None:
+            entry.model, entry.cold = entry.cold.to(self.device), None
+            origin = "des de la còpia a la CPU"
+        else:
+            entry.model = self.loader(entry.name)
+            origin = "des de disc"
+        entry.load_seconds = time.time() - start
+        entry.loads += 1
+        entry.size_mb = model_size_mb(entry.model)
+        print(f"Model Whisper ({entry.name}) carregat {origin} en {entry.load_seconds:.2f}s.")
+
+    @contextmanager
+    def use(self, name):
+        """Context que retorna el model i evita que s'expulsi mentre s'utilitza."""
+        entry = self._entry(name)
+        with entry.lock:
+            self._ensure_loaded(entry)
+            entry.users += 1
+            entry.last_used = time.monotonic()
+            model = entry.model
+        try:
+            self._enforce_budget(exclude=entry)
+            yield model
+        finally:
+            with entry.lock:
+                entry.users -= 1
+                entry.last_used = time.monotonic()
+
+    def _resident(self):
+        with self._lock:
+            return [e for e in self._entries.values() if e.model is not None]
+
+    def _evict(self, entry, reason):
+        """Expulsa un model (cal tenir `entry.lock`)."""
+        if entry.model is None or entry.users or entry.pinned:
+            return False
+        if self.device is not None and str(self.device).startswith('cuda'):
+            entry.cold = entry.model.cpu()
+        entry.model = None
+        print(f"Model Whisper ({entry.name}) expulsat: {reason}.")
+        return True
+
+    def _enforce_budget(self, incoming_mb=0.0, exclude=None):
+        if not self.memory_budget_mb:
+            return
+        candidates = sorted(self._resident(), key=lambda e: e.last_used)
+        used = sum(e.size_mb or 0 for e in candidates) + incoming_mb
+        for entry in candidates:
+            if used <= self.memory_budget_mb:
+                break
+            if entry is exclude:
+                continue
+            # No bloquejar si algú està carregant o fent servir aquest model
+            if not entry.lock.acquire(blocking=False):
+                continue
+            try:
+                if self._evict(entry, "pressupost de memòria superat"):
+                    used -= entry.size_mb or 0
+            finally:
+                entry.lock.release()
+
+    def _idle_loop(self):
+        while True:
+            time.sleep(max(1.0, self.idle_timeout_s / 4))
+            now = time.monotonic()
+            with self._lock:
+                entries = list(self._entries.values())
+            for entry in entries:
+                if now - entry.last_used < self.idle_timeout_s:
+                    continue
+                with entry.lock:
+                    if entry.model is not None:
+                        self._evict(entry, f"inactiu més de {self.idle_timeout_s:.0f}s")
+                    elif entry.cold is not None and now - entry.last_used > 2 * self.idle_timeout_s:
+                        entry.cold = None
+
+    def stats(self):
+        with self._lock:
+            entries = list(self._entries.values())
+        now = time.monotonic()
+        return [{
+            'name': e.name,
+            'resident': e.model is not None,
+            'cold_copy': e.cold is not None,
+            'pinned': e.pinned,
+            'in_use': e.users,
+            'size_mb': round(e.size_mb, 1) if e.size_mb else None,
+            'idle_seconds': round(now - e.last_used, 1) if e.last_used else None,
+            'loads': e.loads,
+            'last_load_seconds': round(e.load_seconds, 2),
+        } for e in entries]
@@ -0,0 +1,11 @@
+import os
+
+# Modes de precisió de la inferència
+PRECISIONS = ('fp32', 'bf16', 'int8')
+
+# Variable d'entorn per triar el mode quan no es passa explícitament
+PRECISION_ENV = "ECHOTEXT_PRECISION"
+
+
+def default_precision():
+    return os.environ.get(PRECISION_ENV, "fp32").lower()
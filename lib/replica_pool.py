@@ -0,0 +1,310 @@
+import os
+import queue
+import signal
+import socket
+import struct
+import threading
+import time
+from multiprocessing.connection import Connection
+
+_SPAWN = struct.Struct("!ii")
+
+# Missatge que demana l'estat a una rèplica sense executar cap lot
+STATUS = 'status'
+
+
+def memory_usage(pid="self"):
+    """
+    Retorna l'ús de memòria d'un procés en MB a partir de /proc.
+    `pss` reparteix les pàgines compartides entre els processos que les
+    comparteixen i `private` és el que realment costa cada procés.
+    """
+    fields = {'Rss': 'rss', 'Pss': 'pss', 'Shared_Clean': 'shared', 'Shared_Dirty': 'shared',
+              'Private_Clean': 'private', 'Private_Dirty': 'private'}
+    usage = {'rss': 0.0, 'pss': 0.0, 'shared': 0.0, 'private': 0.0}
+    try:
+        with open(f"/proc/{pid}/smaps_rollup", 'r') as f:
+            for line in f:
+                name, _, value = line.partition(':')
+                if name in fields:
+                    usage[fields[name]] += int(value.split()[0]) / 1024.0
+    except OSError:
+        return None
+    return {k: round(v, 1) for k, v in usage.items()}
+
+
+def _replica_main(index, conn, run_batch, threads, init=None, status=None):
+    """
+    Bucle d'un procés rèplica: rep lots, els executa i retorna el resultat
+    amb el temps, la memòria i l'estat de la rèplica (`status()`). El
+    missatge `STATUS` només en demana l'estat.
+    """
+    import torch
+
+    # Ctrl+C l'ha de gestionar el procés pare
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    torch.set_num_threads(threads)
+    if init is not None:
+        init()
+
+    while True:
+        try:
+            message = conn.recv()
+        except (EOFError, KeyboardInterrupt):
+            break
+        if message is None:
+            break
+
+        start = time.perf_counter()
+        if message == STATUS:
+            outcome = ('ok', None)
+        else:
+            key, payloads = message
+            try:
+                outcome = ('ok', run_batch(key, payloads))
+            except Exception as e:
+                outcome = ('error', f"{type(e).__name__}: {e}")
+        conn.send(outcome + (time.perf_counter() - start, memory_usage(), status() if status else None))
+
+
+def _template_main(ctl, run_batch, threads, init=None, status=None):
+    """
+    Procés plantilla: es crea amb fork() quan el pare encara no té cap altre
+    fil i després només fa fork() de rèpliques, sempre des d'un procés d'un
+    sol fil. Cada rèplica rep el seu extrem del canal i l'altre s'envia al pare.
+    """
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    # Les rèpliques mortes es recullen soles, sense zombis
+    signal.signal(signal.SIGCHLD, signal.SIG_IGN)
+    while True:
+        try:
+            data = ctl.recv(4)
+        except OSError:
+            break
+        if len(data) < 4:
+            break
+        (index,) = struct.unpack("!i", data)
+        parent_end, child_end = socket.socketpair()
+        pid = os.fork()
+        if pid == 0:
+            ctl.close()
+            parent_end.close()
+            signal.signal(signal.SIGCHLD, signal.SIG_DFL)
+            try:
+                _replica_main(index, Connection(child_end.detach()), run_batch, threads, init, status)
+            finally:
+                os._exit(0)
+        child_end.close()
+        socket.send_fds(ctl, [_SPAWN.pack(index, pid)], [parent_end.fileno()])
+        parent_end.close()
+    os._exit(0)
+
+
+class _ReplicaProcess:
+    """Procés d'una rèplica, que és filla del procés plantilla i no del servidor."""
+
+    def __init__(self, pid):
+        self.pid = pid
+
+    def is_alive(self):
+        try:
+            os.kill(self.pid, 0)
+        except ProcessLookupError:
+            return False
+        except PermissionError:
+            pass
+        return True
+
+    def join(self, timeout=None):
+        deadline = None if timeout is None else time.monotonic() + timeout
+        while self.is_alive() and (deadline is None or time.monotonic() < deadline):
+            time.sleep(0.05)
+
+
+class _Replica:
+    def __init__(self, index):
+        self.index = index
+        self.process = None
+        self.conn = None
+        self.batches = 0
+        self.items = 0
+        self.audio_seconds = 0.0
+        self.busy_seconds = 0.0
+        self.memory = None
+        self.status = None
+
+
+class ReplicaPool:
+    """
+    Conjunt de processos rèplica creats amb fork() després de carregar el model.
+
+    Els pesos del model es carreguen una sola vegada al procés pare; els fills
+    els comparteixen en còpia-en-escriptura. S'ha de crear abans d'arrencar
+    cap altre fil: un fork() mentre un altre fil té un lock agafat deixaria
+    el lock bloquejat per sempre al fill. Per això les rèpliques, també les
+    que es tornen a crear quan una mor, es fan des d'un procés plantilla
+    d'un sol fil, creat amb un únic fork() a l'inici. Cada rèplica té el seu propi
+    pressupost de fils de torch i un distribuïdor envia cada lot a una rèplica
+    lliure. `run_batch(key, payloads)` s'executa dins de la rèplica.
+    `duration(payload)` dona els segons d'àudio de cada petició (per defecte,
+    mostres a `sample_rate`). `init()` s'executa a cada rèplica en arrencar
+    (p. ex. per engegar-hi fils, que no sobreviuen al fork()) i `status()`
+    hi dona l'estat que retorna `statuses()`.
+    """
+
+    def __init__(self, run_batch, replicas, threads_per_replica=None, sample_rate=16000, duration=None,
+                 init=None, status=None):
+        self.run_batch = run_batch
+        self.threads = threads_per_replica or max(1, (os.cpu_count() or 1) // replicas)
+        self.sample_rate = sample_rate
+        self.duration = duration or (lambda payload: len(payload) / self.sample_rate)
+        self._replicas = [_Replica(i) for i in range(replicas)]
+        self._idle = queue.Queue()
+        self._lock = threading.Lock()
+        self._spawn_lock = threading.Lock()
+        self.started = time.monotonic()
+
+        self._ctl, template_ctl = socket.socketpair()
+        self._template_pid = os.fork()
+        if self._template_pid == 0:
+            self._ctl.close()
+            try:
+                _template_main(template_ctl, run_batch, self.threads, init, status)
+            finally:
+                os._exit(0)
+        template_ctl.close()
+
+        for replica in self._replicas:
+            self._spawn(replica)
+            self._idle.put(replica)
+
+    def __len__(self):
+        return len(self._replicas)
+
+    def _spawn(self, replica):
+        """Demana una rèplica nova al procés plantilla (segur encara que el servidor tingui fils)."""
+        with self._spawn_lock:
+            self._ctl.sendall(struct.pack("!i", replica.index))
+            data, fds, _, _ = socket.recv_fds(self._ctl, _SPAWN.size, 1)
+        if len(data) < _SPAWN.size or not fds:
+            raise RuntimeError("El procés plantilla de les rèpliques no respon")
+        _, pid = _SPAWN.unpack(data)
+        if replica.conn is not None:
+            replica.conn.close()
+        replica.process = _ReplicaProcess(pid)
+        replica.conn = Connection(fds[0])
+
+    def dispatch(self, key, payloads):
+        """Executa un lot a la primera rèplica lliure (bloqueja si no n'hi ha cap)."""
+        replica = self._idle.get()
+        try:
+            try:
+                replica.conn.send((key, payloads))
+                status, value, elapsed, memory, replica_status = replica.conn.recv()
+            except (EOFError, OSError, BrokenPipeError):
+                print(f"ALERTA: la rèplica {replica.index} ha mort. Tornant-la a crear...")
+                self._spawn(replica)
+                raise RuntimeError(f"La rèplica {replica.index} ha mort durant la inferència")
+
+            with self._lock:
+                replica.batches += 1
+                replica.items += len(payloads)
+                replica.audio_seconds += sum(self.duration(p) for p in payloads)
+                replica.busy_seconds += elapsed
+                replica.memory = memory
+                replica.status = replica_status
+
+            if status == 'error':
+                raise RuntimeError(value)
+            return value
+        finally:
+            self._idle.put(replica)
+
+    def broadcast(self, key, payloads):
+        """Executa el mateix lot a totes les rèpliques (p. ex. per escalfar-les)."""
+        replicas = [self._idle.get() for _ in self._replicas]
+        try:
+            for replica in replicas:
+                replica.conn.send((key, payloads))
+            errors = []
+            for replica in replicas:
+                status, value, elapsed, memory, replica_status = replica.conn.recv()
+                with self._lock:
+                    replica.memory = memory
+                    replica.status = replica_status
+                if status == 'error':
+                    errors.append(f"rèplica {replica.index}: {value}")
+            if errors:
+                raise RuntimeError("; ".join(errors))
+        finally:
+            for replica in replicas:
+                self._idle.put(replica)
+
+    def statuses(self):
+        """
+        Estat de cada rèplica (el que retorna `status()` a dins), per ordre
+        d'índex. Les lliures es consulten ara; de les ocupades es dona l'estat
+        que van retornar amb l'últim lot, sense esperar que acabin.
+        """
+        idle = []
+        while True:
+            try:
+                idle.append(self._idle.get_nowait())
+            except queue.Empty:
+                break
+        try:
+            for replica in idle:
+                try:
+                    replica.conn.send(STATUS)
+                    _, _, _, memory, replica_status = replica.conn.recv()
+                except (EOFError, OSError, BrokenPipeError):
+                    continue
+                with self._lock:
+                    replica.memory = memory
+                    replica.status = replica_status
+        finally:
+            for replica in idle:
+                self._idle.put(replica)
+        with self._lock:
+            return [r.status for r in self._replicas]
+
+    def stats(self):
+        """Memòria i rendiment per rèplica, per dimensionar quantes en caben."""
+        wall = time.monotonic() - self.started
+        with self._lock:
+            replicas = []
+            for r in self._replicas:
+                replicas.append({
+                    'index': r.index,
+                    'pid': r.process.pid,
+                    'alive': r.process.is_alive(),
+                    'threads': self.threads,
+                    'batches': r.batches,
+                    'requests': r.items,
+                    'audio_seconds': round(r.audio_seconds, 2),
+                    'busy_seconds': round(r.busy_seconds, 2),
+                    # Segons d'àudio processats per segon de càlcul (factor sobre temps real)
+                    'speed': round(r.audio_seconds / r.busy_seconds, 2) if r.busy_seconds else None,
+                    'memory_mb': r.memory or memory_usage(r.process.pid),
+                })
+            total_audio = sum(r.audio_seconds for r in self._replicas)
+
+        return {
+            'replicas': replicas,
+            'parent_memory_mb': memory_usage(),
+            'private_mb_per_replica': round(
+                sum(r['memory_mb']['private'] for r in replicas if r['memory_mb']) / len(replicas), 1
+            ) if all(r['memory_mb'] for r in replicas) else None,
+            'throughput_audio_s_per_s': round(total_audio / wall, 2) if wall else None,
+        }
+
+    def close(self):
+        for replica in self._replicas:
+            try:
+                replica.conn.send(None)
+            except (OSError, BrokenPipeError):
+                pass
+        for replica in self._replicas:
+            replica.process.join(timeout=5)
+        self._ctl.close()
+        os.waitpid(self._template_pid, 0)
@@ -0,0 +1,162 @@
+import builtins
+import collections
+import os
+import shlex
+import subprocess
+import threading
+import time
+
+# Programa de veu i com se li passen els missatges:
+# `argv` llança un procés per missatge amb el text com a argument (echovoice)
+# i `stdin` manté un sol procés obert i li escriu una línia per missatge
+# (per a programes que llegeixen de l'entrada estàndard, com `espeak-ng`)
+DEFAULT_COMMAND = "echovoice"
+TTS_ENV = "ECHOTEXT_TTS"
+MODE_ENV = "ECHOTEXT_TTS_MODE"
+MODES = ('argv', 'stdin')
+
+
+class SpeechWorker:
+    """
+    Diu en segon pla els missatges que se li encuen, perquè la veu no
+    bloquegi el bucle principal.
+
+    Un sol fil parla els missatges en ordre. Si es queda enrere, tots els
+    pendents s'ajunten en una sola frase (un sol procés), els que fa més de
+    `max_age` segons que esperen es descarten i, si n'hi ha més de
+    `max_pending`, es descarta el més antic. `stats` compta els processos
+    llançats i el retard màxim entre encuar un missatge i començar a dir-lo.
+    """
+
+    def __init__(self, command=None, mode=None, max_pending=8, max_age=10.0):
+        command = command or os.environ.get(TTS_ENV) or DEFAULT_COMMAND
+        self.command = shlex.split(command) if isinstance(command, str) else list(command)
+        self.mode = mode or os.environ.get(MODE_ENV) or 'argv'
+        if self.mode not in MODES:
+            raise ValueError(f"Mode de veu desconegut: {self.mode}. Opcions: {', '.join(MODES)}")
+        self.max_pending = max(1, int(max_pending))
+        self.max_age = max_age
+        self.available = True
+        self.stats = {'messages': 0, 'spoken': 0, 'coalesced': 0, 'dropped': 0,
+                      'spawns': 0, 'errors': 0, 'max_lag': 0.0}
+        self._pending = collections.deque()   # (moment d'encuar, text)
+        self._process = None
+        self._busy = False
+        self._running = True
+        self._cond = threading.Condition()
+        self._thread = threading.Thread(target=self._worker_loop, name="speech-worker", daemon=True)
+        self._thread.start()
+
+    def say(self, text):
+        """Encua un missatge sense esperar que es digui."""
+        text = " ".join(str(text).split())
+        if not text or not self.available:
+            return
+        with self._cond:
+            self._pending.append((time.monotonic(), text))
+            self.stats['messages'] += 1
+            while len(self._pending) > self.max_pending:
+                self._pending.popleft()
+                self.stats['dropped'] += 1
+            self._cond.notify_all()
+
+    def lag(self):
+        """Segons que fa que espera el missatge pendent més antic."""
+        with self._cond:
+            return time.monotonic() - self._pending[0][0] if self._pending else 0.0
+
+    def wait(self, timeout=None):
+        """Espera que s'hagin dit tots els missatges pendents. Retorna False si s'esgota el temps."""
+        with self._cond:
+            return self._cond.wait_for(lambda: not self._pending and not self._busy, timeout)
+
+    def close(self, timeout=None):
+        """Diu els missatges pendents (fins a `timeout` segons) i tanca el procés de veu."""
+        self.wait(timeout)
+        with self._cond:
+            self._running = False
+            self._pending.clear()
+            self._cond.notify_all()
+        self._thread.join(timeout)
+        if self._process is not None:
+            try:
+                self._process.stdin.close()
+                self._process.wait(timeout)
+            except (OSError, subprocess.TimeoutExpired):
+                self._process.kill()
+            self._process = None
+
+    def summary(self):
+        s = self.stats
+        return (f"{s['spoken']} missatges dits amb {s['spawns']} processos de veu, "
+                f"{s['coalesced']} ajuntats, {s['dropped']} descartats, retard màxim {s['max_lag']:.1f}s")
+
+    def _take(self):
+        """Espera missatges i els retorna ajuntats en un sol text, o None en tancar."""
+        with self._cond:
+            self._busy = False
+            self._cond.notify_all()
+            while True:
+                self._cond.wait_for(lambda: self._pending or not self._running)
+                if not self._running:
+                    return None
+                now = time.monotonic()
+                texts = []
+                while self._pending:
+                    queued, text = self._pending.popleft()
+                    if now - queued > self.max_age:
+                        self.stats['dropped'] += 1
+                        continue
+                    self.stats['max_lag'] = max(self.stats['max_lag'], now - queued)
+                    texts.append(text)
+                if texts:
+                    self._busy = True
+                    self.stats['coalesced'] += len(texts) - 1
+                    self.stats['spoken'] += len(texts)
+                    return " ".join(texts)
+                self._cond.notify_all()
+
+    def _speak(self, text):
+        if self.mode == 'argv':
+            self.stats['spawns'] += 1
+            subprocess.run(self.command + [text], stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL, check=False)
+            return
+        if self._process is None or self._process.poll() is not None:
+            self.stats['spawns'] += 1
+            self._process = subprocess.Popen(self.command, stdin=subprocess.PIPE, stdout=subprocess.DEVNULL,
+                                             stderr=subprocess.DEVNULL, text=True, bufsize=1)
+        try:
+            self._process.stdin.write(text + "\n")
+            self._process.stdin.flush()
+        except OSError:
+            # El procés s'ha tancat: se'n llançarà un altre amb el missatge següent
+            self._process = None
+            raise
+
+    def _worker_loop(self):
+        while True:
+            text = self._take()
+            if text is None:
+                return
+            try:
+                self._speak(text)
+            except FileNotFoundError:
+                # Sense programa de veu, els missatges només s'imprimeixen
+                self.available = False
+                self.stats['errors'] += 1
+            except OSError:
+                self.stats['errors'] += 1
+
+
+def speech_print(worker, skip_separators=True):
+    """
+    Substitut de `print` que, a més d'imprimir, encua el missatge a
+    `worker`. Les línies buides (i, amb `skip_separators`, les que només
+    tenen `-` o `=`) no es diuen.
+    """
+    def _print(*args, **kwargs):
+        builtins.print(*args, **kwargs)
+        msg = " ".join(map(str, args)).strip()
+        if msg and not (skip_separators and all(c in "-=" for c in msg)):
+            worker.say(msg)
+    return _print
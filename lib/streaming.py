@@ -0,0 +1,283 @@
+import json
+import threading
+import time
+import uuid
+from urllib.parse import parse_qs, urlparse
+
+import numpy as np
+
+from lib.audio_decode import PCM_FORMATS, SAMPLE_RATE, StreamResampler, pcm_to_float32, quietest_split
+
+# Màxim d'àudio que Whisper pot processar en una sola finestra
+MAX_WINDOW_SECONDS = 30
+
+# Caràcters de text confirmat que es passen com a context al decodificador
+PROMPT_CHARS = 200
+
+
+class StreamSession:
+    """
+    Estat d'una sessió de transcripció en streaming.
+
+    Manté l'àudio pendent de confirmar en un buffer preassignat, el text ja
+    confirmat (que es passa com a context al decodificador) i la darrera
+    activitat per poder-la expulsar quan queda inactiva. Els fluxos que no
+    són de 16 kHz es remostregen de manera contínua entre fragments, i els
+    bytes d'una mostra partida entre dos fragments passen al següent.
+
+    Els parcials es calculen com a molt cada `partial_interval` segons de
+    rellotge i mai dos alhora: si la inferència és lenta se'n salten, en
+    lloc d'encuar-ne un per cada segon d'àudio rebut.
+    """
+
+    def __init__(self, language=None, sample_rate=SAMPLE_RATE, sample_format='s16le',
+                 partial_interval=1.0, final_window=10.0):
+        if sample_rate <= 0:
+            raise ValueError("La freqüència de mostreig ha de ser positiva")
+        if sample_format not in PCM_FORMATS:
+            raise ValueError(f"Format de mostra no suportat: {sample_format}")
+        self.id = uuid.uuid4().hex
+        self.language = language
+        self.sample_rate = sample_rate
+        self.sample_format = sample_format
+        self.sample_size = PCM_FORMATS[sample_format].itemsize
+        self.resampler = StreamResampler(sample_rate)
+        self.partial_interval = partial_interval
+        self.final_samples = int(min(final_window, MAX_WINDOW_SECONDS) * SAMPLE_RATE)
+        self.buffer = np.zeros(MAX_WINDOW_SECONDS * SAMPLE_RATE, dtype=np.float32)
+        self.length = 0
+        self.since_partial = 0
+        self.next_partial = time.monotonic() + partial_interval
+        self.partial_running = False
+        # Augmenta a cada final: un parcial calculat sobre àudio ja confirmat es descarta
+        self.generation = 0
+        self.leftover = b''
+        self.committed = []
+        self.last_activity = time.monotonic()
+        self.lock = threading.Lock()
+
+    def touch(self):
+        self.last_activity = time.monotonic()
+
+    @property
+    def prompt(self):
+        text = " ".join(self.committed)
+        return text[-PROMPT_CHARS:] or None
+
+    def feed(self, frame, transcribe, emit=None):
+        """
+        Afegeix un fragment PCM i retorna els esdeveniments generats. Amb
+        `emit`, els parcials es calculen en segon pla i s'envien amb
+        `emit(event)`; sense, es calculen aquí mateix.
+        """
+        with self.lock:
+            self.touch()
+            if self.leftover:
+                frame = self.leftover + bytes(frame)
+            usable = len(frame) - len(frame) % self.sample_size
+            self.leftover = bytes(frame[usable:])
+            samples = pcm_to_float32(memoryview(frame)[:usable], self.sample_format)
+            events = self._append(self.resampler.process(samples), transcribe)
+            return events + self._maybe_partial(transcribe, emit)
+
+    def _append(self, audio, transcribe):
+        events = []
+        while len(audio):
+            n = min(len(audio), len(self.buffer) - self.length)
+            self.buffer[self.length:self.length + n] = audio[:n]
+            self.length += n
+            self.since_partial += n
+            audio = audio[n:]
+
+            if self.length >= self.final_samples:
+                events.append(self._finalize(transcribe, self._quietest_cut()))
+        return events
+
+    def flush(self, transcribe):
+        """Confirma tot l'àudio pendent, incloses les mostres que el remostreig encara retenia."""
+        with self.lock:
+            self.touch()
+            events = self._append(self.resampler.flush(), transcribe)
+            if not self.length:
+                return events
+            return events + [self._finalize(transcribe, self.length)]
+
+    def _run(self, transcribe, audio):
+        return self._learn(transcribe(audio, self.language, self.prompt))
+
+    def _learn(self, result):
+        if self.language is None and result.get('language'):
+            # Un cop detectat, l'idioma es manté per a la resta de la sessió
+            self.language = result['language']
+        return result['text']
+
+    def _maybe_partial(self, transcribe, emit):
+        """Comença un parcial si toca pel rellotge, hi ha àudio nou i no n'hi ha cap en curs."""
+        now = time.monotonic()
+        if not self.since_partial or self.partial_running or now < self.next_partial:
+            return []
+        self.since_partial = 0
+        self.next_partial = now + self.partial_interval
+        audio = self.buffer[:self.length].copy()
+        if emit is None:
+            return [{'type': 'partial', 'text': self._run(transcribe, audio), 'language': self.language}]
+        self.partial_running = True
+        threading.Thread(target=self._background_partial, args=(transcribe, audio, self.generation, emit),
+                         name="stream-partial", daemon=True).start()
+        return []
+
+    def _background_partial(self, transcribe, audio, generation, emit):
+        try:
+            result = transcribe(audio, self.language, self.prompt)
+            error = None
+        except Exception as e:
+            result, error = None, str(e)
+        with self.lock:
+            self.partial_running = False
+            # El següent parcial compta des que acaba aquest, perquè la inferència no s'encadeni
+            self.next_partial = max(self.next_partial, time.monotonic() + self.partial_interval)
+            if generation != self.generation:
+                return
+            if error:
+                event = {'type': 'error', 'error': error}
+            else:
+                event = {'type': 'partial', 'text': self._learn(result), 'language': self.language}
+            # S'envia amb el lock agafat perquè cap final posterior no arribi abans
+            try:
+                emit(event)
+            except Exception:
+                pass
+
+    def _finalize(self, transcribe, cut):
+        text = self._run(transcribe, self.buffer[:cut].copy())
+        self.generation += 1
+        if text:
+            self.committed.append(text)
+
+        # L'àudio posterior al tall passa a l'inici de la finestra següent
+        rest = self.length - cut
+        self.buffer[:rest] = self.buffer[cut:self.length]
+        self.length = rest
+        self.since_partial = rest
+        return {'type': 'final', 'text': text, 'language': self.language}
+
+    def _quietest_cut(self):
+        """Talla pel punt de menys energia de l'últim segon per no partir paraules."""
+        return quietest_split(self.buffer[:self.length], SAMPLE_RATE)
+
+
+class SessionRegistry:
+    """Registre de sessions de streaming amb expulsió per inactivitat (TTL)."""
+
+    def __init__(self, ttl_seconds=60, **session_options):
+        self.ttl = ttl_seconds
+        self.session_options = session_options
+        self._sessions = {}
+        self._lock = threading.Lock()
+        self._janitor = None
+
+    def start(self):
+        """Arrenca l'expulsió de sessions inactives (només si el servidor de streaming està actiu)."""
+        if self._janitor is None:
+            self._janitor = threading.Thread(target=self._evict_loop, name="stream-janitor", daemon=True)
+            self._janitor.start()
+
+    def create(self, **kwargs):
+        session = StreamSession(**{**self.session_options, **kwargs})
+        with self._lock:
+            self._sessions[session.id] = session
+        return session
+
+    def get(self, session_id):
+        with self._lock:
+            session = self._sessions.get(session_id)
+        if session:
+            session.touch()
+        return session
+
+    def remove(self, session_id):
+        with self._lock:
+            self._sessions.pop(session_id, None)
+
+    def __len__(self):
+        with self._lock:
+            return len(self._sessions)
+
+    def _evict_loop(self):
+        while True:
+            time.sleep(max(1.0, self.ttl / 4))
+            now = time.monotonic()
+            with self._lock:
+                expired = [sid for sid, s in self._sessions.items() if now - s.last_activity > self.ttl]
+                for sid in expired:
+                    del self._sessions[sid]
+            if expired:
+                print(f"Sessions de streaming expulsades per inactivitat: {len(expired)}")
+
+
+def handle_connection(ws, registry, transcribe):
+    """
+    Gestiona una connexió WebSocket de `/stream`.
+
+    Paràmetres de la URL: `language`, `sample_rate` (defecte 16000),
+    `format` (s16le o f32le) i `session` per reprendre una sessió existent.
+    Missatges binaris: fragments PCM. Missatges de text (JSON):
+    `{"type": "flush"}` confirma l'àudio pendent i `{"type": "end"}`
+    el confirma i tanca la sessió.
+    """
+    url = urlparse(ws.request.path)
+    if url.path.rstrip('/') != '/stream':
+        ws.close(code=1008, reason='Unknown path')
+        return
+    params = {k: v[0] for k, v in parse_qs(url.query).items()}
+
+    session = registry.get(params['session']) if 'session' in params else None
+    if session is None:
+        try:
+            session = registry.create(
+                language=params.get('language') or None,
+                sample_rate=int(params.get('sample_rate', SAMPLE_RATE)),
+                sample_format=params.get('format', 's16le'),
+            )
+        except ValueError as e:
+            ws.send(json.dumps({'type': 'error', 'error': str(e)}))
+            return
+
+    ws.send(json.dumps({'type': 'session', 'session': session.id}))
+
+    def emit(event):
+        ws.send(json.dumps(event))
+
+    for message in ws:
+        ending = False
+        try:
+            if isinstance(message, bytes):
+                events = session.feed(message, transcribe, emit)
+            else:
+                command = json.loads(message).get('type')
+                ending = command == 'end'
+                events = session.flush(transcribe) if command in ('flush', 'end') else []
+        except Exception as e:
+            events = [{'type': 'error', 'error': str(e)}]
+
+        for event in events:
+            ws.send(json.dumps(event))
+
+        if ending:
+            registry.remove(session.id)
+            ws.send(json.dumps({'type': 'end', 'session': session.id}))
+            return
+
+
+def start_stream_server(host, port, registry, transcribe):
+    """Inicia el servidor WebSocket en un fil de fons. Retorna el servidor o None."""
+    try:
+        from websockets.sync.server import serve as ws_serve
+    except ImportError:
+        print("Avís: el paquet 'websockets' no està instal·lat; streaming desactivat.")
+        return None
+
+    server = ws_serve(lambda ws: handle_connection(ws, registry, transcribe), host, port, compression=None)
+    registry.start()
+    threading.Thread(target=server.serve_forever, name="stream-server", daemon=True).start()
+    return server
@@ -0,0 +1,172 @@
+import hashlib
+import json
+import os
+import threading
+from collections import OrderedDict
+from concurrent.futures import Future
+
+import numpy as np
+
+
+class TranscriptionCache:
+    """
+    Memòria cau de transcripcions adreçada pel contingut.
+
+    La clau és un hash de l'àudio descodificat i dels paràmetres que afecten
+    el resultat (idioma, model, opcions de descodificació). Té un nivell LRU
+    en memòria i, opcionalment, un nivell en disc que sobreviu als reinicis,
+    també LRU i limitat a `max_disk_entries` fitxers (0 = sense límit).
+    Les peticions idèntiques que arriben mentre la primera encara s'està
+    processant n'esperen el resultat en lloc de llançar una altra inferència.
+    """
+
+    def __init__(self, max_entries=1024, disk_dir=None, max_disk_entries=10000):
+        self.max_entries = max(0, int(max_entries))
+        self.disk_dir = disk_dir
+        self.max_disk_entries = max(0, int(max_disk_entries))
+        self._entries = OrderedDict()
+        # Claus desades en disc, de la menys a la més usada recentment
+        self._disk_keys = OrderedDict()
+        self._inflight = {}
+        self._lock = threading.Lock()
+        self.stats = {'hits': 0, 'disk_hits': 0, 'misses': 0, 'coalesced': 0, 'disk_evictions': 0}
+        if disk_dir:
+            os.makedirs(disk_dir, exist_ok=True)
+            self._scan_disk()
+            with self._lock:
+                self._enforce_disk_limit()
+
+    def _scan_disk(self):
+        """Recupera les entrades en disc d'execucions anteriors, ordenades per l'últim ús (mtime)."""
+        found = []
+        for shard in os.scandir(self.disk_dir):
+            if not shard.is_dir():
+                continue
+            for entry in os.scandir(shard.path):
+                if entry.name.endswith('.json'):
+                    try:
+                        found.append((entry.stat().st_mtime, entry.name[:-len('.json')]))
+                    except OSError:
+                        pass
+        for _, key in sorted(found):
+            self._disk_keys[key] = None
+
+    @staticmethod
+    def make_key(audio, **params):
+        """Calcula la clau a partir de les mostres i dels paràmetres."""
+        h = hashlib.blake2b(digest_size=20)
+        h.update(json.dumps(params, sort_keys=True, default=str).encode('utf-8'))
+        h.update(np.ascontiguousarray(audio).data)
+        return h.hexdigest()
+
+    def _disk_path(self, key):
+        return os.path.join(self.disk_dir, key[:2], key + '.json')
+
+    def _enforce_disk_limit(self):
+        """Esborra els fitxers menys usats si se supera el límit (cal tenir el lock)."""
+        if not self.max_disk_entries:
+            return
+        while len(self._disk_keys) > self.max_disk_entries:
+            key, _ = self._disk_keys.popitem(last=False)
+            try:
+                os.remove(self._disk_path(key))
+            except OSError:
+                pass
+            self.stats['disk_evictions'] += 1
+
+    def _remember(self, key, result):
+        """Desa a memòria (cal tenir el lock)."""
+        if not self.max_entries:
+            return
+        self._entries[key] = result
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+
+    def get(self, key):
+        with self._lock:
+            if key in self._entries:
+                self._entries.move_to_end(key)
+                self.stats['hits'] += 1
+                return self._entries[key]
+
+        if self.disk_dir:
+            try:
+                with open(self._disk_path(key), 'r', encoding='utf-8') as f:
+                    result = json.load(f)
+            except (OSError, ValueError):
+                result = None
+            if result is not None:
+                try:
+                    # L'mtime fa de data d'últim ús per a l'LRU entre reinicis
+                    os.utime(self._disk_path(key))
+                except OSError:
+                    pass
+                with self._lock:
+                    self._remember(key, result)
+                    self._disk_keys[key] = None
+                    self._disk_keys.move_to_end(key)
+                    self.stats['disk_hits'] += 1
+                return result
+
+        return None
+
+    def put(self, key, result):
+        with self._lock:
+            self._remember(key, result)
+
+        if self.disk_dir:
+            path = self._disk_path(key)
+            try:
+                os.makedirs(os.path.dirname(path), exist_ok=True)
+                # Escriptura atòmica perquè un reinici no deixi fitxers a mitges
+                tmp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+                with open(tmp_path, 'w', encoding='utf-8') as f:
+                    json.dump(result, f, ensure_ascii=False)
+                os.replace(tmp_path, path)
+            except OSError as e:
+                print(f"Avís: no s'ha pogut desar a la memòria cau en disc: {e}")
+                return
+            with self._lock:
+                self._disk_keys[key] = None
+                self._disk_keys.move_to_end(key)
+                self._enforce_disk_limit()
+
+    def get_or_compute(self, key, compute):
+        """
+        Retorna `(resultat, encert)`. Si la clau no hi és, només la primera
+        petició executa `compute()`; les idèntiques concurrents l'esperen.
+        """
+        result = self.get(key)
+        if result is not None:
+            return result, True
+
+        with self._lock:
+            # Pot haver acabat una inferència idèntica entre la consulta i ara
+            if key in self._entries:
+                self.stats['hits'] += 1
+                return self._entries[key], True
+            future = self._inflight.get(key)
+            owner = future is None
+            if owner:
+                future = Future()
+                self._inflight[key] = future
+                self.stats['misses'] += 1
+            else:
+                self.stats['coalesced'] += 1
+
+        if not owner:
+            return future.result(), True
+
+        try:
+            result = compute()
+        except BaseException as e:
+            future.set_exception(e)
+            raise
+        else:
+            self.put(key, result)
+            future.set_result(result)
+            return result, False
+        finally:
+            with self._lock:
+                self._inflight.pop(key, None)
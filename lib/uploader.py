@@ -0,0 +1,128 @@
+import threading
+
+import numpy as np
+import requests
+from requests.adapters import HTTPAdapter
+
+# Què fer quan el servidor no dona l'abast i s'acumulen fragments per enviar:
+# `merge` ajunta els dos més antics en un de sol (no es perd àudio i es fan
+# menys peticions) i `drop` descarta el més antic.
+POLICIES = ('merge', 'drop')
+
+
+def make_session(pool_size):
+    """Sessió HTTP persistent (keep-alive) amb un pool de `pool_size` connexions."""
+    session = requests.Session()
+    adapter = HTTPAdapter(pool_connections=1, pool_maxsize=pool_size)
+    session.mount("http://", adapter)
+    session.mount("https://", adapter)
+    return session
+
+
+class ChunkUploader:
+    """
+    Envia en segon pla els fragments gravats perquè la captura i la
+    transcripció se solapin.
+
+    `send(session, audio)` codifica i envia un fragment i retorna el text (o
+    None si hi ha hagut un error). Hi ha com a màxim `max_in_flight`
+    fragments enviant-se alhora per la mateixa sessió HTTP; els altres
+    esperen, i si n'hi ha més de `max_pending` s'aplica la política
+    `policy`. Els textos es retornen en l'ordre de gravació amb `ready()`
+    (sense bloquejar) i `close()` (espera els pendents).
+    """
+
+    def __init__(self, send, max_in_flight=2, max_pending=2, policy='merge'):
+        if policy not in POLICIES:
+            raise ValueError(f"Política desconeguda: {policy}. Opcions: {', '.join(POLICIES)}")
+        self.send = send
+        self.max_in_flight = max(1, int(max_in_flight))
+        self.max_pending = max(1, int(max_pending))
+        self.policy = policy
+        self.session = make_session(self.max_in_flight)
+        self.stats = {'sent': 0, 'merged': 0, 'dropped': 0}
+        self._pending = []        # [(seq, audio)] per enviar, en ordre
+        self._done = {}           # seq -> text (None si no n'hi ha)
+        self._next_seq = 0
+        self._next_ready = 0
+        self._in_flight = 0
+        self._running = True
+        self._cond = threading.Condition()
+        self._threads = []
+        for i in range(self.max_in_flight):
+            t = threading.Thread(target=self._worker_loop, name=f"chunk-uploader-{i}", daemon=True)
+            t.start()
+            self._threads.append(t)
+
+    def submit(self, audio):
+        """Encua un fragment. Retorna False si s'ha hagut d'ajuntar o descartar àudio."""
+        with self._cond:
+            if not self._running:
+                raise RuntimeError("L'enviador de fragments està tancat")
+            self._pending.append((self._next_seq, audio))
+            self._next_seq += 1
+            kept_up = len(self._pending) <= self.max_pending
+            while len(self._pending) > self.max_pending:
+                (seq_a, audio_a), (seq_b, audio_b) = self._pending[:2]
+                if self.policy == 'merge':
+                    # El fragment ajuntat ocupa la posició del primer; el segon queda buit
+                    self._pending[:2] = [(seq_a, np.concatenate([audio_a, audio_b], axis=0))]
+                    self._done[seq_b] = None
+                    self.stats['merged'] += 1
+                else:
+                    del self._pending[0]
+                    self._done[seq_a] = None
+                    self.stats['dropped'] += 1
+            self._cond.notify_all()
+        return kept_up
+
+    def backlog(self):
+        """Fragments pendents d'enviar més els que s'estan enviant."""
+        with self._cond:
+            return len(self._pending) + self._in_flight
+
+    def ready(self):
+        """Textos ja transcrits que segueixen l'ordre de gravació, sense esperar."""
+        texts = []
+        with self._cond:
+            while self._next_ready in self._done:
+                text = self._done.pop(self._next_ready)
+                self._next_ready += 1
+                if text:
+                    texts.append(text)
+        return texts
+
+    def close(self):
+        """Espera que s'enviïn tots els fragments, atura els fils i retorna els textos que quedin."""
+        with self._cond:
+            while self._pending or self._in_flight:
+                self._cond.wait()
+            self._running = False
+            self._cond.notify_all()
+        for t in self._threads:
+            t.join()
+        self._threads = []
+        self.session.close()
+        return self.ready()
+
+    def _worker_loop(self):
+        while True:
+            with self._cond:
+                while self._running and not self._pending:
+                    self._cond.wait()
+                if not self._pending:
+                    return
+                seq, audio = self._pending.pop(0)
+                self._in_flight += 1
+
+            try:
+                text = self.send(self.session, audio)
+            except Exception as e:
+                print(f"Error inesperat: {e}")
+                text = None
+
+            with self._cond:
+                self._done[seq] = text
+                self._in_flight -= 1
+                self.stats['sent'] += 1
+                self._cond.notify_all()
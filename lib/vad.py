@@ -0,0 +1,89 @@
+import numpy as np
+
+from lib.audio_decode import SAMPLE_RATE
+
+
+def _runs(mask):
+    """Inicis i finals (exclusius) de les tirades de True d'una màscara."""
+    edges = np.diff(np.concatenate(([0], mask.astype(np.int8), [0])))
+    return np.flatnonzero(edges == 1), np.flatnonzero(edges == -1)
+
+
+def frame_energy_db(audio, frame):
+    """Energia de cada trama en dB respecte a l'escala completa (float32 entre -1 i 1)."""
+    n = len(audio) // frame
+    frames = np.asarray(audio[:n * frame], dtype=np.float32).reshape(n, frame)
+    energy = np.einsum('ij,ij->i', frames, frames) / frame
+    return 10.0 * np.log10(energy + 1e-10)
+
+
+def speech_regions(audio, sample_rate=SAMPLE_RATE, frame_ms=20, min_db=-50.0, margin_db=10.0,
+                   min_speech_ms=100, padding_ms=200, min_silence_ms=300):
+    """
+    Detecta les zones amb veu per energia de trama.
+
+    Una trama és veu si supera el llindar absolut `min_db` i el soroll de fons
+    estimat (percentil 10) més `margin_db`. S'eliminen els espetecs més curts
+    que `min_speech_ms`, s'afegeix `padding_ms` a cada costat i s'uneixen les
+    zones separades per menys de `min_silence_ms`. Retorna un array (n, 2)
+    amb l'inici i el final de cada zona en mostres.
+    """
+    frame = max(1, int(sample_rate * frame_ms / 1000))
+    if len(audio) < frame:
+        return np.empty((0, 2), dtype=np.int64)
+
+    db = frame_energy_db(audio, frame)
+    floor = np.percentile(db, 10)
+    loud = np.percentile(db, 90)
+    # Si tot el fragment és veu, el fons estimat també ho és: el llindar no pot superar la part forta
+    threshold = max(min_db, min(floor + margin_db, loud - margin_db))
+    mask = db > threshold
+
+    starts, ends = _runs(mask)
+    short = (ends - starts) < max(1, min_speech_ms // frame_ms)
+    for s, e in zip(starts[short], ends[short]):
+        mask[s:e] = False
+    if not mask.any():
+        return np.empty((0, 2), dtype=np.int64)
+
+    pad = padding_ms // frame_ms
+    if pad:
+        mask = np.convolve(mask, np.ones(2 * pad + 1), mode='same') > 0
+
+    starts, ends = _runs(mask)
+    if len(starts) > 1:
+        keep = np.concatenate(([True], (starts[1:] - ends[:-1]) >= min_silence_ms / frame_ms))
+        starts = starts[keep]
+        ends = np.concatenate((ends[np.flatnonzero(keep[1:])], ends[-1:]))
+
+    regions = np.stack([starts, ends], axis=1) * frame
+    # L'última trama incompleta pertany a la zona final si aquesta arriba al final
+    regions[regions[:, 1] >= len(db) * frame, 1] = len(audio)
+    return regions
+
+
+class TimeMap:
+    """Converteix temps de l'àudio compactat a temps de l'àudio original."""
+
+    def __init__(self, compact_starts, original_starts, sample_rate=SAMPLE_RATE):
+        self.compact_starts = np.asarray(compact_starts, dtype=np.int64)
+        self.original_starts = np.asarray(original_starts, dtype=np.int64)
+        self.sample_rate = sample_rate
+
+    def to_original(self, seconds, end=False):
+        """Amb `end`, un temps just a la frontera entre zones s'assigna al final de l'anterior."""
+        sample = int(round(seconds * self.sample_rate))
+        i = max(0, int(np.searchsorted(self.compact_starts, sample, side='left' if end else 'right')) - 1)
+        return (self.original_starts[i] + sample - self.compact_starts[i]) / self.sample_rate
+
+
+def compact(audio, regions, sample_rate=SAMPLE_RATE):
+    """Concatena només les zones amb veu. Retorna `(àudio, TimeMap)`."""
+    lengths = regions[:, 1] - regions[:, 0]
+    compact_starts = np.concatenate(([0], np.cumsum(lengths)[:-1]))
+    compacted = np.concatenate([audio[s:e] for s, e in regions]).astype(np.float32, copy=False)
+    return compacted, TimeMap(compact_starts, regions[:, 0], sample_rate)
+
+
+def speech_seconds(regions, sample_rate=SAMPLE_RATE):
+    return float((regions[:, 1] - regions[:, 0]).sum()) / sample_rate
@@ -1,62 +1,251 @@
+import datetime
+import json
+import locale
 import os
+import re
+import subprocess
 import sys
+import time
+import unicodedata
 
-def process_command(text_lower):
-    """
-    Processa el text per trobar i executar ordres.
-    Retorna True si s'ha executat alguna ordre, False en cas contrari.
-    """
-    if "terminal" in text_lower:
-        print(">>> Ordre 'obra terminal' detectada!")
-        os.system('gnome-terminal &')
-        os.system('echovoice "Obrint terminal."')
-        return True
-    elif "firefox" in text_lower:
-        print(">>> Ordre 'Firefox' detectada!")
-        os.system('firefox &')
-        os.system('echovoice "Obrint Firefox."')
-        return True
-    elif "antigravity" in text_lower:
-        print(">>> Ordre 'Antigravity' detectada!")
-        os.system('antigravity &')
-        os.system('echovoice "Obrint Antigravity."')
-        return True
-    elif "google" in text_lower:
-        print(">>> Ordre 'Chrome' detectada!")
-        os.system('google-chrome &')
-        os.system('echovoice "Obrint Chrome."')
-        return True
-    elif "hora" in text_lower:
-        print(">>> Ordre 'hora' detectada!")
-        os.system("echovoice \"Ara són les $(date +'%H:%M')\"")
-        return True
-    elif "dia" in text_lower:
-        print(">>> Ordre 'dia' detectada!")
-        os.system("echovoice \" Avui és $(date +'%A, %d de %B')\"")
-        return True
-    elif "apaga" in text_lower:
-        print(">>> Ordre 'apaga' detectada!")
-        os.system('echovoice "Aturant contenidors docker i apagant l\'sistema."')
-        # Aturar tots els contenidors docker (si n'hi ha)
-        os.system('docker stop $(docker ps -q) 2>/dev/null')
-        
-        # Detectar si és GNOME Desktop
-        is_gnome = "GNOME" in os.environ.get("XDG_CURRENT_DESKTOP", "")
-        
-        if is_gnome:
-            # Utilitzar gnome-session-quit per a una millor integració amb GNOME
-            os.system('gnome-session-quit --power-off --no-prompt')
+# Fitxer d'ordres per defecte; es pot canviar amb ECHOTEXT_COMMANDS
+DEFAULT_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "voice_commands.json")
+COMMANDS_ENV = "ECHOTEXT_COMMANDS"
+
+_TOKEN = re.compile(r"[^\W_]+")
+
+
+def normalize(text):
+    """
+    Paraules d'un text en minúscules i sense accents ni puntuació:
+    "Quina hora és?" -> ["quina", "hora", "es"]. El punt volat de la ela
+    geminada s'elimina ("col·loca" -> "colloca") i l'apòstrof separa paraules.
+    """
+    text = unicodedata.normalize('NFKD', text.lower().replace('·', ''))
+    text = ''.join(c for c in text if not unicodedata.combining(c))
+    return _TOKEN.findall(text)
+
+
+def _run(argv, deadline=None):
+    """Executa una ordre (llista d'arguments, sense shell) i n'espera el final fins a `deadline`."""
+    timeout = None if deadline is None else max(0.0, deadline - time.monotonic())
+    return subprocess.run(argv, stdout=subprocess.PIPE, stderr=subprocess.DEVNULL,
+                          text=True, timeout=timeout, check=False)
+
+
+def _stop_containers(deadline=None):
+    # Equivalent a `docker stop $(docker ps -q)`
+    containers = _run(["docker", "ps", "-q"], deadline).stdout.split()
+    if containers:
+        _run(["docker", "stop", *containers], deadline)
+
+
+def _power_off(deadline=None):
+    # Detectar si és GNOME Desktop
+    is_gnome = "GNOME" in os.environ.get("XDG_CURRENT_DESKTOP", "")
+
+    if is_gnome:
+        # Utilitzar gnome-session-quit per a una millor integració amb GNOME
+        _run(["gnome-session-quit", "--power-off", "--no-prompt"], deadline)
+    else:
+        # Apagar el sistema via systemctl
+        _run(["systemctl", "poweroff"], deadline)
+
+    # Aturar l'script actual
+    sys.exit(0)
+
+
+# Accions que no es poden expressar com una sola ordre
+ACTIONS = {
+    'stop_containers': _stop_containers,
+    'power_off': _power_off,
+}
+
+# `spawn` llança un programa sense esperar-lo, `run` l'espera, `say` el diu
+# amb echovoice ({now:...} és la data i hora actual) i `action` és d'ACTIONS
+STEP_KINDS = ('spawn', 'run', 'say', 'action')
+
+_locale_ready = False
+
+
+def say_text(template):
+    """Text d'un pas `say`, amb els noms de dies i mesos en l'idioma del sistema (com `date`)."""
+    global _locale_ready
+    if not _locale_ready:
+        try:
+            locale.setlocale(locale.LC_TIME, '')
+        except locale.Error:
+            pass
+        _locale_ready = True
+    return template.format(now=datetime.datetime.now())
+
+
+class Command:
+    __slots__ = ("name", "label", "phrases", "steps", "priority", "timeout")
+
+    def __init__(self, name, phrases, steps, label=None, priority=0, timeout=None):
+        self.name = name
+        self.label = label or name
+        self.phrases = list(phrases)
+        self.steps = [dict(step) for step in steps]
+        self.priority = int(priority)
+        self.timeout = None if timeout is None else float(timeout)
+
+
+class Match:
+    __slots__ = ("command", "phrase", "start", "end")
+
+    def __init__(self, command, phrase, start, end):
+        self.command = command
+        self.phrase = phrase
+        self.start = start
+        self.end = end
+
+    def __repr__(self):
+        return f"Match({self.command.name!r}, {self.phrase!r}, {self.start}, {self.end})"
+
+
+class CommandRegistry:
+    """
+    Ordres de veu compilades en un autòmat d'Aho-Corasick sobre paraules
+    normalitzades.
+
+    Cada frase activadora és una seqüència de paraules, de manera que només
+    coincideix amb paraules senceres ("dia" no s'activa amb "diana"). Amb un
+    sol recorregut del text es troben totes les frases, independentment de
+    quantes ordres hi hagi, i es queda la millor: la frase més llarga, i
+    després la de `priority` més alta i la que apareix abans.
+    """
+
+    def __init__(self, commands):
+        self.commands = list(commands)
+        self._goto = [{}]
+        self._fail = [0]
+        self._out = [[]]
+        owners = {}
+        for command in self.commands:
+            if not command.phrases:
+                raise ValueError(f"L'ordre '{command.name}' no té cap frase")
+            for step in command.steps:
+                kinds = [k for k in STEP_KINDS if k in step]
+                if len(kinds) != 1:
+                    raise ValueError(f"Pas incorrecte a l'ordre '{command.name}': {step}")
+                if kinds[0] == 'action' and step['action'] not in ACTIONS:
+                    raise ValueError(f"Acció desconeguda a l'ordre '{command.name}': {step['action']}")
+                if kinds[0] in ('spawn', 'run') and (
+                        not isinstance(step[kinds[0]], list) or not step[kinds[0]]
+                        or not all(isinstance(arg, str) for arg in step[kinds[0]])):
+                    raise ValueError(f"`{kinds[0]}` ha de ser una llista d'arguments a l'ordre '{command.name}'")
+            for phrase in command.phrases:
+                tokens = tuple(normalize(phrase))
+                if not tokens:
+                    raise ValueError(f"Frase buida a l'ordre '{command.name}'")
+                if tokens in owners and owners[tokens] is not command:
+                    raise ValueError(f"La frase '{phrase}' és a '{owners[tokens].name}' i a '{command.name}'")
+                owners[tokens] = command
+                self._insert(tokens, command, phrase)
+        self._link()
+
+    def _insert(self, tokens, command, phrase):
+        state = 0
+        for token in tokens:
+            if token not in self._goto[state]:
+                self._goto.append({})
+                self._fail.append(0)
+                self._out.append([])
+                self._goto[state][token] = len(self._goto) - 1
+            state = self._goto[state][token]
+        self._out[state].append((len(tokens), command, phrase))
+
+    def _link(self):
+        """Enllaços de fallada per amplada, com a Aho-Corasick."""
+        queue = list(self._goto[0].values())
+        for state in queue:
+            for token, child in self._goto[state].items():
+                queue.append(child)
+                fallback = self._fail[state]
+                while fallback and token not in self._goto[fallback]:
+                    fallback = self._fail[fallback]
+                self._fail[child] = self._goto[fallback].get(token, 0)
+                if self._fail[child] == child:
+                    self._fail[child] = 0
+                self._out[child] = self._out[child] + self._out[self._fail[child]]
+
+    @classmethod
+    def from_config(cls, config):
+        return cls(Command(c['name'], c['phrases'], c.get('steps', []), c.get('label'),
+                           c.get('priority', 0), c.get('timeout'))
+                   for c in config['commands'])
+
+    @classmethod
+    def load(cls, path=None):
+        """Carrega les ordres d'un fitxer JSON (per defecte, ECHOTEXT_COMMANDS o el del paquet)."""
+        path = path or os.environ.get(COMMANDS_ENV) or DEFAULT_PATH
+        with open(path, 'r', encoding='utf-8') as f:
+            return cls.from_config(json.load(f))
+
+    def match(self, text):
+        """Millor ordre del text, o None."""
+        best = None
+        best_key = None
+        state = 0
+        for i, token in enumerate(normalize(text)):
+            while state and token not in self._goto[state]:
+                state = self._fail[state]
+            state = self._goto[state].get(token, 0)
+            for length, command, phrase in self._out[state]:
+                start = i - length + 1
+                key = (length, command.priority, -start)
+                if best_key is None or key > best_key:
+                    best, best_key = Match(command, phrase, start, i + 1), key
+        return best
+
+
+def execute(command, timeout=None):
+    """
+    Executa els passos d'una ordre en ordre, sense passar per la shell. Si
+    l'ordre triga més de `timeout` segons (o el de l'ordre), es mata el
+    procés en curs i es llança `subprocess.TimeoutExpired`.
+    """
+    timeout = command.timeout if command.timeout is not None else timeout
+    deadline = None if timeout is None else time.monotonic() + timeout
+    for step in command.steps:
+        if 'spawn' in step:
+            subprocess.Popen(step['spawn'], stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL,
+                             start_new_session=True)
+        elif 'run' in step:
+            _run(step['run'], deadline)
+        elif 'say' in step:
+            _run(["echovoice", say_text(step['say'])], deadline)
         else:
-            # Apagar el sistema via systemctl
-            os.system('systemctl poweroff')
-        
-        # Aturar l'script actual
-        sys.exit(0)
-        return True
-    elif "suspèn" in text_lower or "suspen" in text_lower:
-        print(">>> Ordre 'suspèn' detectada!")
-        os.system('echovoice "Suspenent l\'ordinador."')
-        os.system('systemctl suspend')
-        return True
-    
-    return False
+            ACTIONS[step['action']](deadline)
+
+
+_registry = None
+
+
+def registry():
+    """Registre d'ordres per defecte, carregat i compilat una sola vegada."""
+    global _registry
+    if _registry is None:
+        _registry = CommandRegistry.load()
+    return _registry
+
+
+def process_command(text_lower, executor=None):
+    """
+    Processa el text per trobar i executar ordres. Amb `executor`
+    (`lib.action_executor.ActionExecutor`), l'ordre s'encua i s'executa en
+    segon pla. Retorna True si s'ha executat (o encuat) alguna ordre, False
+    en cas contrari.
+    """
+    match = registry().match(text_lower)
+    if match is None:
+        return False
+    print(f">>> Ordre '{match.command.label}' detectada!")
+    if executor is None:
+        execute(match.command)
+    elif not executor.submit(match.command):
+        print(f"Avís: hi ha massa ordres pendents, s'ignora '{match.command.label}'.")
+        return False
+    return True
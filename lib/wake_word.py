@@ -0,0 +1,165 @@
+import os
+
+import numpy as np
+
+from lib.audio_decode import SAMPLE_RATE
+from lib.mel import mel_filters
+
+# Fitxer on es desen les mostres enregistrades de la paraula clau
+DEFAULT_PATH = os.path.join(os.path.expanduser("~"), ".cache", "echotext", "wake_word.npz")
+
+# Paràmetres dels MFCC: finestres de 25 ms cada 10 ms
+N_FFT = 512
+HOP_LENGTH = 160
+WIN_LENGTH = 400
+N_MELS = 26
+N_MFCC = 13
+
+# Les trames amb veu estan com a molt 30 dB per sota de la més forta i almenys
+# 10 dB per sobre del soroll de fons (percentil 10), en logaritme natural
+VOICED_RANGE = 3 * np.log(10)
+VOICED_MARGIN = np.log(10)
+
+# Trames a cada costat (0,25 s) per a la mitjana que es resta als coeficients
+CMN_FRAMES = 25
+
+# Marge sobre la distància més gran entre les mostres enregistrades
+THRESHOLD_MARGIN = 1.4
+
+
+def _dct_matrix(n_out, n_in):
+    """DCT-II ortonormal, com la que fan servir els MFCC habituals."""
+    k = np.arange(n_out)[:, None]
+    n = np.arange(n_in)[None, :]
+    dct = np.cos(np.pi / n_in * (n + 0.5) * k) * np.sqrt(2.0 / n_in)
+    dct[0] /= np.sqrt(2.0)
+    return dct.astype(np.float32)
+
+
+_DCT = _dct_matrix(N_MFCC, N_MELS)
+_WINDOW = np.hamming(WIN_LENGTH).astype(np.float32)
+
+
+def mfcc(audio, trim=False):
+    """
+    MFCC (sense el coeficient 0, que només és l'energia) d'un àudio float32
+    mono a 16 kHz. A cada trama se li resta la mitjana de les trames amb veu
+    del seu voltant, perquè ni el
+    silenci ni les paraules que hi ha al costat canviïn les característiques.
+    Amb `trim` es retallen les trames sense veu dels extrems. Retorna un
+    array (trames, N_MFCC - 1).
+    """
+    audio = np.asarray(audio, dtype=np.float32).reshape(-1)
+    if len(audio) < WIN_LENGTH:
+        audio = np.pad(audio, (0, WIN_LENGTH - len(audio)))
+    emphasized = np.append(audio[0], audio[1:] - 0.97 * audio[:-1])
+    frames = np.lib.stride_tricks.sliding_window_view(emphasized, WIN_LENGTH)[::HOP_LENGTH]
+    spectrum = np.fft.rfft(frames * _WINDOW, n=N_FFT, axis=-1)
+    power = (spectrum.real ** 2 + spectrum.imag ** 2).astype(np.float32)
+    log_mel = np.log(power @ mel_filters(N_MELS, SAMPLE_RATE, N_FFT).T + 1e-10)
+    coeffs = (log_mel @ _DCT.T)[:, 1:]
+
+    energy = np.log(power.sum(axis=1) + 1e-10)
+    floor = np.percentile(energy, 10)
+    voiced = energy >= max(energy.max() - VOICED_RANGE, min(floor + VOICED_MARGIN, energy.max()))
+    if trim:
+        first, last = np.flatnonzero(voiced)[[0, -1]]
+        coeffs, voiced = coeffs[first:last + 1], voiced[first:last + 1]
+
+    # Mitjana lliscant amb sumes acumulades (les trames sense veu no hi compten)
+    sums = np.concatenate((np.zeros((1, coeffs.shape[1]), np.float32), np.cumsum(coeffs * voiced[:, None], axis=0)))
+    counts = np.concatenate(([0], np.cumsum(voiced)))
+    idx = np.arange(len(coeffs))
+    lo = np.maximum(idx - CMN_FRAMES, 0)
+    hi = np.minimum(idx + CMN_FRAMES + 1, len(coeffs))
+    mean = (sums[hi] - sums[lo]) / np.maximum(counts[hi] - counts[lo], 1)[:, None]
+    return coeffs - mean
+
+
+def subsequence_dtw(template, query):
+    """
+    Distància DTW de `template` contra el millor tram de `query` (pot
+    començar i acabar a qualsevol trama). Els passos (1,1), (1,2) i (2,1)
+    limiten el pendent entre 1/2 i 2, de manera que cada fila només depèn de
+    les anteriors i es calcula vectoritzada. Retorna `(distància mitjana per
+    trama de la plantilla, trama final del tram)`.
+    """
+    n, m = len(template), len(query)
+    if m < (n + 1) // 2:
+        return np.inf, m
+    # Distància euclidiana entre totes les parelles de trames
+    cost = np.sqrt(np.maximum(
+        (template ** 2).sum(1)[:, None] + (query ** 2).sum(1)[None, :] - 2.0 * template @ query.T, 0.0))
+
+    inf = np.full(2, np.inf, dtype=cost.dtype)
+    prev2 = None
+    prev = cost[0].copy()
+    for i in range(1, n):
+        diag = np.concatenate((inf[:1], prev[:-1]))
+        skip_query = np.concatenate((inf, prev[:-2]))
+        best = np.minimum(diag, skip_query)
+        if prev2 is not None:
+            # El pas (2,1) consumeix dues trames de la plantilla: se sumen totes dues
+            skip_template = np.concatenate((inf[:1], prev2[:-1])) + cost[i - 1]
+            best = np.minimum(best, skip_template)
+        prev2, prev = prev, cost[i] + best
+
+    end = int(np.argmin(prev))
+    return float(prev[end]) / n, end
+
+
+class WakeWordDetector:
+    """
+    Detector local de la paraula clau per plantilles i DTW.
+
+    Es compara cada frase capturada amb unes quantes mostres enregistrades
+    de la paraula clau (`enroll`). La paraula es dona per detectada si la
+    distància DTW a alguna plantilla no supera `threshold`, que per defecte
+    es calibra amb la distància entre les mateixes mostres.
+    """
+
+    def __init__(self, templates, threshold=None):
+        if not templates:
+            raise ValueError("Calen mostres de la paraula clau")
+        self.templates = [np.asarray(t, dtype=np.float32) for t in templates]
+        self.threshold = float(threshold) if threshold is not None else self.calibrate(self.templates)
+
+    @staticmethod
+    def calibrate(templates):
+        """Llindar a partir de la distància més gran entre parelles de mostres."""
+        if len(templates) < 2:
+            raise ValueError("Calen almenys dues mostres per calibrar el llindar")
+        distances = [subsequence_dtw(a, b)[0] for i, a in enumerate(templates)
+                     for j, b in enumerate(templates) if i != j]
+        return max(distances) * THRESHOLD_MARGIN
+
+    @classmethod
+    def enroll(cls, samples, threshold=None):
+        """Crea el detector a partir d'enregistraments (float32, 16 kHz) de la paraula clau."""
+        return cls([mfcc(s, trim=True) for s in samples], threshold)
+
+    def detect(self, audio):
+        """
+        Busca la paraula clau dins de l'àudio. Retorna `(detectada, distància,
+        mostra on acaba)`; la posició permet saber si hi ha més veu després.
+        """
+        features = mfcc(audio)
+        score, end = min(subsequence_dtw(t, features) for t in self.templates)
+        end_sample = min(np.asarray(audio).size, end * HOP_LENGTH + WIN_LENGTH)
+        return score <= self.threshold, score, end_sample
+
+    def save(self, path=DEFAULT_PATH):
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        arrays = {f"template_{i}": t for i, t in enumerate(self.templates)}
+        np.savez(path, threshold=np.float32(self.threshold), **arrays)
+
+    @classmethod
+    def load(cls, path=DEFAULT_PATH, threshold=None):
+        """Carrega les mostres desades, o retorna None si encara no n'hi ha."""
+        if not os.path.exists(path):
+            return None
+        with np.load(path, allow_pickle=False) as data:
+            templates = [data[k] for k in sorted((k for k in data.files if k.startswith("template_")),
+                                                 key=lambda k: int(k.split("_")[1]))]
+            saved = float(data["threshold"])
+        return cls(templates, threshold if threshold is not None else saved)
@@ -0,0 +1,133 @@
+import contextlib
+import os
+import threading
+
+import torch
+import whisper
+from whisper.model import ModelDimensions, Whisper
+
+# ECHOTEXT_WEIGHT_CACHE=0 torna a carregar sempre el checkpoint original
+CACHE_ENV = "ECHOTEXT_WEIGHT_CACHE"
+CACHE_SUBDIR = "mmap"
+CACHE_VERSION = 1
+
+# Inicialitzacions de `torch.nn.init` que fan servir les capes de Whisper
+_SKIPPED_INITS = ('uniform_', 'normal_', 'kaiming_uniform_', 'ones_', 'zeros_')
+_init_lock = threading.Lock()
+
+
+def download_root():
+    """Directori on whisper desa els checkpoints (el volum `whisper-models` a Docker)."""
+    default = os.path.join(os.path.expanduser("~"), ".cache")
+    return os.path.join(os.getenv("XDG_CACHE_HOME", default), "whisper")
+
+
+def cache_path(name, root=None):
+    return os.path.join(root or download_root(), CACHE_SUBDIR, f"{name}.fp32.pt")
+
+
+def _checkpoint_path(name, root):
+    return os.path.join(root, os.path.basename(whisper._MODELS[name]))
+
+
+def _source_id(path):
+    st = os.stat(path)
+    return [st.st_size, int(st.st_mtime)]
+
+
+def _open(path, source):
+    """
+    Pesos convertits mapats a memòria, o None si no hi són o es van fer a
+    partir d'un altre checkpoint. Sense el checkpoint original es fan servir tal qual.
+    """
+    if not os.path.exists(path):
+        return None
+    try:
+        checkpoint = torch.load(path, mmap=True, weights_only=True, map_location='cpu')
+    except Exception:
+        return None
+    if checkpoint.get('version') != CACHE_VERSION:
+        return None
+    if os.path.exists(source) and list(checkpoint.get('source', [])) != _source_id(source):
+        return None
+    return checkpoint
+
+
+def convert(name, root=None):
+    """
+    Converteix el checkpoint oficial del model `name` (descarregant-lo si
+    cal) en pesos float32 contigus, que és com els fa servir el model, i els
+    desa a la memòria cau. Retorna el camí del fitxer convertit.
+    """
+    root = root or download_root()
+    source = _checkpoint_path(name, root)
+    if not os.path.exists(source):
+        whisper._download(whisper._MODELS[name], root, False)
+    checkpoint = torch.load(source, map_location='cpu', weights_only=True)
+    state = {k: v.float().contiguous() if v.is_floating_point() else v.contiguous()
+             for k, v in checkpoint['model_state_dict'].items()}
+
+    path = cache_path(name, root)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    # Es desa a part i es reanomena: un altre procés no veu mai un fitxer a mitges
+    tmp = f"{path}.{os.getpid()}.tmp"
+    torch.save({'version': CACHE_VERSION, 'source': _source_id(source),
+                'dims': checkpoint['dims'], 'model_state_dict': state}, tmp)
+    os.replace(tmp, path)
+    return path
+
+
+@contextlib.contextmanager
+def _skip_init():
+    """
+    Crea les capes sense inicialitzar-ne els pesos: la memòria de
+    `torch.empty` no s'arriba a ocupar mentre no s'hi escriu.
+    """
+    with _init_lock:
+        saved = {name: getattr(torch.nn.init, name) for name in _SKIPPED_INITS}
+        for name in saved:
+            setattr(torch.nn.init, name, lambda tensor, *args, **kwargs: tensor)
+        try:
+            yield
+        finally:
+            for name, fn in saved.items():
+                setattr(torch.nn.init, name, fn)
+
+
+def build_model(checkpoint, alignment_heads=None):
+    """
+    Construeix el model sense inicialitzar cap pes i l'enllaça directament
+    amb els tensors del fitxer mapat a memòria (`assign=True`): no es copia
+    res, les pàgines es llegeixen del disc a mesura que es fan servir i tots
+    els processos que carreguen el mateix fitxer comparteixen les mateixes
+    pàgines físiques.
+    """
+    with _skip_init():
+        model = Whisper(ModelDimensions(**checkpoint['dims']))
+    model.load_state_dict(checkpoint['model_state_dict'], assign=True)
+    if alignment_heads is not None:
+        model.set_alignment_heads(alignment_heads)
+    return model
+
+
+def load_model(name, device=None, root=None):
+    """
+    Com `whisper.load_model`, però amb els pesos convertits i mapats a
+    memòria. La primera vegada es fa la conversió; si el checkpoint canvia,
+    es torna a fer. Els noms que no són models oficials (per exemple, un
+    camí a un fitxer) i `ECHOTEXT_WEIGHT_CACHE=0` fan servir whisper directament.
+    """
+    if device is None:
+        device = "cuda" if torch.cuda.is_available() else "cpu"
+    if os.environ.get(CACHE_ENV, "1") == "0" or name not in whisper._MODELS:
+        return whisper.load_model(name, device=device, download_root=root)
+
+    root = root or download_root()
+    path = cache_path(name, root)
+    source = _checkpoint_path(name, root)
+    checkpoint = _open(path, source)
+    if checkpoint is None:
+        print(f"Convertint els pesos de '{name}' per carregar-los mapats a memòria...")
+        checkpoint = _open(convert(name, root), source)
+    model = build_model(checkpoint, whisper._ALIGNMENT_HEADS.get(name))
+    return model.to(device)
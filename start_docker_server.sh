@@ -3,14 +3,21 @@
 # Create a docker volume for whisper models if it doesn't exist
 docker volume create whisper-models > /dev/null
 
+# Create a docker volume for the /jobs queue (SQLite store and job audio) so jobs resume after a restart
+docker volume create echotext-jobs > /dev/null
+
 echo "Starting echotext-server with persisted model cache..."
 echo "Model will be stored in Docker volume: whisper-models"
+echo "Jobs will be stored in Docker volume: echotext-jobs"
 
 # Run the container with the volume mount
 # We mount to /root/.cache/whisper as the container runs as root by default in python:slim
 docker run --gpus all \
     -p 5000:5000 \
+    -p 5001:5001 \
     -v whisper-models:/root/.cache/whisper \
+    -v echotext-jobs:/var/lib/echotext/jobs \
+    -e ECHOTEXT_JOBS_DIR=/var/lib/echotext/jobs \
     --name echotext-server-persistent \
     --rm \
     echotext-server
@@ -1,31 +1,24 @@
-import whisper
 import os
 
+from lib.model_daemon import load_model
+
 def transcribe_with_info(file_path, model_type="turbo"):
     # Carregar model
     print(f"Carregant el model Whisper ({model_type})...")
-    model = whisper.load_model(model_type)
+    # Si el dimoni (whisper_daemon.py) està en marxa, s'hi connecta en lloc de carregar-lo
+    model = load_model(model_type)
     
     # Comprovar si el fitxer existeix
     if not os.path.exists(file_path):
         print(f"Error: El fitxer {file_path} no existeix.")
         return
 
-    # 1. Carregar àudio i fer padding/trimming per a la detecció d'idioma
-    audio = whisper.load_audio(file_path)
-    audio = whisper.pad_or_trim(audio)
-
-    # 2. Fer el log-Mel spectrogram
-    mel = whisper.log_mel_spectrogram(audio).to(model.device)
-
-    # 3. Detectar l'idioma
-    _, probs = model.detect_language(mel)
-    detected_lang = max(probs, key=probs.get)
-    print(f"Idioma detectat: {detected_lang}")
-
-    # 4. Transcripció completa amb detalls (fp16=False per evitar warnings a la CPU)
+    # Transcripció completa amb detalls (fp16=False per evitar warnings a la CPU).
+    # L'idioma el detecta `transcribe` amb els primers 30 s de l'àudio, igual
+    # que `detect_language`, i així també funciona amb el dimoni
     print(f"Transcrivint...")
     result = model.transcribe(file_path, verbose=False, fp16=False)
+    print(f"Idioma detectat: {result['language']}")
 
     print("-" * 30)
     print(f"Resultat (Idioma: {result['language']}):")
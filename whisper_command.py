@@ -1,37 +1,32 @@
-import whisper
-import sounddevice as sd
-import numpy as np
-import scipy.io.wavfile as wav
-import os
 import threading
 import time
 import subprocess
-import torch
+import argparse
+from lib.capture import AudioRing
+from lib.model_daemon import describe, inference_context, load_model
+from lib.precision import PRECISIONS, default_precision
 
-def record_audio(fs=16000):
+# Durada màxima d'un comandament (el buffer de captura es reserva una sola vegada)
+MAX_RECORDING_SECONDS = 30
+
+def record_audio(ring):
     print("\nPrem 'ENTER' per començar a enregistrar el comandament...")
     input()
     
     print("Enregistrant... Prem 'ENTER' per aturar.")
-    
-    recording = []
-    stop_event = threading.Event()
-
-    def callback(indata, frames, time, status):
-        if status:
-            print(status)
-        recording.append(indata.copy())
+    ring.reset()
 
     # Iniciar la gravació en un stream
-    with sd.InputStream(samplerate=fs, channels=1, callback=callback):
+    with ring.input_stream():
         input() # Espera a que l'usuari premi Enter de nou
-        stop_event.set()
 
     print("Enregistrament finalitzat.")
+    warning = ring.summary()
+    if warning:
+        print(f"Avís: {warning}")
     
-    # Convertir la llista de chunks a un array de numpy
-    audio_data = np.concatenate(recording, axis=0)
-    return audio_data
+    # Vista sobre el buffer, vàlida fins a la gravació següent
+    return ring.window()
 
 def process_command(text):
     text = text.lower().strip()
@@ -53,21 +48,26 @@ def process_command(text):
     return False
 
 def main():
+    parser = argparse.ArgumentParser(description="Comandaments de veu amb Whisper")
+    parser.add_argument("--precision", choices=PRECISIONS, default=default_precision(),
+                        help="Precisió de la inferència (per defecte ECHOTEXT_PRECISION o fp32)")
+    args = parser.parse_args()
+
     fs = 16000  # Whisper prefereix 16kHz
-    temp_filename = "command_audio.wav"
+    ring = AudioRing(MAX_RECORDING_SECONDS, fs)
     
     # 1. Carregar el model Whisper en paral·lel
     model_container = {} 
     
     def load_model_thread():
-        print("Carregant el model Whisper (turbo) per a comandaments...")
+        print(f"Carregant el model Whisper (turbo, {args.precision}) per a comandaments...")
         start_load = time.time()
-        model = whisper.load_model("turbo")
+        # Si el dimoni (whisper_daemon.py) està en marxa, s'hi connecta en lloc de carregar-lo
+        model = load_model("turbo", precision=args.precision)
         end_load = time.time()
         model_container['model'] = model
-        device = next(model.parameters()).device
         print(f"Model Whisper (turbo) carregat en {end_load - start_load:.2f}s.")
-        print(f"Dispositiu: {device}")
+        print(f"Dispositiu: {describe(model)}")
 
     loader_thread = threading.Thread(target=load_model_thread)
     loader_thread.start()
@@ -76,8 +76,7 @@ def main():
         while True:
             # 2. Enregistrar
             try:
-                audio_data = record_audio(fs)
-                wav.write(temp_filename, fs, audio_data)
+                audio_data = record_audio(ring)
             except Exception as e:
                 print(f"Error enregistrant àudio: {e}")
                 break
@@ -91,26 +90,21 @@ def main():
 
             # 3. Transcriure
             print("Processant comandament de veu...")
-            result = model.transcribe(temp_filename, fp16=False)
+            with inference_context(model):
+                # L'àudio es passa directament, sense fitxer temporal
+                result = model.transcribe(audio_data.reshape(-1), fp16=False)
             text = result["text"].strip()
             
             # 4. Processar el text per trobar comandaments
             if not process_command(text):
                 print("No s'ha reconegut cap comandament d'acció.")
             
-            # Netejar fitxer temporal
-            if os.path.exists(temp_filename):
-                os.remove(temp_filename)
-                
             print("\n" + "="*30)
             print("Llest per al següent comandament.")
             print("="*30 + "\n")
 
     except KeyboardInterrupt:
         print("\nAturant l'escrit de comandaments...")
-    finally:
-        if os.path.exists(temp_filename):
-            os.remove(temp_filename)
 
 if __name__ == "__main__":
     main()
@@ -0,0 +1,62 @@
+#!/usr/bin/env python3
+"""
+Dimoni local del model Whisper.
+
+Carrega el model una sola vegada i el comparteix amb `whisper_live.py`,
+`whisper_command.py`, `whisper_live_echovoice.py`, `whisper_simple.py` i
+`whisper_advanced.py`, que s'hi connecten pel socket Unix si està en marxa
+(i, si no, carreguen el model ells mateixos).
+
+Ús:
+    python3 whisper_daemon.py [--model turbo] [--precision fp32] [--socket CAMÍ]
+"""
+import sys
+
+from lib.venv_activator import activate_venv
+
+if __name__ == "__main__":
+    activate_venv(__file__)
+
+import argparse
+import time
+
+from lib.model_daemon import ModelDaemon, default_socket_path
+from lib.precision import PRECISIONS, default_precision
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Dimoni local del model Whisper")
+    parser.add_argument("--model", default="turbo", help="Model Whisper (per defecte turbo)")
+    parser.add_argument("--precision", choices=PRECISIONS, default=default_precision(),
+                        help="Precisió de la inferència (per defecte ECHOTEXT_PRECISION o fp32)")
+    parser.add_argument("--socket", default=default_socket_path(),
+                        help="Camí del socket Unix (per defecte ECHOTEXT_DAEMON_SOCKET o $XDG_RUNTIME_DIR/echotext/whisper.sock)")
+    args = parser.parse_args()
+
+    from lib.model_loader import load_model
+
+    print(f"Carregant el model Whisper ({args.model}, {args.precision})...")
+    start = time.time()
+    model = load_model(args.model, precision=args.precision)
+    print(f"Model carregat en {time.time() - start:.2f}s ({model.device}, {model.precision}).")
+
+    try:
+        server = ModelDaemon(model, args.model, args.socket)
+    except RuntimeError as e:
+        print(f"Error: {e}")
+        sys.exit(1)
+
+    print(f"Escoltant a {args.socket}. Prem Ctrl+C per aturar.")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        print("\nAturant el dimoni...")
+    finally:
+        server.server_close()
+        stats = server.stats
+        print(f"{stats['requests']} transcripcions, {stats['audio_seconds']:.1f}s d'àudio del micròfon, "
+              f"{stats['busy_seconds']:.1f}s transcrivint.")
+
+
+if __name__ == "__main__":
+    main()
@@ -15,29 +15,26 @@ def activate_venv():
 
 activate_venv()
 
-import whisper
-import sounddevice as sd
-import numpy as np
-import scipy.io.wavfile as wav
 import os
 import threading
 import time
 import pyperclip
-import torch
-import queue
+import argparse
+from lib.capture import AudioRing
+from lib.model_daemon import connect, describe, inference_context
+from lib.precision import PRECISIONS, default_precision
+
+# Fragments que caben al buffer de captura mentre es transcriu l'anterior
+BUFFERED_CHUNKS = 6
 
 def record_and_transcribe(model_container, loader_thread, fs=16000, chunk_duration=5):
     print("\nPrem 'ENTER' per començar a enregistrar (el model es carrega en segon pla)...")
     input()
     print(f"Enregistrant... Transcripció cada {chunk_duration}s. Prem 'ENTER' per aturar.")
 
-    q = queue.Queue()
+    ring = AudioRing(chunk_duration * BUFFERED_CHUNKS, fs)
+    chunk_samples = fs * chunk_duration
     stop_event = threading.Event()
-    
-    def callback(indata, frames, time, status):
-        if status:
-            print(status)
-        q.put(indata.copy())
 
     def input_listener():
         input()
@@ -46,9 +43,7 @@ def record_and_transcribe(model_container, loader_thread, fs=16000, chunk_durati
     input_thread = threading.Thread(target=input_listener)
     input_thread.start()
 
-    audio_buffer = []
     full_transcription = []
-    temp_filename = "temp_live_chunk.wav"
     
     #Funció auxiliar per obtenir el model
     def get_model():
@@ -58,76 +53,88 @@ def record_and_transcribe(model_container, loader_thread, fs=16000, chunk_durati
         return model_container['model']
 
     try:
-        with sd.InputStream(samplerate=fs, channels=1, callback=callback):
+        with ring.input_stream():
             while not stop_event.is_set():
-                try:
-                    data = q.get(timeout=0.1)
-                    audio_buffer.append(data)
-                except queue.Empty:
+                if not ring.wait(chunk_samples, timeout=0.1):
                     continue
 
-                total_samples = sum(len(c) for c in audio_buffer)
-                
-                if total_samples >= fs * chunk_duration:
-                    print(".", end="", flush=True)
-                    
-                    np_audio = np.concatenate(audio_buffer, axis=0)
-                    audio_buffer = []
-                    
-                    wav.write(temp_filename, fs, np_audio)
-                    
-                    model = get_model() # Assegurar que tenim model
-                    
-                    result = model.transcribe(temp_filename, fp16=False, language="ca", condition_on_previous_text=False)
-                    text = result["text"].strip()
-                    
-                    if text:
-                        print(f"\n[Chunk]: {text}")
-                        full_transcription.append(text)
-                        
-                        current_full_text = " ".join(full_transcription)
-                        try:
-                            pyperclip.copy(current_full_text)
-                        except:
-                            pass
-
-            if audio_buffer:
-                print("\nProcessant l'últim fragment...")
-                np_audio = np.concatenate(audio_buffer, axis=0)
-                wav.write(temp_filename, fs, np_audio)
+                print(".", end="", flush=True)
+
+                # La finestra és una vista sobre el buffer: s'allibera després de transcriure-la
+                chunk = ring.window(chunk_samples).reshape(-1)
                 
                 model = get_model() # Assegurar que tenim model
                 
-                result = model.transcribe(temp_filename, fp16=False, language="ca", condition_on_previous_text=False)
+                with inference_context(model):
+                    result = model.transcribe(chunk, fp16=False, language="ca", condition_on_previous_text=False)
+                ring.consume(chunk_samples)
                 text = result["text"].strip()
+                
                 if text:
-                    print(f"[Final]: {text}")
+                    print(f"\n[Chunk]: {text}")
                     full_transcription.append(text)
+                    
+                    current_full_text = " ".join(full_transcription)
+                    try:
+                        pyperclip.copy(current_full_text)
+                    except:
+                        pass
+
+        if ring.available():
+            print("\nProcessant l'últim fragment...")
+            chunk = ring.window().reshape(-1)
+            
+            model = get_model() # Assegurar que tenim model
+            
+            with inference_context(model):
+                result = model.transcribe(chunk, fp16=False, language="ca", condition_on_previous_text=False)
+            ring.consume(len(chunk))
+            text = result["text"].strip()
+            if text:
+                print(f"[Final]: {text}")
+                full_transcription.append(text)
+
+        warning = ring.summary()
+        if warning:
+            print(f"\nAvís: {warning}")
 
     except Exception as e:
         print(f"\nError durant l'enregistrament: {e}")
     finally:
-        if os.path.exists(temp_filename):
-            os.remove(temp_filename)
         if input_thread.is_alive():
             print("Prem ENTER per tancar el programa si s'ha quedat esperant.")
 
     return " ".join(full_transcription)
 
 def main():
+    parser = argparse.ArgumentParser(description="Transcripció en directe amb Whisper")
+    parser.add_argument("--precision", choices=PRECISIONS, default=default_precision(),
+                        help="Precisió de la inferència (per defecte ECHOTEXT_PRECISION o fp32)")
+    args = parser.parse_args()
+
     # 1. Carregar el model Whisper en paral·lel
     model_container = {} 
     
     def load_model_thread():
-        print("Carregant el model Whisper (turbo) en segon pla...")
+        print(f"Carregant el model Whisper (turbo, {args.precision}) en segon pla...")
         start_load = time.time()
         
         try:
+            # Si el dimoni (whisper_daemon.py) està en marxa, s'hi connecta en lloc de carregar-lo
+            daemon = connect("turbo")
+            if daemon is not None:
+                model_container['model'] = daemon
+                print(f"\nConnectat al model Whisper (turbo) del {describe(daemon)}.")
+                return
+
+            import torch
+            from lib.model_loader import load_model
+
             # Intentar netejar la memòria cau de CUDA abans
             if torch.cuda.is_available():
                 torch.cuda.empty_cache()
             
-            model = whisper.load_model("turbo")
+            model = load_model("turbo", precision=args.precision)
             end_load = time.time()
             model_container['model'] = model
             print(f"\nModel Whisper (turbo) carregat correctament en {end_load - start_load:.2f}s.")
@@ -138,7 +145,7 @@ def main():
                 try:
                     if torch.cuda.is_available():
                         torch.cuda.empty_cache()
-                    model = whisper.load_model("small")
+                    model = load_model("small", precision=args.precision)
                     model_container['model'] = model
                     print("\nModel Whisper (small) carregat correctament com a alternativa.")
                 except Exception as e2:
@@ -1,6 +1,7 @@
-import whisper
 import os
 
+from lib.model_daemon import load_model
+
 def transcribe_audio(file_path):
     # Load the base model (you can also use 'tiny', 'small', 'medium', 'large')
     
@@ -8,7 +9,8 @@ def transcribe_audio(file_path):
     #model = whisper.load_model("base")
 
     print("Carregant el model Whisper (turbo)...")
-    model = whisper.load_model("turbo",device="cuda")
+    # Si el dimoni (whisper_daemon.py) està en marxa, s'hi connecta en lloc de carregar-lo
+    model = load_model("turbo", device="cuda")
 
     # Check if file exists
     if not os.path.exists(file_path):